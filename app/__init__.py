@@ -1,25 +1,53 @@
 ﻿from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager
-from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from config import Config
 from flask_swagger_ui import get_swaggerui_blueprint
+from app.utils.engine import RoutingSession, configure_binds, configure_engine_options, init_engine_profile
+from app.utils.hashing import PasswordHasher
+from app.utils.jwt_cache import CachingJWTManager, init_jwt_cache
 
-db = SQLAlchemy()
-jwt = JWTManager()
-bcrypt = Bcrypt()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+jwt = CachingJWTManager()
+password_hasher = PasswordHasher()
 
-def create_app(config_class=Config):
+def create_app(config_class=Config, asgi=False):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
     # Initialize extensions
+    configure_engine_options(app)
+    configure_binds(app)
     db.init_app(app)
+    init_engine_profile(app, db)
     jwt.init_app(app)
-    bcrypt.init_app(app)
+    init_jwt_cache(app)
+    password_hasher.init_app(app)
     CORS(app)
 
+    from app.utils.blocklist import init_blocklist
+    from app.utils.cache import init_response_cache
+    from app.utils.compression import init_compression
+    from app.utils.group_commit import init_group_commit
+    from app.utils.json_provider import init_json_provider
+    from app.utils.metrics import init_metrics
+    from app.utils.profiling import init_profiling
+    from app.utils.query_log import init_query_log
+    from app.utils.rate_limit import init_rate_limit
+    from app.utils.replicas import init_replicas
+    from app.utils.sharding import init_sharding
+    init_profiling(app)
+    init_blocklist(app, jwt)
+    init_response_cache(app)
+    init_group_commit(app)
+    init_replicas(app)
+    init_sharding(app)
+    init_json_provider(app)
+    init_metrics(app, db)
+    init_query_log(app, db)
+    init_rate_limit(app)
+    init_compression(app)
+
     # Register main blueprints
     from app.routes.auth import auth_bp
     from app.routes.todos import todos_bp
@@ -27,9 +55,11 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(todos_bp, url_prefix='/api')
 
-    # Swagger UI
+    # Swagger UI and the OpenAPI document it loads
+    from app.utils.openapi import OPENAPI_PATH, init_openapi
+    init_openapi(app)
     SWAGGER_URL = '/api/docs'
-    API_URL = '/api/swagger.json'
+    API_URL = OPENAPI_PATH
     
     swaggerui_blueprint = get_swaggerui_blueprint(
         SWAGGER_URL,
@@ -40,130 +70,24 @@ def create_app(config_class=Config):
     )
     app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    from app.utils.db_setup import init_db_command
+    from app.utils.replicas import sync_replicas_command
+    from app.utils.serve import serve_command
+    from app.utils.sharding import move_user_command
+    from app.utils.stats import reconcile_stats_command
+    from app.utils.sync import prune_tombstones_command
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(reconcile_stats_command)
+    app.cli.add_command(prune_tombstones_command)
+    app.cli.add_command(serve_command)
+    app.cli.add_command(sync_replicas_command)
+    app.cli.add_command(move_user_command)
 
-    @app.route("/api/swagger.json")
-    def specs():
-        return {
-            "openapi": "3.0.0",
-            "info": {
-                "title": "Todo API",
-                "version": "1.0.0",
-                "description": "A simple Todo API"
-            },
-            "paths": {
-                "/api/register": {
-                    "post": {
-                        "tags": ["Authentication"],
-                        "summary": "Register a new user",
-                        "requestBody": {
-                            "required": True,
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "email": {"type": "string", "format": "email"},
-                                            "password": {"type": "string", "minLength": 6}
-                                        },
-                                        "required": ["email", "password"]
-                                    }
-                                }
-                            }
-                        },
-                        "responses": {
-                            "201": {"description": "User registered successfully"},
-                            "400": {"description": "Invalid input"},
-                            "409": {"description": "Email already registered"}
-                        }
-                    }
-                },
-                "/api/login": {
-                    "post": {
-                        "tags": ["Authentication"],
-                        "summary": "Login to get access token",
-                        "requestBody": {
-                            "required": True,
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "email": {"type": "string", "format": "email"},
-                                            "password": {"type": "string"}
-                                        },
-                                        "required": ["email", "password"]
-                                    }
-                                }
-                            }
-                        },
-                        "responses": {
-                            "200": {
-                                "description": "Login successful",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {
-                                            "type": "object",
-                                            "properties": {
-                                                "access_token": {"type": "string"}
-                                            }
-                                        }
-                                    }
-                                }
-                            },
-                            "401": {"description": "Invalid credentials"}
-                        }
-                    }
-                },
-                "/api/todos": {
-                    "get": {
-                        "tags": ["Todos"],
-                        "summary": "Get all todos for authenticated user",
-                        "security": [{"Bearer": []}],
-                        "responses": {
-                            "200": {"description": "List of todos"},
-                            "401": {"description": "Unauthorized"}
-                        }
-                    },
-                    "post": {
-                        "tags": ["Todos"],
-                        "summary": "Create a new todo",
-                        "security": [{"Bearer": []}],
-                        "requestBody": {
-                            "required": True,
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "title": {"type": "string"},
-                                            "description": {"type": "string"},
-                                            "priority": {"type": "string", "enum": ["low", "medium", "high"]},
-                                            "completed": {"type": "boolean"}
-                                        },
-                                        "required": ["title"]
-                                    }
-                                }
-                            }
-                        },
-                        "responses": {
-                            "201": {"description": "Todo created"},
-                            "401": {"description": "Unauthorized"}
-                        }
-                    }
-                }
-            },
-            "components": {
-                "securitySchemes": {
-                    "Bearer": {
-                        "type": "http",
-                        "scheme": "bearer",
-                        "bearerFormat": "JWT"
-                    }
-                }
-            }
-        }
+    if asgi:
+        # Imported lazily: the async stack is an optional extra
+        from app.asgi import AsyncApp
+        # uvicorn starts its workers from scratch, so each sizes its own pool
+        password_hasher.init_app(app, workers=app.config.get('ASGI_WORKERS', 1))
+        return AsyncApp(app)
 
     return app
\ No newline at end of file
@@ -0,0 +1,423 @@
+"""ASGI serving mode.
+
+The todo and auth endpoints run as coroutines on an async SQLAlchemy engine,
+so a worker keeps serving other requests while one waits on the database or
+on bcrypt. They share the models, validation, query building, ETags and
+response cache with the Flask handlers. Every other route (Swagger, batch,
+export, streamed lists, CORS preflight) is passed through to the Flask app.
+
+    WEB_CONCURRENCY=4 uvicorn asgi:app
+
+Set the worker count through WEB_CONCURRENCY rather than --workers: the app
+reads it too, to give each worker's bcrypt pool its share of the CPUs.
+"""
+import asyncio
+import re
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import create_access_token, decode_token
+from jwt import ExpiredSignatureError, InvalidTokenError
+from sqlalchemy import delete, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+from app import password_hasher
+from app.models.todo import Todo, TodoTombstone
+from app.models.user import User
+from app.routes.auth import validate_credentials
+from app.routes.todos import validate_todo_data
+from app.utils.blocklist import token_revoked
+from app.utils.collection import collection_etag, version_bump_statement, version_statement
+from app.utils.compression import COMPRESSIBLE_STATUSES, compress, negotiate, weaken_etag
+from app.utils.engine import engine_options, install_sqlite_profile
+from app.utils.fast_read import to_dicts, todo_select
+from app.utils.hashing import HasherBusy
+from app.utils.metrics import finish_request_timer, install_query_timer, start_request_timer
+from app.utils.query_log import check_statement_counts, install_query_log, start_statement_counts
+from app.utils.rate_limit import TOO_MANY_REQUESTS, retry_after
+from app.utils.stats import COUNTER_FIELDS, count_deltas, counters, total_count
+from app.utils.todo_query import filter_todos, next_cursor, parse_list_args
+from app.utils.validation import ValidationFailed, error_body
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+
+def async_database_uri(uri):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body, headers=None):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.remote_addr = (scope.get('client') or (None,))[0]
+        self.query_string = scope['query_string'].decode('latin-1')
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.body = body
+
+    @property
+    def full_path(self):
+        # Same shape as Flask's request.full_path so ETags and cache keys match
+        return f'{self.path}?{self.query_string}'
+
+    def get_json(self, json):
+        if not self.body:
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, {'error': 'Invalid JSON body'})
+
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        config = flask_app.config
+        if 'shards' in flask_app.extensions:
+            # The async handlers would read and write the default database only
+            raise ValueError('The ASGI app does not support SQLALCHEMY_SHARD_URIS')
+
+        uri = config.get('ASYNC_DATABASE_URL') or async_database_uri(config['SQLALCHEMY_DATABASE_URI'])
+        profile = config.get('DB_PROFILE_RESOLVED', 'none')
+        self.engine = create_async_engine(uri, **engine_options(config, profile))
+        if profile == 'sqlite':
+            install_sqlite_profile(self.engine.sync_engine, config)
+        # Rows are serialized after commit, outside any greenlet, so keep them loaded
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.metrics = 'metrics' in flask_app.extensions
+        if self.metrics:
+            install_query_timer(self.engine.sync_engine)
+        install_query_log(self.engine.sync_engine, config.get('SLOW_QUERY_MS', 200), config.get('SLOW_QUERY_EXPLAIN', True))
+
+        self.rate_limiter = flask_app.extensions.get('rate_limiter')
+        self.replicas = flask_app.extensions.get('replicas')
+        self.compression = flask_app.extensions.get('compression')
+
+        # (method, path pattern, Flask rule for metric labels, Flask endpoint
+        # for rate limits, handler)
+        todo_rule = '/api/todos/<int:todo_id>'
+        self.routes = [
+            ('POST', re.compile(r'/api/register'), '/api/register', 'auth.register', self.register),
+            ('POST', re.compile(r'/api/login'), '/api/login', 'auth.login', self.login),
+            ('GET', re.compile(r'/api/todos'), '/api/todos', 'todos.get_todos', self.get_todos),
+            ('POST', re.compile(r'/api/todos'), '/api/todos', 'todos.create_todo', self.create_todo),
+            ('GET', re.compile(r'/api/todos/(?P<todo_id>\d+)'), todo_rule, 'todos.get_todo', self.get_todo),
+            ('PUT', re.compile(r'/api/todos/(?P<todo_id>\d+)'), todo_rule, 'todos.update_todo', self.update_todo),
+            ('DELETE', re.compile(r'/api/todos/(?P<todo_id>\d+)'), todo_rule, 'todos.delete_todo', self.delete_todo),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        rule, endpoint, handler, kwargs = self.match(scope)
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        request = Request(scope, await self.read_body(receive))
+        with self.flask_app.app_context():
+            if self.metrics:
+                start_request_timer()
+            start_statement_counts()
+            try:
+                await self.check_rate_limit(endpoint, request)
+                status, body, headers = await handler(request, **kwargs)
+            except HTTPError as e:
+                status, body, headers = e.status, e.body, e.headers
+            except HasherBusy:
+                status, body, headers = 503, {'error': 'Server is busy, please retry'}, {'Retry-After': '1'}
+            check_statement_counts(f'{request.method} {request.path}')
+            if self.metrics:
+                timing = finish_request_timer(request.method, rule, status)
+                if timing and self.flask_app.config.get('METRICS_SERVER_TIMING', False):
+                    headers = dict(headers, **{'Server-Timing': timing})
+            await self.respond(send, request, status, body, headers)
+
+    def match(self, scope):
+        if scope['type'] != 'http':
+            return None, None, None, None
+        # Streamed lists stay on the Flask generator path
+        if scope['path'] == '/api/todos' and b'stream=' in scope['query_string']:
+            return None, None, None, None
+        for method, pattern, rule, endpoint, handler in self.routes:
+            found = pattern.fullmatch(scope['path'])
+            if found and method == scope['method']:
+                return rule, endpoint, handler, {key: int(value) for key, value in found.groupdict().items()}
+        return None, None, None, None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def respond(self, send, request, status, body, headers):
+        if body is None:
+            payload = b''
+        elif isinstance(body, bytes):
+            payload = body
+        else:
+            payload = self.flask_app.json.response(body).get_data()
+
+        headers = dict(headers)
+        if payload:
+            headers.setdefault('Content-Type', 'application/json')
+            payload = self.compress(request, status, payload, headers)
+        headers['Content-Length'] = str(len(payload))
+        if 'origin' in request.headers:
+            headers['Access-Control-Allow-Origin'] = '*'
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    def compress(self, request, status, payload, headers):
+        # Same rules as the Flask hook, for the JSON bodies these handlers send
+        settings = self.compression
+        if settings is None or status not in COMPRESSIBLE_STATUSES or headers['Content-Type'] not in settings.mimetypes:
+            return payload
+        headers['Vary'] = 'Accept-Encoding'
+        encoding = negotiate(request.headers.get('accept-encoding'), settings.encodings)
+        if encoding is None or len(payload) < settings.min_size:
+            return payload
+        headers['Content-Encoding'] = encoding
+        if 'ETag' in headers:
+            headers['ETag'] = weaken_etag(headers['ETag'])
+        return compress(payload, encoding, settings)
+
+    async def authenticate(self, request):
+        header = request.headers.get('authorization', '')
+        if not header.startswith('Bearer '):
+            raise HTTPError(401, {'msg': 'Missing Authorization Header'})
+        try:
+            claims = decode_token(header[len('Bearer '):])
+        except ExpiredSignatureError:
+            raise HTTPError(401, {'msg': 'Token has expired'})
+        except InvalidTokenError as e:
+            raise HTTPError(422, {'msg': str(e)})
+        if claims.get('type') != 'access':
+            raise HTTPError(422, {'msg': 'Only non-refresh tokens are allowed'})
+        # Answered by the Bloom filter without I/O, except for the rare
+        # filter hit or periodic refresh; those reads go to a thread
+        revoked = self.flask_app.extensions['token_blocklist'].revoked_in_memory(claims.get('jti'))
+        if revoked is None:
+            revoked = await asyncio.to_thread(self.token_revoked, claims)
+        if revoked:
+            raise HTTPError(401, {'msg': 'Token has been revoked'})
+        return claims[self.flask_app.config['JWT_IDENTITY_CLAIM']]
+
+    def token_revoked(self, claims):
+        # A fresh app context, so the thread gets its own database session
+        with self.flask_app.app_context():
+            return token_revoked(None, claims)
+
+    async def check_rate_limit(self, endpoint, request):
+        limiter = self.rate_limiter
+        if limiter is None or endpoint not in limiter.limits:
+            return
+        identity = None
+        if limiter.keys_by_user(endpoint):
+            try:
+                identity = await self.authenticate(request)
+            except HTTPError:
+                pass
+        if limiter.blocking:
+            # A shared backend is a network round trip; keep it off the event loop
+            wait = await asyncio.to_thread(limiter.check, endpoint, request.remote_addr, identity)
+        else:
+            wait = limiter.check(endpoint, request.remote_addr, identity)
+        if wait is not None:
+            raise HTTPError(429, TOO_MANY_REQUESTS, {'Retry-After': retry_after(wait)})
+
+    def cache(self):
+        return self.flask_app.extensions['response_cache']
+
+    async def write_session(self, session):
+        # Take SQLite's write lock up front, as Flask write requests do
+        await session.connection(execution_options={'write_transaction': True})
+
+    async def check_version(self, session, request, user_id):
+        """Version, ETag and todo counters; raises the 304 when the client is current."""
+        row = (await session.execute(version_statement(user_id))).first()
+        version = row.todos_version if row else 0
+        etag = collection_etag(user_id, version, request.full_path)
+        if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+            raise HTTPError(304, None, self.etag_headers(etag))
+        return version, etag, counters(row) if row else dict.fromkeys(COUNTER_FIELDS, 0)
+
+    def etag_headers(self, etag):
+        return {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+
+    async def register(self, request):
+        try:
+            email, password = validate_credentials(request.get_json(self.flask_app.json), register=True)
+        except ValidationFailed as e:
+            return 400, error_body(e), {}
+
+        async with self.sessionmaker() as session:
+            await self.write_session(session)
+            if await session.scalar(select(User.id).where(User.email == email)):
+                return 409, {'error': 'Email already registered'}, {}
+            user = User(email=email, password_hash=await password_hasher.hash_async(password))
+            session.add(user)
+            await session.commit()
+
+        return 201, {'message': 'User registered successfully'}, {}
+
+    async def login(self, request):
+        try:
+            email, password = validate_credentials(request.get_json(self.flask_app.json))
+        except ValidationFailed as e:
+            return 400, error_body(e), {}
+
+        async with self.sessionmaker() as session:
+            user = await session.scalar(select(User).where(User.email == email))
+            if not user or not await password_hasher.check_async(user.password_hash, password):
+                return 401, {'error': 'Invalid email or password'}, {}
+
+            # Upgrade hashes made with an outdated work factor while we have the password
+            if password_hasher.needs_rehash(user.password_hash):
+                user.password_hash = await password_hasher.hash_async(password)
+                await session.commit()
+
+        return 200, {'access_token': create_access_token(identity=user.id)}, {}
+
+    async def get_todos(self, request):
+        user_id = await self.authenticate(request)
+        try:
+            params = parse_list_args(request.args)
+        except ValueError as e:
+            return 400, {'error': str(e)}, {}
+
+        async with self.sessionmaker() as session:
+            version, etag, counts = await self.check_version(session, request, user_id)
+            headers = self.etag_headers(etag)
+            total = total_count(counts, params)
+            if total is not None:
+                headers['X-Total-Count'] = str(total)
+
+            key = f'{version}:{request.full_path}'
+            body = self.cache().get(user_id, key)
+            if body is not None:
+                return 200, body, dict(headers, **{'X-Cache': 'HIT'})
+
+            query = filter_todos(todo_select(), user_id, params)
+            if not params['paginate']:
+                body = to_dicts((await session.execute(query)).all())
+            else:
+                rows = (await session.execute(query.limit(params['limit'] + 1))).all()
+                todos, has_more = rows[:params['limit']], len(rows) > params['limit']
+                body = {
+                    'items': to_dicts(todos),
+                    'next_cursor': next_cursor(todos[-1], params) if has_more else None
+                }
+
+        body = self.flask_app.json.response(body).get_data()
+        self.cache().set(user_id, key, body)
+        return 200, body, dict(headers, **{'X-Cache': 'MISS'})
+
+    async def get_todo(self, request, todo_id):
+        user_id = await self.authenticate(request)
+        async with self.sessionmaker() as session:
+            _, etag, _ = await self.check_version(session, request, user_id)
+            rows = (await session.execute(
+                todo_select().filter(Todo.id == todo_id, Todo.user_id == user_id)
+            )).all()
+        if not rows:
+            return 404, {'error': 'Todo not found'}, {}
+        return 200, to_dicts(rows)[0], self.etag_headers(etag)
+
+    def written(self, user_id):
+        # What bump_version does after a Flask write: drop the cached lists
+        # and keep the user's passthrough reads off the replicas for a while
+        self.cache().invalidate(user_id)
+        if self.replicas is not None:
+            self.replicas.mark_write(user_id)
+
+    async def create_todo(self, request):
+        user_id = await self.authenticate(request)
+        try:
+            fields = validate_todo_data(request.get_json(self.flask_app.json))
+        except ValidationFailed as e:
+            return 400, error_body(e), {}
+
+        async with self.sessionmaker() as session:
+            await self.write_session(session)
+            version = await session.scalar(
+                version_bump_statement(user_id, count_deltas(after=(fields['completed'], fields['priority'])))
+            )
+            todo = Todo(user_id=user_id, change_seq=version, **fields)
+            session.add(todo)
+            await session.commit()
+
+        self.written(user_id)
+        return 201, todo.to_dict(), {}
+
+    async def update_todo(self, request, todo_id):
+        user_id = await self.authenticate(request)
+        try:
+            fields = validate_todo_data(request.get_json(self.flask_app.json), partial=True)
+        except ValidationFailed as e:
+            return 400, error_body(e), {}
+
+        async with self.sessionmaker() as session:
+            await self.write_session(session)
+            todo = await session.scalar(select(Todo).where(Todo.id == todo_id, Todo.user_id == user_id))
+            if todo is None:
+                return 404, {'error': 'Todo not found'}, {}
+
+            before = (todo.completed, todo.priority)
+            after = (fields.get('completed', todo.completed), fields.get('priority', todo.priority))
+            todo.change_seq = await session.scalar(version_bump_statement(user_id, count_deltas(before, after)))
+            for key, value in fields.items():
+                setattr(todo, key, value)
+            await session.commit()
+
+        self.written(user_id)
+        return 200, todo.to_dict(), {}
+
+    async def delete_todo(self, request, todo_id):
+        user_id = await self.authenticate(request)
+        async with self.sessionmaker() as session:
+            await self.write_session(session)
+            deleted = (await session.execute(
+                delete(Todo).where(Todo.id == todo_id, Todo.user_id == user_id).returning(Todo.completed, Todo.priority)
+            )).first()
+            if deleted is None:
+                return 404, {'error': 'Todo not found'}, {}
+            version = await session.scalar(version_bump_statement(user_id, count_deltas(before=tuple(deleted))))
+            session.add(TodoTombstone(user_id=user_id, todo_id=todo_id, change_seq=version))
+            await session.commit()
+
+        self.written(user_id)
+        return 204, None, {}
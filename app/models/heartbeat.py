@@ -0,0 +1,8 @@
+﻿from app import db
+
+
+class ReplicaHeartbeat(db.Model):
+    """One row, stamped on the primary; how far a replica's copy trails the
+    primary's is its replication lag."""
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.Float, nullable=False)
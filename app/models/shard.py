@@ -0,0 +1,24 @@
+﻿from app import db
+
+
+class UserDirectory(db.Model):
+    """Kept in the default database when sharding: hands out user ids, unique
+    across shards, and finds a user's id by email."""
+    # AUTOINCREMENT: a user id must never be handed out twice
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+
+    __table_args__ = ({'sqlite_autoincrement': True},)
+
+
+class ShardPlacement(db.Model):
+    """Users moved off the shard the hash ring gives them (`flask move-user`)."""
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.String(32), nullable=False)
+
+
+class IdSequence(db.Model):
+    """Kept in every shard: the next sequence number per id space, for ids
+    that are unique across shards."""
+    name = db.Column(db.String(32), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
@@ -1,6 +1,8 @@
 ﻿from app import db
 from datetime import datetime
 
+PRIORITY_RANKS = {'low': 0, 'medium': 1, 'high': 2}
+
 class Todo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -11,6 +13,20 @@ class Todo(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # The owner's todos_version as of this todo's last write; drives /todos/changes
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Every list query is scoped by user_id; each index ends in id so that
+    # (sort key, id) keyset pagination can seek straight to the next page
+    __table_args__ = (
+        db.Index('ix_todo_user_id_id', user_id, id),
+        db.Index('ix_todo_user_due_date', user_id, due_date, id),
+        db.Index('ix_todo_user_created_at', user_id, created_at, id),
+        db.Index('ix_todo_user_updated_at', user_id, updated_at, id),
+        db.Index('ix_todo_user_completed_due_date', user_id, completed, due_date, id),
+        db.Index('ix_todo_user_priority', user_id, priority, id),
+        db.Index('ix_todo_user_change_seq', user_id, change_seq, id),
+    )
 
     def to_dict(self):
         return {
@@ -23,3 +39,28 @@ class Todo(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+
+
+class TodoTombstone(db.Model):
+    """A deleted todo, kept so /todos/changes can report the delete; pruned
+    after TOMBSTONE_RETENTION_DAYS by `flask prune-tombstones`."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    todo_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_todo_tombstone_user_change_seq', user_id, change_seq, todo_id),
+        db.Index('ix_todo_tombstone_deleted_at', deleted_at),
+    )
+
+
+# Literal (unbound) CASE so that ORDER BY priority_rank matches the indexed expression
+priority_rank = db.case(
+    (Todo.priority == db.literal_column("'low'"), db.literal_column('0')),
+    (Todo.priority == db.literal_column("'medium'"), db.literal_column('1')),
+    (Todo.priority == db.literal_column("'high'"), db.literal_column('2')),
+)
+
+db.Index('ix_todo_user_priority_rank', Todo.user_id, priority_rank, Todo.id)
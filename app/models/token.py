@@ -0,0 +1,17 @@
+﻿from app import db
+from datetime import datetime
+
+class RevokedToken(db.Model):
+    """A JWT revoked before its expiry (logout); deleted once it expires,
+    since the signature check rejects it from then on."""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_revoked_token_expires_at', expires_at),
+        # Workers pick up new revocations by revoked_at
+        db.Index('ix_revoked_token_revoked_at', revoked_at),
+    )
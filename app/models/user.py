@@ -1,4 +1,4 @@
-﻿from app import db, bcrypt
+﻿from app import db, password_hasher
 from datetime import datetime
 
 class User(db.Model):
@@ -6,13 +6,28 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every write to the user's todos; drives list and item ETags
+    todos_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Kept in step with the user's todos by the write paths, in the same
+    # UPDATE as todos_version; `flask reconcile-stats` recomputes them
+    todo_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    low_priority_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    medium_priority_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    high_priority_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Highest todos_version whose tombstones have been pruned; older sync
+    # tokens can no longer learn about every delete
+    tombstone_floor = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     todos = db.relationship('Todo', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def to_dict(self):
         return {
@@ -1,38 +1,37 @@
-﻿from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token
+﻿from flask import Blueprint, jsonify
+from flask_jwt_extended import create_access_token, get_jwt, jwt_required
 from app.models.user import User
 from app import db
-import re
+from app.utils.blocklist import revoke_token
+from app.utils.hashing import HasherBusy
+from app.utils.sharding import new_user_id, user_by_email
+from app.utils.validation import compiled_schema, validate_json
 
 auth_bp = Blueprint('auth', __name__)
 
-def is_valid_email(email):
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+@auth_bp.errorhandler(HasherBusy)
+def hasher_busy(error):
+    # Shed load instead of letting logins queue up behind each other
+    response = jsonify({'error': 'Server is busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
-@auth_bp.route('/register', methods=['POST'])
-def register():
-    data = request.get_json()
-    
-    if not data or not data.get('email') or not data.get('password'):
-        return jsonify({'error': 'Email and password are required'}), 400
-
-    email = data.get('email')
-    password = data.get('password')
+def validate_credentials(data, register=False):
+    """Return (email, password) from a register or login payload; raises
+    ValidationFailed on invalid input."""
+    data = compiled_schema('UserSchema' if register else 'LoginSchema').load(data)
+    return data['email'], data['password']
 
-    # Validate email format
-    if not is_valid_email(email):
-        return jsonify({'error': 'Invalid email format'}), 400
-
-    # Validate password length
-    if len(password) < 6:
-        return jsonify({'error': 'Password must be at least 6 characters long'}), 400
+@auth_bp.route('/register', methods=['POST'])
+@validate_json('UserSchema')
+def register(data):
+    email, password = data['email'], data['password']
 
     # Check if user already exists
-    if User.query.filter_by(email=email).first():
+    if user_by_email(email):
         return jsonify({'error': 'Email already registered'}), 409
 
-    user = User()
+    user = User(id=new_user_id(email))
     user.email = email
     user.set_password(password)
 
@@ -42,16 +41,26 @@ def register():
     return jsonify({'message': 'User registered successfully'}), 201
 
 @auth_bp.route('/login', methods=['POST'])
-def login():
-    data = request.get_json()
+@validate_json('LoginSchema')
+def login(data):
+    email, password = data['email'], data['password']
 
-    if not data or not data.get('email') or not data.get('password'):
-        return jsonify({'error': 'Email and password are required'}), 400
+    user = user_by_email(email)
 
-    user = User.query.filter_by(email=data['email']).first()
-
-    if not user or not user.check_password(data['password']):
+    if not user or not user.check_password(password):
         return jsonify({'error': 'Invalid email or password'}), 401
 
+    # Upgrade hashes made with an outdated work factor while we have the password
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+
     access_token = create_access_token(identity=user.id)
-    return jsonify({'access_token': access_token}), 200
\ No newline at end of file
+    return jsonify({'access_token': access_token}), 200
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    revoke_token(get_jwt())
+    db.session.commit()
+    return jsonify({'message': 'Logged out'}), 200
@@ -1,92 +1,286 @@
-﻿from flask import Blueprint, request, jsonify
+﻿from flask import Blueprint, abort, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.todo import Todo
+from app.models.todo import Todo, TodoTombstone
 from app import db
-from datetime import datetime
+from sqlalchemy import delete, insert, select, update
+from app.utils.cache import cached_response
+from app.utils.collection import bump_version, conditional_get
+from app.utils.fast_read import base_query, fetch, to_dicts
+from app.utils.group_commit import WriterBusy, run_write
+from app.utils.pagination import keyset_page
+from app.utils.replicas import replica_read
+from app.utils.search import parse_search_args, search_cursor, search_query
+from app.utils.sharding import assign_todo_ids
+from app.utils.stats import count_deltas, total_count_header, user_stats
+from app.utils.streaming import stream_json_array
+from app.utils.sync import SyncExpired, sync_response
+from app.utils.todo_query import filter_todos, next_cursor, parse_list_args
+from app.utils.validation import compiled_schema, validate_json
 
 todos_bp = Blueprint('todos', __name__)
 
-VALID_PRIORITIES = ['low', 'medium', 'high']
+MAX_BATCH_OPERATIONS = 500
+BATCH_OPS = ('create', 'update', 'delete')
+
+@todos_bp.errorhandler(WriterBusy)
+def writer_busy(error):
+    response = jsonify({'error': 'Server is busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 @todos_bp.route('/todos', methods=['GET'])
 @jwt_required()
+@replica_read
+@conditional_get
+@total_count_header
+@cached_response
 def get_todos():
     user_id = get_jwt_identity()
-    todos = Todo.query.filter_by(user_id=user_id).all()
-    return jsonify([todo.to_dict() for todo in todos])
 
-@todos_bp.route('/todos', methods=['POST'])
+    try:
+        params = parse_list_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = filter_todos(base_query(), user_id, params)
+
+    # Without paging parameters keep returning the plain list
+    if not params['paginate']:
+        if params['stream']:
+            return stream_json_array(query)
+        return jsonify(to_dicts(fetch(query)))
+
+    todos, has_more = keyset_page(query, params['limit'], fetch)
+    return jsonify({
+        'items': to_dicts(todos),
+        'next_cursor': next_cursor(todos[-1], params) if has_more else None
+    })
+
+def validate_todo_data(data, partial=False):
+    """Check a create (or, with partial=True, update) payload against
+    TodoSchema; returns the fields to write, raises ValidationFailed."""
+    return compiled_schema('TodoSchema').load(data, partial)
+
+@todos_bp.route('/todos/export', methods=['GET'])
 @jwt_required()
-def create_todo():
+@conditional_get
+def export_todos():
     user_id = get_jwt_identity()
-    data = request.get_json()
-    
-    if not data or not data.get('title'):
-        return jsonify({'error': 'Title is required'}), 400
-
-    # Validate priority if provided
-    if 'priority' in data and data['priority'] not in VALID_PRIORITIES:
-        return jsonify({'error': f'Priority must be one of: {", ".join(VALID_PRIORITIES)}'}), 400
-        
-    new_todo = Todo(
-        title=data.get('title'),
-        description=data.get('description', ''),
-        completed=data.get('completed', False),
-        priority=data.get('priority', 'medium'),
-        user_id=user_id
-    )
-    
-    if data.get('due_date'):
-        try:
-            new_todo.due_date = datetime.fromisoformat(data['due_date'])
-        except ValueError:
-            return jsonify({'error': 'Invalid date format'}), 400
-    
+
+    try:
+        params = parse_list_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if params['paginate']:
+        return jsonify({'error': 'Export does not take limit or cursor'}), 400
+
+    response = stream_json_array(filter_todos(base_query(), user_id, params))
+    response.headers['Content-Disposition'] = 'attachment; filename="todos.json"'
+    return response
+
+@todos_bp.route('/todos/stats', methods=['GET'])
+@jwt_required()
+@replica_read
+def todo_stats():
+    return jsonify(user_stats(get_jwt_identity()))
+
+@todos_bp.route('/todos/changes', methods=['GET'])
+@jwt_required()
+def todo_changes():
+    try:
+        return jsonify(sync_response(get_jwt_identity(), request.args))
+    except SyncExpired as e:
+        return jsonify({'error': str(e)}), 410
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@todos_bp.route('/todos/search', methods=['GET'])
+@jwt_required()
+@replica_read
+@conditional_get
+@cached_response
+def search_todos():
+    user_id = get_jwt_identity()
+
+    try:
+        params = parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = search_query(db.engine.dialect.name, user_id, params)
+    rows, has_more = keyset_page(query, params['limit'], fetch)
+    # Drop the trailing rank column before serializing
+    return jsonify({
+        'items': to_dicts([row[:-1] for row in rows]),
+        'next_cursor': search_cursor(rows[-1]) if has_more else None
+    })
+
+def _create_todo(user_id, data):
+    version = bump_version(user_id, count_deltas(after=(data['completed'], data['priority'])))
+    new_todo = Todo(user_id=user_id, change_seq=version, **data)
     db.session.add(new_todo)
-    db.session.commit()
-    
-    return jsonify(new_todo.to_dict()), 201
+    db.session.flush()
+    return new_todo.to_dict()
+
+@todos_bp.route('/todos', methods=['POST'])
+@jwt_required()
+@validate_json('TodoSchema')
+def create_todo(data):
+    return jsonify(run_write(_create_todo, get_jwt_identity(), data)), 201
 
 @todos_bp.route('/todos/<int:todo_id>', methods=['GET'])
 @jwt_required()
+@replica_read
+@conditional_get
 def get_todo(todo_id):
     user_id = get_jwt_identity()
+    todos = fetch(base_query().filter(Todo.id == todo_id, Todo.user_id == user_id))
+    if not todos:
+        abort(404)
+    return jsonify(to_dicts(todos)[0])
+
+def _update_todo(user_id, todo_id, data):
     todo = Todo.query.filter_by(id=todo_id, user_id=user_id).first_or_404()
-    return jsonify(todo.to_dict())
+
+    before = (todo.completed, todo.priority)
+    after = (data.get('completed', todo.completed), data.get('priority', todo.priority))
+    todo.change_seq = bump_version(user_id, count_deltas(before, after))
+    for key, value in data.items():
+        setattr(todo, key, value)
+    db.session.flush()
+    return todo.to_dict()
 
 @todos_bp.route('/todos/<int:todo_id>', methods=['PUT'])
 @jwt_required()
-def update_todo(todo_id):
-    user_id = get_jwt_identity()
-    todo = Todo.query.filter_by(id=todo_id, user_id=user_id).first_or_404()
-    data = request.get_json()
+@validate_json('TodoSchema', partial=True)
+def update_todo(todo_id, data):
+    return jsonify(run_write(_update_todo, get_jwt_identity(), todo_id, data))
 
-    # Validate priority if provided
-    if 'priority' in data and data['priority'] not in VALID_PRIORITIES:
-        return jsonify({'error': f'Priority must be one of: {", ".join(VALID_PRIORITIES)}'}), 400
-    
-    if 'title' in data:
-        todo.title = data['title']
-    if 'description' in data:
-        todo.description = data['description']
-    if 'completed' in data:
-        todo.completed = data['completed']
-    if 'priority' in data:
-        todo.priority = data['priority']
-    if 'due_date' in data:
-        try:
-            todo.due_date = datetime.fromisoformat(data['due_date'])
-        except ValueError:
-            return jsonify({'error': 'Invalid date format'}), 400
-    
-    db.session.commit()
-    return jsonify(todo.to_dict())
+def _delete_todo(user_id, todo_id):
+    todo = Todo.query.filter_by(id=todo_id, user_id=user_id).first_or_404()
+    version = bump_version(user_id, count_deltas(before=(todo.completed, todo.priority)))
+    db.session.delete(todo)
+    db.session.add(TodoTombstone(user_id=user_id, todo_id=todo_id, change_seq=version))
 
 @todos_bp.route('/todos/<int:todo_id>', methods=['DELETE'])
 @jwt_required()
 def delete_todo(todo_id):
+    run_write(_delete_todo, get_jwt_identity(), todo_id)
+    return '', 204
+
+def _validate_batch(operations, user_id):
+    """Validate every operation up front; returns (plan, errors, current) where
+    errors maps operation index to an (status, message) pair and current maps
+    each updated or deleted id to its stored (completed, priority)."""
+    plan = []
+    errors = {}
+    seen_ids = set()
+
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPS:
+            errors[index] = (400, f'op must be one of: {", ".join(BATCH_OPS)}')
+            plan.append(None)
+            continue
+
+        op = operation['op']
+        todo_id = operation.get('id')
+        if op != 'create':
+            if not isinstance(todo_id, int) or isinstance(todo_id, bool):
+                errors[index] = (400, 'id must be an integer')
+                plan.append(None)
+                continue
+            if todo_id in seen_ids:
+                errors[index] = (400, f'Todo {todo_id} appears in more than one operation')
+                plan.append(None)
+                continue
+            seen_ids.add(todo_id)
+
+        fields = None
+        if op != 'delete':
+            try:
+                fields = validate_todo_data(operation.get('data'), partial=(op == 'update'))
+            except ValueError as e:
+                errors[index] = (400, str(e))
+        plan.append((op, todo_id, fields))
+
+    # One query checks ownership for every update and delete
+    current = {}
+    if seen_ids:
+        current = {row.id: (row.completed, row.priority) for row in db.session.execute(
+            select(Todo.id, Todo.completed, Todo.priority).where(Todo.user_id == user_id, Todo.id.in_(seen_ids))
+        )}
+        for index, step in enumerate(plan):
+            if step and step[0] != 'create' and step[1] not in current and index not in errors:
+                errors[index] = (404, f'Todo {step[1]} not found')
+
+    return plan, errors, current
+
+@todos_bp.route('/todos/batch', methods=['POST'])
+@jwt_required()
+def batch_todos():
     user_id = get_jwt_identity()
-    todo = Todo.query.filter_by(id=todo_id, user_id=user_id).first_or_404()
-    db.session.delete(todo)
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'error': f'A batch may contain at most {MAX_BATCH_OPERATIONS} operations'}), 400
+
+    plan, errors, current = _validate_batch(operations, user_id)
+    if errors:
+        results = []
+        for index, step in enumerate(plan):
+            if index in errors:
+                status, message = errors[index]
+                results.append({'status': status, 'error': message})
+            else:
+                results.append({'status': None})
+        return jsonify({'error': 'Batch rejected, no operations were applied', 'results': results}), 400
+
+    deltas = {}
+    for op, todo_id, fields in plan:
+        if op == 'create':
+            count_deltas(after=(fields['completed'], fields['priority']), deltas=deltas)
+        elif op == 'update':
+            completed, priority = current[todo_id]
+            after = (fields.get('completed', completed), fields.get('priority', priority))
+            count_deltas(current[todo_id], after, deltas=deltas)
+        else:
+            count_deltas(before=current[todo_id], deltas=deltas)
+
+    # Bulk statements, one transaction, one commit; the version bump comes
+    # first so every row can carry the new version as its change_seq
+    version = bump_version(user_id, deltas)
+    creates = assign_todo_ids([dict(fields, user_id=user_id, change_seq=version) for op, _, fields in plan if op == 'create'])
+    updates = [dict(fields, id=todo_id, change_seq=version) for op, todo_id, fields in plan if op == 'update' and fields]
+    deletes = [todo_id for op, todo_id, _ in plan if op == 'delete']
+
+    created_ids = []
+    if creates:
+        created_ids = list(db.session.scalars(insert(Todo).returning(Todo.id, sort_by_parameter_order=True), creates))
+    if updates:
+        db.session.execute(update(Todo), updates)
+    if deletes:
+        db.session.execute(delete(Todo).where(Todo.user_id == user_id, Todo.id.in_(deletes)))
+        db.session.execute(insert(TodoTombstone), [
+            {'user_id': user_id, 'todo_id': todo_id, 'change_seq': version} for todo_id in deletes
+        ])
     db.session.commit()
-    return '', 204
\ No newline at end of file
+
+    written_ids = created_ids + [todo_id for op, todo_id, _ in plan if op == 'update']
+    todos = {}
+    if written_ids:
+        todos = {todo.id: todo for todo in Todo.query.filter(Todo.id.in_(written_ids))}
+
+    created = iter(created_ids)
+    results = []
+    for op, todo_id, _ in plan:
+        if op == 'create':
+            results.append({'status': 201, 'todo': todos[next(created)].to_dict()})
+        elif op == 'update':
+            results.append({'status': 200, 'todo': todos[todo_id].to_dict()})
+        else:
+            results.append({'status': 204})
+
+    return jsonify({'results': results})
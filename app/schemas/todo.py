@@ -1,12 +1,12 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 
 class TodoSchema(Schema):
     id = fields.Int(dump_only=True)
-    title = fields.Str(required=True)
-    description = fields.Str()
-    completed = fields.Bool()
-    due_date = fields.DateTime(allow_none=True)
-    priority = fields.Str(validate=lambda x: x in ['low', 'medium', 'high'])
+    title = fields.Str(required=True, validate=validate.Length(min=1))
+    description = fields.Str(load_default='')
+    completed = fields.Bool(load_default=False)
+    due_date = fields.DateTime(allow_none=True, load_default=None)
+    priority = fields.Str(validate=validate.OneOf(['low', 'medium', 'high']), load_default='medium')
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
     user_id = fields.Int(dump_only=True)
\ No newline at end of file
@@ -1,9 +1,9 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 
 class UserSchema(Schema):
     id = fields.Int(dump_only=True)
     email = fields.Email(required=True)
-    password = fields.Str(required=True, load_only=True)
+    password = fields.Str(required=True, load_only=True, validate=validate.Length(min=6))
     created_at = fields.DateTime(dump_only=True)
 
 class LoginSchema(Schema):
@@ -17,4 +17,6 @@ class MessageSchema(Schema):
     message = fields.Str()
 
 class ErrorSchema(Schema):
-    error = fields.Str()
\ No newline at end of file
+    error = fields.Str()
+    # Validation failures only: messages per field, '_schema' for the body
+    errors = fields.Dict(keys=fields.Str(), values=fields.List(fields.Str()))
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""Revoked JWTs (POST /api/logout), screened by a Bloom filter.
+
+Revocations are stored in revoked_token. Each process keeps a Bloom filter
+of their jtis: a token that is not in the filter is certainly not revoked
+and passes without a query; only filter hits, true or false, are looked
+up. The filter picks up revocations made by other workers every
+JWT_BLOCKLIST_REFRESH_SECONDS, so elsewhere a revoked token may still be
+accepted for that long; the worker that revoked it refuses it at once.
+
+A refresh reads revocations stamped since the newest one it has seen, less
+JWT_BLOCKLIST_OVERLAP_SECONDS: a revocation becomes visible when its
+transaction commits, which on a server database can be after later ones,
+and the workers' clocks may disagree. Neither may exceed the overlap.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, select
+from app import db
+from app.models.token import RevokedToken
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about error_rate false
+    positives while it holds at most capacity keys."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class TokenBlocklist:
+    def __init__(self, capacity=100000, error_rate=0.001, refresh_interval=5, overlap=60, clock=time.monotonic):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.clock = clock
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.lookups = 0
+        self._last_revoked_at = None
+        self._next_refresh = None
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        if jti is None:
+            return False
+        self.refresh()
+        if jti not in self.bloom:
+            return False
+        self.lookups += 1
+        return db.session.execute(select(RevokedToken.id).where(RevokedToken.jti == jti)).first() is not None
+
+    def revoked_in_memory(self, jti):
+        """is_revoked() when the filter alone can answer: False for a miss
+        between refreshes, None when the answer needs the database."""
+        if jti is None:
+            return False
+        if self._next_refresh is None or self.clock() >= self._next_refresh or jti in self.bloom:
+            return None
+        return False
+
+    def refresh(self):
+        """Add revocations stored since the last refresh, at most once per
+        refresh_interval; rebuilds the filter once it is over capacity."""
+        now = self.clock()
+        with self._lock:
+            if self._next_refresh is not None and now < self._next_refresh:
+                return
+            self._next_refresh = now + self.refresh_interval
+            last_revoked_at = self._last_revoked_at
+            rebuild = self.bloom.count > self.capacity
+
+        query = select(RevokedToken.jti, RevokedToken.revoked_at).order_by(RevokedToken.revoked_at)
+        if rebuild:
+            # Expired tokens fail their signature check; leave them out
+            query = query.where(RevokedToken.expires_at > datetime.utcnow())
+        elif last_revoked_at is not None:
+            query = query.where(RevokedToken.revoked_at > last_revoked_at - self.overlap)
+        rows = db.session.execute(query).all()
+
+        with self._lock:
+            if rebuild:
+                self.bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+            for row in rows:
+                # The overlap reads recent rows again; count each jti once
+                if row.jti not in self.bloom:
+                    self.bloom.add(row.jti)
+            if rows and (self._last_revoked_at is None or rows[-1].revoked_at > self._last_revoked_at):
+                self._last_revoked_at = rows[-1].revoked_at
+
+    def revoke(self, jti, user_id, expires_at):
+        """Store the revocation in the session (the caller commits) and add it
+        to this process's filter."""
+        db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow()))
+        db.session.add(RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at))
+        with self._lock:
+            self.bloom.add(jti)
+
+
+def token_revoked(jwt_header, jwt_payload):
+    return current_app.extensions['token_blocklist'].is_revoked(jwt_payload.get('jti'))
+
+
+def revoke_token(claims):
+    expires_at = datetime.utcfromtimestamp(claims['exp']) if 'exp' in claims else datetime.max
+    current_app.extensions['token_blocklist'].revoke(claims['jti'], claims['sub'], expires_at)
+
+
+def init_blocklist(app, jwt):
+    blocklist = TokenBlocklist(
+        app.config.get('JWT_BLOCKLIST_CAPACITY', 100000),
+        app.config.get('JWT_BLOCKLIST_ERROR_RATE', 0.001),
+        app.config.get('JWT_BLOCKLIST_REFRESH_SECONDS', 5),
+        app.config.get('JWT_BLOCKLIST_OVERLAP_SECONDS', 60),
+    )
+    app.extensions['token_blocklist'] = blocklist
+    jwt.token_in_blocklist_loader(token_revoked)
+    return blocklist
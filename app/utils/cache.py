@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+
+class LocalCache:
+    """In-process LRU of encoded responses, bounded by entry count, with TTL.
+
+    Entries are grouped by user so a write can drop exactly that user's
+    entries. Suitable for a single worker process.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    self._remove((user_id, key))
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, key))
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, key, value):
+        with self._lock:
+            self._entries[(user_id, key)] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end((user_id, key))
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._entries.pop((user_id, key), None)
+
+    def stats(self):
+        return {'backend': 'local', 'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def _remove(self, entry_key):
+        self._entries.pop(entry_key, None)
+        user_id, key = entry_key
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+
+class RedisCache:
+    """Shared cache for multi-worker deployments.
+
+    Each user's entries live in one Redis hash, so invalidation is a single
+    DEL. The hash expires ttl seconds after its last write; overall size is
+    bounded by the server's maxmemory with an LRU eviction policy.
+    """
+
+    def __init__(self, client, ttl=300, prefix='todos:cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, key):
+        value = self.client.hget(f'{self.prefix}{user_id}', key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, user_id, key, value):
+        name = f'{self.prefix}{user_id}'
+        pipe = self.client.pipeline()
+        pipe.hset(name, key, value)
+        pipe.expire(name, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, user_id):
+        self.client.delete(f'{self.prefix}{user_id}')
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+
+class NullCache:
+    hits = 0
+    misses = 0
+
+    def get(self, user_id, key):
+        return None
+
+    def set(self, user_id, key, value):
+        pass
+
+    def invalidate(self, user_id):
+        pass
+
+    def stats(self):
+        return {'backend': 'none', 'hits': 0, 'misses': 0}
+
+
+class InMemoryRedis:
+    """Local stand-in for the subset of redis-py that RedisCache and
+    RedisBuckets use."""
+
+    # Python versions of the Lua scripts callers register, by source; each
+    # is called as function(client, keys, args) and runs atomically
+    scripts = {}
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._hashes = {}
+        self._expires = {}
+        # Reentrant: a script calls the other methods while holding it
+        self._lock = threading.RLock()
+
+    def _live(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= self.clock():
+            self._hashes.pop(name, None)
+            self._expires.pop(name, None)
+        return self._hashes.get(name)
+
+    def hget(self, name, key):
+        with self._lock:
+            return (self._live(name) or {}).get(key)
+
+    def hset(self, name, key, value):
+        with self._lock:
+            self._hashes.setdefault(name, {})[key] = value
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if name in self._hashes:
+                self._expires[name] = self.clock() + seconds
+
+    def pexpire(self, name, milliseconds):
+        self.expire(name, milliseconds / 1000)
+
+    def delete(self, name):
+        with self._lock:
+            self._hashes.pop(name, None)
+            self._expires.pop(name, None)
+
+    def register_script(self, source):
+        function = self.scripts[source]
+
+        def run(keys=(), args=()):
+            with self._lock:
+                return function(self, keys, args)
+        return run
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+def init_response_cache(app):
+    backend = app.config.get('RESPONSE_CACHE_BACKEND', 'local')
+    ttl = app.config.get('RESPONSE_CACHE_TTL', 300)
+
+    if backend == 'local':
+        cache = LocalCache(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024), ttl)
+    elif backend == 'redis':
+        import redis
+        cache = RedisCache(redis.Redis.from_url(app.config['RESPONSE_CACHE_URL']), ttl)
+    elif backend == 'memory':
+        cache = RedisCache(InMemoryRedis(), ttl)
+    elif backend == 'none':
+        cache = NullCache()
+    else:
+        raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {backend}')
+
+    app.extensions['response_cache'] = cache
+    return cache
+
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
+
+
+def cached_response(view):
+    """Serve the view's encoded 200 body from the response cache.
+
+    Must sit below conditional_get, which stores the collection version in
+    g.todos_version. The version is part of the key, so an entry can never
+    outlive the data it was built from.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = get_jwt_identity()
+        cache = get_response_cache()
+        key = f'{g.todos_version}:{request.full_path}'
+
+        body = cache.get(user_id, key)
+        if body is not None:
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        # Streamed bodies are never buffered, so they are never cached
+        if response.status_code == 200 and not response.is_streamed:
+            cache.set(user_id, key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
@@ -0,0 +1,73 @@
+import hashlib
+from functools import wraps
+from flask import current_app, g, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select, update
+from app import db
+from app.models.user import User
+from app.utils.cache import get_response_cache
+from app.utils.replicas import mark_write
+from app.utils.stats import COUNTER_FIELDS, counter_values, counters
+
+
+def version_bump_statement(user_id, deltas=None):
+    # The new version is the change_seq of every todo the write touches
+    return update(User).where(User.id == user_id).values(
+        todos_version=User.todos_version + 1, **counter_values(deltas or {})
+    ).returning(User.todos_version)
+
+
+def version_statement(user_id):
+    # Primary key lookup, never touches the todo table. The counters come
+    # along for X-Total-Count; the version stays the first column.
+    return select(User.todos_version, *(getattr(User, field) for field in COUNTER_FIELDS)).where(User.id == user_id)
+
+
+def bump_version(user_id, deltas=None):
+    """Mark the user's todo collection as changed and apply count_deltas()
+    to its counters; call inside the write's transaction, before writing
+    the todos, and stamp them with the returned version.
+
+    The UPDATE locks the user's row until commit, so versions are handed
+    out in commit order."""
+    version = db.session.scalar(version_bump_statement(user_id, deltas))
+    get_response_cache().invalidate(user_id)
+    mark_write(user_id)
+    return version
+
+
+def load_collection_state(user_id):
+    """Store the collection version and todo counters in g from one lookup."""
+    row = db.session.execute(version_statement(user_id)).first()
+    g.todos_version = row.todos_version if row else 0
+    g.todo_counts = counters(row) if row else dict.fromkeys(COUNTER_FIELDS, 0)
+    return g.todos_version
+
+
+def collection_etag(user_id, version, full_path):
+    # The full path (including the query string) identifies the representation
+    key = f'{user_id}:{version}:{full_path}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def conditional_get(view):
+    """Answer If-None-Match with 304 from the collection version alone, and tag
+    fresh 200 responses with a strong ETag. The comparison is weak, so the
+    weakened tag of a compressed response matches too."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = get_jwt_identity()
+        load_collection_state(user_id)
+        etag = collection_etag(user_id, g.todos_version, request.full_path)
+
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
@@ -0,0 +1,159 @@
+"""Response compression negotiated from Accept-Encoding.
+
+JSON responses of at least COMPRESSION_MIN_SIZE bytes are gzipped (or
+brotli-compressed when the brotli package is installed and the client
+prefers it); smaller ones, like a single todo, cost more CPU than they
+save. Streamed lists are compressed chunk by chunk, each chunk flushed so
+the client can decode it as soon as it arrives.
+
+Compressed responses carry a weak ETag, since their bytes differ from the
+identity body the tag was computed for; If-None-Match compares weakly, so
+either form of the tag still gets its 304.
+"""
+import zlib
+from collections import namedtuple
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_STATUSES = (200, 201)
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+Compression = namedtuple('Compression', 'encodings level brotli_quality min_size mimetypes')
+
+
+class GzipStream:
+    def __init__(self, level):
+        # wbits=31: gzip container, with a fixed header instead of the mtime
+        # gzip.compress() would write
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def available_encodings():
+    # Preferred first: the server's order breaks ties in client quality
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding, encodings):
+    """The encoding to use for an Accept-Encoding value, or None for identity."""
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(encodings)
+
+
+def stream_for(encoding, settings):
+    if encoding == 'br':
+        return BrotliStream(settings.brotli_quality)
+    return GzipStream(settings.level)
+
+
+def compress(data, encoding, settings):
+    stream = stream_for(encoding, settings)
+    return stream.compress(data) + stream.finish()
+
+
+def compress_chunks(chunks, encoding, settings):
+    stream = stream_for(encoding, settings)
+    try:
+        for chunk in chunks:
+            data = stream.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        # Lets stream_with_context tear down its request context
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def weaken_etag(etag):
+    """'"abc"' -> 'W/"abc"'; weak tags are left alone."""
+    if etag and not etag.startswith('W/'):
+        return f'W/{etag}'
+    return etag
+
+
+class PrecompressedBody:
+    """An immutable body compressed once per encoding, at the highest level,
+    since the cost is paid a single time."""
+
+    def __init__(self, body):
+        self.body = body
+        self._variants = {}
+        self._settings = Compression(None, STATIC_GZIP_LEVEL, STATIC_BROTLI_QUALITY, 0, ())
+
+    def get(self, encoding):
+        if encoding is None:
+            return self.body
+        if encoding not in self._variants:
+            self._variants[encoding] = compress(self.body, encoding, self._settings)
+        return self._variants[encoding]
+
+
+def compression_settings(config):
+    return Compression(
+        encodings=available_encodings(),
+        level=config.get('COMPRESSION_LEVEL', 6),
+        brotli_quality=config.get('COMPRESSION_BROTLI_QUALITY', 4),
+        min_size=config.get('COMPRESSION_MIN_SIZE', 1024),
+        mimetypes=tuple(config.get('COMPRESSION_MIMETYPES', ('application/json',))),
+    )
+
+
+def init_compression(app):
+    """Compress eligible responses. Flask runs after_request hooks in reverse
+    order of registration, so registering this last, after init_metrics,
+    makes it the first to run: the metrics and profiling hooks then time the
+    compression too. It still sees the final ETag and cache headers, which
+    the views and their decorators set, not the hooks; the hooks that run
+    after it only add Server-Timing and X-Profile-Id."""
+    if not app.config.get('COMPRESSION_ENABLED', True):
+        return None
+    settings = compression_settings(app.config)
+    app.extensions['compression'] = settings
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code not in COMPRESSIBLE_STATUSES or response.direct_passthrough
+                or response.mimetype not in settings.mimetypes or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not response.is_streamed and len(response.get_data()) < settings.min_size:
+            return response
+        encoding = negotiate(request.headers.get('Accept-Encoding'), settings.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_chunks(response.response, encoding, settings)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(response.get_data(), encoding, settings))
+        response.headers['Content-Encoding'] = encoding
+        if 'ETag' in response.headers:
+            response.headers['ETag'] = weaken_etag(response.headers['ETag'])
+        return response
+
+    return settings
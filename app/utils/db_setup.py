@@ -0,0 +1,78 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from app import db
+
+
+def upgrade_tables(engine, tables):
+    """Add the columns and indexes that tables created by an older version
+    are missing; returns the (table, column) pairs added.
+
+    create_all only creates missing tables. Every column added since the
+    first release has a server default, so ADD COLUMN fills existing rows.
+    """
+    added = []
+    with engine.begin() as connection:
+        existing_tables = set(inspect(connection).get_table_names())
+        for table in tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} ADD COLUMN {ddl}')
+                    added.append((table.name, column.name))
+            # IF NOT EXISTS: expression indexes cannot be reflected to check first
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+    return added
+
+
+def backfill_counters(added):
+    """Recompute the per-user counters if upgrade_tables just added them;
+    runs on the selected shard, if any."""
+    from app.utils.stats import COUNTER_FIELDS, reconcile_stats
+    if any(table == 'user' and column in COUNTER_FIELDS for table, column in added):
+        reconcile_stats()
+
+
+def create_schema(app):
+    """Create missing tables, columns and indexes and the full-text index.
+    Idempotent; run it on deploy (`flask init-db`), not on every worker boot."""
+    from app.utils.search import init_search
+    from app.utils.sharding import seed_id_sequences, sharded_tables, using_shard
+    with app.app_context():
+        shards = app.extensions.get('shards')
+        if shards is None:
+            added = upgrade_tables(db.engine, db.metadata.sorted_tables)
+            db.create_all()
+            backfill_counters(added)
+            engines = [db.engine]
+        else:
+            # Directory tables in the default database, per-user tables in each shard
+            sharded = sharded_tables()
+            directory = [table for table in db.metadata.sorted_tables if table not in sharded]
+            upgrade_tables(db.engine, directory)
+            db.metadata.create_all(db.engine, tables=directory)
+            engines = [db.engines[name] for name in shards.names]
+            for name, engine in zip(shards.names, engines):
+                added = upgrade_tables(engine, sharded)
+                db.metadata.create_all(engine, tables=sharded)
+                with engine.begin() as connection:
+                    seed_id_sequences(connection)
+                with using_shard(name):
+                    backfill_counters(added)
+                db.session.remove()
+    for engine in engines:
+        init_search(app, db, engine)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the database tables and search index."""
+    create_schema(current_app._get_current_object())
+    click.echo('Database schema is up to date')
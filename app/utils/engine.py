@@ -0,0 +1,141 @@
+from contextvars import ContextVar
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+REPLICA_BIND_PREFIX = 'replica_'
+SHARD_BIND_PREFIX = 'shard_'
+
+# The bind key of the replica the current read view runs on; set by
+# app.utils.replicas.replica_read
+read_bind = ContextVar('read_bind', default=None)
+
+
+class RoutingSession(Session):
+    """Sends every statement to the replica in read_bind while one is set,
+    and, with sharding on, statements on sharded tables to the current
+    user's shard (app.utils.sharding)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            name = read_bind.get()
+            if name is None:
+                shards = current_app.extensions.get('shards')
+                name = shards.bind_for(mapper, clause) if shards is not None else None
+            if name is not None:
+                return self._db.engines[name]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def bind_names(prefix, uris):
+    return [f'{prefix}{index}' for index in range(len(uris or ()))]
+
+
+def replica_bind_names(config):
+    return bind_names(REPLICA_BIND_PREFIX, config.get('SQLALCHEMY_REPLICA_URIS'))
+
+
+def shard_bind_names(config):
+    return bind_names(SHARD_BIND_PREFIX, config.get('SQLALCHEMY_SHARD_URIS'))
+
+
+def configure_binds(app):
+    """Add a bind per SQLALCHEMY_REPLICA_URIS and SQLALCHEMY_SHARD_URIS
+    entry; call before db.init_app."""
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for names, uris in [(replica_bind_names(app.config), app.config.get('SQLALCHEMY_REPLICA_URIS')),
+                        (shard_bind_names(app.config), app.config.get('SQLALCHEMY_SHARD_URIS'))]:
+        binds.update(zip(names, uris or ()))
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def resolve_profile(config):
+    """Pick the engine profile: DB_PROFILE, or 'auto' to go by the URI."""
+    profile = config.get('DB_PROFILE', 'auto')
+    if profile == 'auto':
+        backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        profile = 'sqlite' if backend == 'sqlite' else 'server'
+    if profile not in ('sqlite', 'server', 'none'):
+        raise ValueError(f'Unknown DB_PROFILE: {profile}')
+    return profile
+
+
+def engine_options(config, profile):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+
+    if profile == 'sqlite':
+        # The driver-level timeout is SQLite's busy handler
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args.setdefault('timeout', config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000)
+        connect_args.setdefault('check_same_thread', False)
+        options['connect_args'] = connect_args
+    elif profile == 'server':
+        options.setdefault('pool_size', config.get('DB_POOL_SIZE', 5))
+        options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 10))
+        options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 30))
+        options.setdefault('pool_recycle', config.get('DB_POOL_RECYCLE', 1800))
+        options.setdefault('pool_pre_ping', config.get('DB_POOL_PRE_PING', True))
+
+    return options
+
+
+def configure_engine_options(app):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS for the profile; call before db.init_app."""
+    profile = resolve_profile(app.config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, profile)
+    app.config['DB_PROFILE_RESOLVED'] = profile
+    return profile
+
+
+def sqlite_pragmas(config):
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('mmap_size', config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # Negative values are KiB rather than pages
+        ('cache_size', -config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def install_sqlite_profile(engine, config):
+    """Apply the pragmas on every new connection and take the write lock up
+    front for write requests.
+
+    A deferred BEGIN that reads and then writes has to upgrade its lock, and
+    SQLite fails that upgrade immediately with "database is locked" when
+    another writer got there first; the busy timeout never applies. Opening
+    write requests with BEGIN IMMEDIATE makes them wait their turn instead.
+    """
+    pragmas = sqlite_pragmas(config)
+    immediate_writes = config.get('SQLITE_BEGIN_IMMEDIATE_FOR_WRITES', True)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+        # Let SQLAlchemy, not the driver, decide when transactions begin
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        # Callers outside a Flask request (the ASGI handlers) say so explicitly
+        write = connection.get_execution_options().get('write_transaction')
+        if write is None:
+            write = has_request_context() and request.method not in READ_METHODS
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if immediate_writes and write else 'BEGIN')
+
+
+def init_engine_profile(app, db):
+    """Hook the profile's per-connection setup into every engine; call after db.init_app."""
+    if app.config.get('DB_PROFILE_RESOLVED') != 'sqlite':
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                install_sqlite_profile(engine, app.config)
@@ -0,0 +1,61 @@
+from flask import current_app
+from sqlalchemy import Select, select
+from app import db
+from app.models.todo import Todo
+
+# Same keys, in the same order, as Todo.to_dict()
+TODO_FIELDS = ('id', 'title', 'description', 'completed', 'due_date', 'priority', 'created_at', 'updated_at')
+TODO_COLUMNS = tuple(getattr(Todo, field) for field in TODO_FIELDS)
+
+
+def todo_select():
+    """Column-tuple select for the read fast path; feed it to filter_todos()."""
+    return select(*TODO_COLUMNS)
+
+
+def base_query():
+    if current_app.config.get('READ_FAST_PATH', True):
+        return todo_select()
+    return Todo.query
+
+
+def fetch(query):
+    # Core rows skip ORM hydration and identity-map bookkeeping entirely
+    if isinstance(query, Select):
+        return db.session.connection().execute(query).all()
+    return query.all()
+
+
+def fetch_chunks(query, chunk_size):
+    """Like fetch(), but yields lists of at most chunk_size rows from a
+    server-side cursor where the driver has one."""
+    if isinstance(query, Select):
+        result = db.session.connection().execute(query.execution_options(yield_per=chunk_size))
+    else:
+        result = db.session.execute(query.statement.execution_options(yield_per=chunk_size)).scalars()
+    return result.partitions()
+
+
+def row_to_dict(row):
+    todo_id, title, description, completed, due_date, priority, created_at, updated_at = row
+    return {
+        'id': todo_id,
+        'title': title,
+        'description': description,
+        'completed': completed,
+        'due_date': due_date.isoformat() if due_date else None,
+        'priority': priority,
+        'created_at': created_at.isoformat(),
+        'updated_at': updated_at.isoformat()
+    }
+
+
+def to_dicts(todos):
+    """Serialize what fetch() returned into Todo.to_dict()-shaped dicts."""
+    if not todos or isinstance(todos[0], Todo):
+        return [todo.to_dict() for todo in todos]
+    # orjson writes naive datetimes exactly as isoformat() does, so the rows
+    # can go to it as they are
+    if getattr(current_app.json, 'native_datetimes', False):
+        return [dict(zip(TODO_FIELDS, row)) for row in todos]
+    return [row_to_dict(row) for row in todos]
@@ -0,0 +1,149 @@
+"""Group commit: one writer thread per process applies queued writes in
+shared transactions.
+
+SQLite takes one writer at a time. With every request committing its own
+transaction, concurrent writers spend their time in the busy handler,
+which sleeps and retries, and each commit hands the lock on separately.
+With WRITE_QUEUE_ENABLED, write requests instead queue their mutation (a
+function that changes db.session and returns the response body) and wait.
+The writer takes whatever has queued, up to WRITE_QUEUE_BATCH_SIZE,
+waiting up to WRITE_QUEUE_MAX_WAIT_MS for more, and applies it in one
+transaction with one commit. Each mutation runs in its own savepoint, so
+one that raises (a 404, say) is rolled back alone and its caller gets the
+exception; the others still commit. A failed commit fails the whole batch.
+
+A mutation's result is handed back only once its batch has committed. At
+most WRITE_QUEUE_MAX_PENDING mutations wait at once, and callers give up
+after WRITE_QUEUE_TIMEOUT seconds if theirs has not started; both raise
+WriterBusy.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from flask import current_app
+from app import db
+
+
+class WriterBusy(Exception):
+    """The write queue is full, or a queued write did not start in time."""
+
+
+class GroupCommitWriter:
+    def __init__(self, app, batch_size=64, max_wait=0.0, max_pending=1024, timeout=30.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); returns a Future for its result."""
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args))
+        except queue.Full:
+            raise WriterBusy()
+        return future
+
+    def run(self, fn, *args):
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise WriterBusy()
+            # Already being applied; its outcome is the caller's to report
+            return future.result()
+
+    def _ensure_started(self):
+        # Started lazily, and again after a fork: threads do not survive one
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self.app.app_context():
+                self._apply(batch)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _apply(self, batch):
+        # Cancelled while queued: the caller has already given up on it
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            db.session.connection(execution_options={'write_transaction': True})
+            for future, fn, args in batch:
+                try:
+                    with db.session.begin_nested():
+                        outcomes.append((future, fn(*args), None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for future, _, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.session.remove()
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def run_write(fn, *args):
+    """Apply fn(*args), which writes through db.session, and commit it;
+    returns what fn returns. Goes through the group-commit writer when it
+    is enabled, so fn must not rely on the request context."""
+    writer = current_app.extensions.get('group_commit')
+    if writer is None:
+        result = fn(*args)
+        db.session.commit()
+        return result
+    # Under SQLite a write request's first read already took the write lock
+    # (BEGIN IMMEDIATE); release it, or the writer waits on this request
+    db.session.close()
+    return writer.run(fn, *args)
+
+
+def init_group_commit(app):
+    if not app.config.get('WRITE_QUEUE_ENABLED', False):
+        return None
+    writer = GroupCommitWriter(
+        app,
+        batch_size=app.config.get('WRITE_QUEUE_BATCH_SIZE', 64),
+        max_wait=app.config.get('WRITE_QUEUE_MAX_WAIT_MS', 0) / 1000,
+        max_pending=app.config.get('WRITE_QUEUE_MAX_PENDING', 1024),
+        timeout=app.config.get('WRITE_QUEUE_TIMEOUT', 30),
+    )
+    app.extensions['group_commit'] = writer
+    return writer
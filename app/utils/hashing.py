@@ -0,0 +1,154 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from contextlib import contextmanager
+import bcrypt
+
+# bcrypt only looks at the first 72 bytes; older bcrypt releases truncated
+# silently, newer ones raise, so truncate explicitly to keep old hashes valid
+MAX_PASSWORD_BYTES = 72
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing when every pool slot is taken."""
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    return bcrypt.checkpw(_encode(password), password_hash.encode('utf-8'))
+
+
+def hash_cost(password_hash):
+    # $2b$12$<salt+digest>
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def default_pool_size(workers=1, cpu_count=None):
+    """Each of workers processes gets an equal share of the CPUs, so their
+    pools together run at most one bcrypt process per CPU."""
+    return max(1, (cpu_count or os.cpu_count() or 1) // workers)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool so logins don't pin the worker.
+
+    At most pool_size hashes run at once and max_pending more may wait; any
+    further call raises HasherBusy. A pool_size of 0 hashes inline; None
+    (PASSWORD_HASH_POOL_SIZE unset) shares the CPUs between the workers
+    serving the app.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.pool_size = 0
+        self.max_pending = 0
+        self.timeout = None
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(1)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, workers=1):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.pool_size = app.config.get('PASSWORD_HASH_POOL_SIZE', 0)
+        if self.pool_size is None:
+            self.pool_size = default_pool_size(workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 0)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT')
+        self._slots = threading.BoundedSemaphore(max(self.pool_size, 1) + self.max_pending)
+        self.shutdown()
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(_check, password_hash, password)
+
+    async def hash_async(self, password):
+        return await self._run_async(_hash, password, self.rounds)
+
+    async def check_async(self, password_hash, password):
+        if not password_hash:
+            return False
+        return await self._run_async(_check, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return hash_cost(password_hash) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self, fn, *args):
+        if self.pool_size <= 0:
+            with self._inline_slot():
+                return fn(*args)
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HasherBusy()
+
+    async def _run_async(self, fn, *args):
+        # Same slots as _run, but the event loop keeps serving while bcrypt runs
+        loop = asyncio.get_running_loop()
+        if self.pool_size <= 0:
+            with self._inline_slot():
+                return await loop.run_in_executor(None, fn, *args)
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except (TimeoutError, asyncio.TimeoutError):
+            future.cancel()
+            raise HasherBusy()
+
+    @contextmanager
+    def _inline_slot(self):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _submit(self, fn, *args):
+        """Submit fn to the pool, holding a slot until the job is done: a
+        caller that timed out leaves its job queued or running, and only a
+        queued one can be cancelled."""
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _get_executor(self):
+        # Created lazily, and again after a fork, so each worker owns its pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+                self._pid = os.getpid()
+            return self._executor
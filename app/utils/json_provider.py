@@ -0,0 +1,57 @@
+import decimal
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(obj):
+    # Same fallbacks as Flask's default provider for types orjson lacks
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, encoding straight to bytes.
+
+    Keys are sorted like Flask's default provider. Unlike it, non-ASCII text
+    is emitted as UTF-8 rather than \\u escapes, and datetimes are written in
+    ISO 8601 (datetime.isoformat()) rather than HTTP date format.
+    """
+
+    # Callers may hand over datetime objects instead of isoformat() strings
+    native_datetimes = True
+    mimetype = 'application/json'
+    option = orjson.OPT_SORT_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self.option | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    """Install the provider named by JSON_PROVIDER ('auto', 'orjson' or
+    'default'); 'auto' uses orjson when it is installed."""
+    name = app.config.get('JSON_PROVIDER', 'auto')
+
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_PROVIDER is 'orjson' but orjson is not installed")
+    if name in ('auto', 'orjson') and orjson is not None:
+        app.json = OrjsonProvider(app)
+    elif name in ('auto', 'default'):
+        app.json = DefaultJSONProvider(app)
+    else:
+        raise ValueError(f'Unknown JSON_PROVIDER: {name}')
+    return app.json
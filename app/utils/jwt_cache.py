@@ -0,0 +1,89 @@
+"""Verified JWT claims cached per token.
+
+A client sends the same token on every request until it expires; with the
+cache, repeats skip the signature check and claim parsing until the
+token's exp. The cache is an LRU bounded by JWT_CACHE_SIZE entries and
+keyed by a digest of the token, so tokens themselves are not kept.
+Flask-JWT-Extended checks the blocklist after decoding, so revoked tokens
+are refused whether or not their claims came from the cache.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask_jwt_extended import JWTManager
+
+
+class VerifiedTokenCache:
+    """LRU of verified claims by token digest; entries lapse at the token's exp."""
+
+    def __init__(self, max_entries=10000, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Callers may annotate the claims they get
+        return dict(entry[1])
+
+    def set(self, token, claims):
+        expires = claims.get('exp', math.inf)
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (expires, dict(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# There is no public hook around decoding, so CachingJWTManager overrides a
+# private method; the version is pinned, and a release without the method
+# fails here instead of silently bypassing the cache
+if not hasattr(JWTManager, '_decode_jwt_from_config'):
+    raise ImportError('CachingJWTManager needs flask-jwt-extended 4.6 (JWTManager._decode_jwt_from_config)')
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that serves verified claims from the app's token cache."""
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        cache = current_app.extensions.get('jwt_cache')
+        # CSRF values differ per request and expired tokens are never cached
+        if cache is None or csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        claims = cache.get(encoded_token)
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token)
+            cache.set(encoded_token, claims)
+        return claims
+
+
+def init_jwt_cache(app):
+    size = app.config.get('JWT_CACHE_SIZE', 10000)
+    if not size:
+        return None
+    cache = VerifiedTokenCache(size)
+    app.extensions['jwt_cache'] = cache
+    return cache
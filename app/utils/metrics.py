@@ -0,0 +1,195 @@
+"""Request metrics: per-route latency, status counts, SQL statements and DB
+time per request, reported in Prometheus text format on METRICS_PATH (and,
+with METRICS_SERVER_TIMING, in a Server-Timing header), which also carries the response cache's hit and miss
+counts. METRICS_PATH is served only to requests sending
+`Authorization: Bearer <METRICS_TOKEN>` (Prometheus' `authorization`
+scrape setting), and not at all while METRICS_TOKEN is unset.
+
+Metrics live in process memory; with several gunicorn workers each one
+reports its own numbers, so scrape every worker or run one per container.
+"""
+import hmac
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from flask import abort, current_app, jsonify, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RequestMetrics:
+    HISTOGRAMS = (
+        ('http_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS),
+        ('db_queries_per_request', 'SQL statements executed per request by route.', QUERY_COUNT_BUCKETS),
+        ('db_time_seconds_per_request', 'Time spent in SQL statements per request by route.', LATENCY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+        self.statuses = defaultdict(int)
+
+    def observe(self, method, route, status, seconds, queries, db_seconds):
+        key = (method, route)
+        values = (seconds, queries, db_seconds)
+        with self.lock:
+            for (name, _, buckets), value in zip(self.HISTOGRAMS, values):
+                histograms = self.histograms[name]
+                if key not in histograms:
+                    histograms[key] = Histogram(buckets)
+                histograms[key].observe(value)
+            self.statuses[(method, route, status)] += 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, help_text, _ in self.HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (method, route), histogram in sorted(self.histograms[name].items()):
+                    lines.extend(histogram.samples(name, f'method="{method}",route="{route}"'))
+            lines.append('# HELP http_requests_total Requests by route and status code.')
+            lines.append('# TYPE http_requests_total counter')
+            for (method, route, status), count in sorted(self.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def render_cache_stats(stats):
+    """Prometheus lines for the response cache's hit and miss counters."""
+    labels = f'backend="{stats["backend"]}"'
+    lines = [
+        '# HELP response_cache_hits_total Response cache lookups served from the cache.',
+        '# TYPE response_cache_hits_total counter',
+        f'response_cache_hits_total{{{labels}}} {stats["hits"]}',
+        '# HELP response_cache_misses_total Response cache lookups that ran the view.',
+        '# TYPE response_cache_misses_total counter',
+        f'response_cache_misses_total{{{labels}}} {stats["misses"]}',
+    ]
+    if 'entries' in stats:
+        lines += [
+            '# HELP response_cache_entries Responses held in this process\'s cache.',
+            '# TYPE response_cache_entries gauge',
+            f'response_cache_entries{{{labels}}} {stats["entries"]}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    __slots__ = ('start', 'query_start', 'queries', 'db_seconds')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_start = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# A context variable rather than flask.g: the engine events run for every
+# statement, and going through g's proxy there costs more than the timing
+_current_timer = ContextVar('request_timer', default=None)
+
+
+def start_request_timer():
+    _current_timer.set(RequestTimer())
+
+
+def finish_request_timer(method, route, status):
+    """Record the request in the registry; returns the Server-Timing value,
+    or None when the request was never started."""
+    timer = _current_timer.get()
+    if timer is None:
+        return None
+    _current_timer.set(None)
+    seconds = time.perf_counter() - timer.start
+    current_app.extensions['metrics'].observe(method, route, status, seconds, timer.queries, timer.db_seconds)
+    return (f'db;dur={timer.db_seconds * 1000:.2f};desc="{timer.queries} queries", '
+            f'app;dur={(seconds - timer.db_seconds) * 1000:.2f}, total;dur={seconds * 1000:.2f}')
+
+
+def install_query_timer(engine):
+    """Count statements and time spent in them against the current request."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timer = _current_timer.get()
+        if timer is not None:
+            timer.query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # A request runs its statements one at a time, so one start slot is enough
+        timer = _current_timer.get()
+        if timer is not None:
+            timer.queries += 1
+            timer.db_seconds += time.perf_counter() - timer.query_start
+
+
+def request_route():
+    # The rule, not the path, so ids do not explode the label set
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_metrics(app, db):
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+
+    metrics = RequestMetrics()
+    app.extensions['metrics'] = metrics
+    with app.app_context():
+        for engine in db.engines.values():
+            install_query_timer(engine)
+
+    @app.before_request
+    def before_request():
+        start_request_timer()
+
+    @app.after_request
+    def after_request(response):
+        # Streamed bodies are timed up to their first byte
+        timing = finish_request_timer(request.method, request_route(), response.status_code)
+        if timing and app.config.get('METRICS_SERVER_TIMING', False):
+            response.headers['Server-Timing'] = timing
+        return response
+
+    @app.route(app.config.get('METRICS_PATH', '/metrics'), endpoint='metrics')
+    def metrics_view():
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Missing or invalid metrics token'}), 403
+        body = metrics.render()
+        cache = app.extensions.get('response_cache')
+        if cache is not None:
+            body += render_cache_stats(cache.stats())
+        return app.response_class(body, content_type=CONTENT_TYPE)
+
+    return metrics
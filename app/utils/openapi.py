@@ -0,0 +1,350 @@
+"""The OpenAPI document for /api/swagger.json.
+
+Component schemas are generated from the marshmallow schemas in
+app/schemas; the paths below refer to them. The document is serialized
+once per app, on the first request for it, and served as fixed bytes with
+an ETag, so it costs nothing at startup and almost nothing per request.
+Compressed variants are likewise built once per encoding and kept.
+marshmallow is only imported then too; importing it takes longer than the
+rest of create_app.
+"""
+import hashlib
+import json
+from flask import request
+from app.utils.compression import PrecompressedBody, negotiate
+
+OPENAPI_PATH = '/api/swagger.json'
+CACHE_MAX_AGE = 3600
+
+PRIORITY_ENUM = ['low', 'medium', 'high']
+SORT_ENUM = [
+    'id', 'due_date', 'priority', 'created_at', 'updated_at',
+    '-id', '-due_date', '-priority', '-created_at', '-updated_at'
+]
+
+# Most specific first: Email is a String, Integer a Number
+FIELD_TYPES = (
+    ('Email', {'type': 'string', 'format': 'email'}),
+    ('DateTime', {'type': 'string', 'format': 'date-time'}),
+    ('Integer', {'type': 'integer'}),
+    ('Number', {'type': 'number'}),
+    ('Boolean', {'type': 'boolean'}),
+    ('String', {'type': 'string'}),
+    ('Dict', {'type': 'object'}),
+)
+
+
+def ref(name):
+    return {'$ref': f'#/components/schemas/{name}'}
+
+
+def json_body(name, required=True):
+    return {'required': required, 'content': {'application/json': {'schema': ref(name)}}}
+
+
+def json_response(description, name):
+    return {'description': description, 'content': {'application/json': {'schema': ref(name)}}}
+
+
+def field_schema(field):
+    from marshmallow import fields, missing, validate
+    schema = next((dict(spec) for name, spec in FIELD_TYPES if isinstance(field, getattr(fields, name))), {})
+    if field.dump_only:
+        schema['readOnly'] = True
+    if field.load_only:
+        schema['writeOnly'] = True
+    if field.allow_none:
+        schema['nullable'] = True
+    if field.load_default is not missing and not callable(field.load_default):
+        schema['default'] = field.load_default
+    for validator in field.validators:
+        if isinstance(validator, validate.OneOf):
+            schema['enum'] = list(validator.choices)
+        elif isinstance(validator, validate.Length):
+            if validator.min is not None:
+                schema['minLength'] = validator.min
+            if validator.max is not None:
+                schema['maxLength'] = validator.max
+    return schema
+
+
+def schema_component(schema):
+    component = {
+        'type': 'object',
+        'properties': {name: field_schema(field) for name, field in schema.fields.items()},
+    }
+    required = [name for name, field in schema.fields.items() if field.required]
+    if required:
+        component['required'] = required
+    return component
+
+
+def components():
+    from app.schemas import ErrorSchema, LoginSchema, MessageSchema, TodoSchema, TokenSchema, UserSchema
+    schemas = {
+        'Todo': TodoSchema(),
+        'User': UserSchema(),
+        'Login': LoginSchema(),
+        'Token': TokenSchema(),
+        'Message': MessageSchema(),
+        'Error': ErrorSchema(),
+    }
+    return {name: schema_component(schema) for name, schema in schemas.items()}
+
+
+def paths():
+    error = json_response('Invalid input', 'Error')
+    unauthorized = {'description': 'Unauthorized'}
+    list_filters = [
+        {'name': 'completed', 'in': 'query', 'schema': {'type': 'boolean'}},
+        {'name': 'priority', 'in': 'query', 'schema': {'type': 'string', 'enum': PRIORITY_ENUM}},
+        {'name': 'due_before', 'in': 'query', 'schema': {'type': 'string', 'format': 'date-time'}},
+        {'name': 'due_after', 'in': 'query', 'schema': {'type': 'string', 'format': 'date-time'}},
+        {'name': 'sort', 'in': 'query', 'schema': {'type': 'string', 'enum': SORT_ENUM}}
+    ]
+    return {
+        '/api/register': {
+            'post': {
+                'tags': ['Authentication'],
+                'summary': 'Register a new user',
+                'requestBody': json_body('User'),
+                'responses': {
+                    '201': json_response('User registered successfully', 'Message'),
+                    '400': error,
+                    '409': json_response('Email already registered', 'Error')
+                }
+            }
+        },
+        '/api/login': {
+            'post': {
+                'tags': ['Authentication'],
+                'summary': 'Login to get access token',
+                'requestBody': json_body('Login'),
+                'responses': {
+                    '200': json_response('Login successful', 'Token'),
+                    '401': json_response('Invalid credentials', 'Error')
+                }
+            }
+        },
+        '/api/logout': {
+            'post': {
+                'tags': ['Authentication'],
+                'summary': 'Revoke the access token used for this request',
+                'security': [{'Bearer': []}],
+                'responses': {
+                    '200': json_response('Token revoked', 'Message'),
+                    '401': unauthorized
+                }
+            }
+        },
+        '/api/todos': {
+            'get': {
+                'tags': ['Todos'],
+                'summary': 'Get all todos for authenticated user',
+                'security': [{'Bearer': []}],
+                'parameters': [
+                    {'name': 'limit', 'in': 'query', 'schema': {'type': 'integer', 'minimum': 1, 'maximum': 500}},
+                    {'name': 'cursor', 'in': 'query', 'schema': {'type': 'string'}},
+                    *list_filters
+                ],
+                'responses': {
+                    '200': {
+                        'description': 'List of todos, or a page with next_cursor when limit or cursor is given',
+                        'headers': {'X-Total-Count': {
+                            'description': 'Todos matching the filters across all pages; omitted for due date filters and completed+priority together',
+                            'schema': {'type': 'integer'}
+                        }},
+                        'content': {'application/json': {'schema': {'type': 'array', 'items': ref('Todo')}}}
+                    },
+                    '400': json_response('Invalid filter, sort, limit or cursor', 'Error'),
+                    '401': unauthorized
+                }
+            },
+            'post': {
+                'tags': ['Todos'],
+                'summary': 'Create a new todo',
+                'security': [{'Bearer': []}],
+                'requestBody': json_body('Todo'),
+                'responses': {
+                    '201': json_response('Todo created', 'Todo'),
+                    '400': error,
+                    '401': unauthorized
+                }
+            }
+        },
+        '/api/todos/export': {
+            'get': {
+                'tags': ['Todos'],
+                'summary': 'Download every matching todo as one JSON array',
+                'description': 'Streamed in chunks as it is read, so any number of todos can be exported. '
+                               'Takes the list filters and sort, but not limit or cursor.',
+                'security': [{'Bearer': []}],
+                'parameters': list_filters,
+                'responses': {
+                    '200': {
+                        'description': 'All matching todos, sent as an attachment with chunked transfer encoding',
+                        'headers': {'Content-Disposition': {
+                            'description': 'attachment; filename="todos.json"',
+                            'schema': {'type': 'string'}
+                        }},
+                        'content': {'application/json': {'schema': {'type': 'array', 'items': ref('Todo')}}}
+                    },
+                    '304': {'description': 'Not modified since the ETag in If-None-Match'},
+                    '400': json_response('Invalid filter or sort, or a limit or cursor given', 'Error'),
+                    '401': unauthorized
+                }
+            }
+        },
+        '/api/todos/stats': {
+            'get': {
+                'tags': ['Todos'],
+                'summary': 'Counts of total, completed, active, overdue and per-priority todos',
+                'security': [{'Bearer': []}],
+                'responses': {
+                    '200': {'description': 'Todo counts'},
+                    '401': unauthorized
+                }
+            }
+        },
+        '/api/todos/changes': {
+            'get': {
+                'tags': ['Todos'],
+                'summary': 'Todos created, updated or deleted since a sync token',
+                'description': 'Apply deleted before items. Call again with next_since while has_more is true, '
+                               'and keep the last next_since for the next sync.',
+                'security': [{'Bearer': []}],
+                'parameters': [
+                    {'name': 'since', 'in': 'query', 'schema': {'type': 'string'},
+                     'description': 'next_since from the previous call; omit for a full sync'},
+                    {'name': 'limit', 'in': 'query', 'schema': {'type': 'integer', 'minimum': 1, 'maximum': 500}}
+                ],
+                'responses': {
+                    '200': {'description': 'Changed todos, deleted ids, next_since and has_more'},
+                    '400': json_response('Invalid since token or limit', 'Error'),
+                    '401': unauthorized,
+                    '410': json_response('Token older than the tombstone retention; sync again without since', 'Error')
+                }
+            }
+        },
+        '/api/todos/search': {
+            'get': {
+                'tags': ['Todos'],
+                'summary': 'Full-text search over titles and descriptions, best matches first',
+                'security': [{'Bearer': []}],
+                'parameters': [
+                    {'name': 'q', 'in': 'query', 'required': True, 'schema': {'type': 'string'},
+                     'description': 'Words that must all match; end a word with * to match it as a prefix'},
+                    {'name': 'limit', 'in': 'query', 'schema': {'type': 'integer', 'minimum': 1, 'maximum': 500}},
+                    {'name': 'cursor', 'in': 'query', 'schema': {'type': 'string'}}
+                ],
+                'responses': {
+                    '200': {'description': 'A page of matching todos with next_cursor'},
+                    '400': json_response('Missing query, invalid limit or cursor', 'Error'),
+                    '401': unauthorized
+                }
+            }
+        },
+        '/api/todos/batch': {
+            'post': {
+                'tags': ['Todos'],
+                'summary': 'Create, update and delete many todos in one transaction',
+                'security': [{'Bearer': []}],
+                'requestBody': {
+                    'required': True,
+                    'content': {
+                        'application/json': {
+                            'schema': {
+                                'type': 'object',
+                                'properties': {
+                                    'operations': {
+                                        'type': 'array',
+                                        'maxItems': 500,
+                                        'items': {
+                                            'type': 'object',
+                                            'properties': {
+                                                'op': {'type': 'string', 'enum': ['create', 'update', 'delete']},
+                                                'id': {'type': 'integer'},
+                                                'data': ref('Todo')
+                                            },
+                                            'required': ['op']
+                                        }
+                                    }
+                                },
+                                'required': ['operations']
+                            }
+                        }
+                    }
+                },
+                'responses': {
+                    '200': {'description': 'All operations applied; one result per operation'},
+                    '400': {'description': 'Batch rejected; nothing was applied'},
+                    '401': unauthorized
+                }
+            }
+        }
+    }
+
+
+def build_spec():
+    return {
+        'openapi': '3.0.0',
+        'info': {
+            'title': 'Todo API',
+            'version': '1.0.0',
+            'description': 'A simple Todo API'
+        },
+        'paths': paths(),
+        'components': {
+            'schemas': components(),
+            'securitySchemes': {
+                'Bearer': {
+                    'type': 'http',
+                    'scheme': 'bearer',
+                    'bearerFormat': 'JWT'
+                }
+            }
+        }
+    }
+
+
+class OpenAPIDocument:
+    """The serialized document and its ETag, built on first use."""
+
+    def __init__(self):
+        self.body = None
+        self.etag = None
+        self.compressed = None
+
+    def load(self):
+        if self.body is None:
+            body = json.dumps(build_spec(), separators=(',', ':')).encode()
+            self.etag = hashlib.sha1(body).hexdigest()
+            self.compressed = PrecompressedBody(body)
+            self.body = body
+        return self.body, self.etag
+
+
+def init_openapi(app):
+    document = OpenAPIDocument()
+    app.extensions['openapi'] = document
+
+    @app.route(OPENAPI_PATH, endpoint='specs')
+    def specs():
+        body, etag = document.load()
+        compression = app.extensions.get('compression')
+        encoding = None
+        if compression and len(body) >= compression.min_size:
+            encoding = negotiate(request.headers.get('Accept-Encoding'), compression.encodings)
+
+        response = app.response_class(document.compressed.get(encoding), mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            # Fixed bytes per encoding, so each variant gets its own strong tag
+            response.headers['Content-Encoding'] = encoding
+            etag = f'{etag}-{encoding}'
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_MAX_AGE
+        return response.make_conditional(request)
+
+    return document
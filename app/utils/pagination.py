@@ -0,0 +1,65 @@
+import base64
+import json
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_key, value, last_id):
+    payload = json.dumps([sort_key, value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor, sort_key, valid_value=None):
+    """The (value, last_id) a cursor points at; valid_value, if given, is a
+    predicate the decoded sort value must satisfy."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if key != sort_key or not is_int(last_id):
+        raise InvalidCursor('Cursor does not match the requested sort order')
+    if valid_value is not None and not valid_value(value):
+        raise InvalidCursor('Invalid cursor')
+    return value, last_id
+
+
+def parse_limit(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('Limit must be an integer')
+    if limit < 1:
+        raise ValueError('Limit must be a positive integer')
+    return min(limit, maximum)
+
+
+def keyset_after(column, id_column, value, last_id, descending=False):
+    # NULLs sort as the smallest value, matching SQLite's index order
+    if descending:
+        if value is None:
+            return and_(column.is_(None), id_column < last_id)
+        return or_(column < value, and_(column == value, id_column < last_id), column.is_(None))
+
+    if value is None:
+        return or_(and_(column.is_(None), id_column > last_id), column.isnot(None))
+    return or_(column > value, and_(column == value, id_column > last_id))
+
+
+def keyset_page(query, limit, fetch=lambda query: query.all()):
+    # Fetch one extra row to learn whether another page exists
+    rows = fetch(query.limit(limit + 1))
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,203 @@
+"""On-demand profiling of single requests.
+
+With PROFILING_ENABLED set, a request is profiled when it carries an
+X-Profile header equal to PROFILING_TOKEN, or at random for a
+PROFILING_SAMPLE_RATE fraction of requests. PROFILING_PROFILER picks
+cProfile ('cprofile', every call, slows the request down several times) or
+a stack sampler ('sampling', a snapshot of the request's thread every
+PROFILING_INTERVAL_MS, cheap enough to leave on for a sample of traffic).
+
+Each profile is written to PROFILING_DIR (default instance/profiles) as
+<time>-<method>-<route>-<request id>.prof (pstats) or .folded (collapsed
+stacks, for flamegraph.pl or speedscope); only the newest
+PROFILING_MAX_DUMPS are kept. Profiled responses name their dump in
+X-Profile-Id. PROFILING_PATH lists the dumps and serves them, to requests
+sending the token in X-Profile-Token.
+
+With PROFILING_ENABLED off nothing is registered. Streamed bodies are
+profiled up to their first byte.
+"""
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import abort, g, jsonify, request, send_from_directory
+from app.utils.metrics import request_route
+
+REQUEST_ID = re.compile(r'[A-Za-z0-9-]{1,64}')
+# What dump_name() produces; anything else in the directory is not ours
+DUMP_NAME = re.compile(r'(\d{15})-([A-Z]+)-(\w+)-([A-Za-z0-9-]{1,64})(\.prof|\.folded)')
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+
+    def enable(self):
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+        self._sampler.start()
+
+    def disable(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def make_profiler(kind, interval):
+    if kind == 'sampling':
+        return StackSampler(interval), '.folded'
+    return cProfile.Profile(), '.prof'
+
+
+def dump_name(method, route, request_id, suffix, now=None):
+    # Milliseconds first, zero padded, so names sort oldest first
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    return f'{int((now or time.time()) * 1000):015d}-{method}-{slug}-{request_id}{suffix}'
+
+
+def list_dumps(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if DUMP_NAME.fullmatch(name))
+
+
+def trim_dumps(directory, keep):
+    """Delete all but the newest keep dumps; other workers may be trimming
+    the same directory, so files already gone are skipped."""
+    names = list_dumps(directory)
+    for name in names[:max(0, len(names) - keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def dump_info(directory, name):
+    """A dump's listing entry; None if another worker has just trimmed it."""
+    # Route slugs have no '-', request ids may
+    stamp, method, route, request_id, _ = DUMP_NAME.fullmatch(name).groups()
+    try:
+        size = os.path.getsize(os.path.join(directory, name))
+    except FileNotFoundError:
+        return None
+    return {
+        'name': name,
+        'method': method,
+        'route': route,
+        'request_id': request_id,
+        'created_at': int(stamp) / 1000,
+        'size': size,
+    }
+
+
+def has_token(value, token):
+    return bool(token) and value is not None and hmac.compare_digest(value.encode(), token.encode())
+
+
+def init_profiling(app):
+    """Register this first in create_app so its after_request hook, which
+    runs last, covers the others."""
+    if not app.config.get('PROFILING_ENABLED', False):
+        return None
+
+    token = app.config.get('PROFILING_TOKEN')
+    sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+    kind = app.config.get('PROFILING_PROFILER', 'cprofile')
+    interval = app.config.get('PROFILING_INTERVAL_MS', 5) / 1000
+    keep = app.config.get('PROFILING_MAX_DUMPS', 50)
+    directory = app.config.get('PROFILING_DIR') or os.path.join(app.instance_path, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    app.extensions['profiling'] = directory
+
+    @app.before_request
+    def start_profile():
+        header = request.headers.get('X-Profile')
+        if not (has_token(header, token) or (sample_rate and random.random() < sample_rate)):
+            return
+        profiler, suffix = make_profiler(kind, interval)
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler already holds this interpreter (Python 3.12+)
+            return
+        g.profile = (profiler, suffix)
+
+    @app.after_request
+    def save_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profiler, suffix = profile
+        profiler.disable()
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        name = dump_name(request.method, request_route(), request_id, suffix)
+        # Written under a name the listing skips, then renamed into place
+        path = os.path.join(directory, name)
+        profiler.dump_stats(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        trim_dumps(directory, keep)
+        response.headers['X-Profile-Id'] = name
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # Only reached with the profiler running when after_request was not
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile[0].disable()
+
+    path = app.config.get('PROFILING_PATH', '/admin/profiles')
+
+    def forbidden():
+        if has_token(request.headers.get('X-Profile-Token'), token):
+            return None
+        return jsonify({'error': 'Missing or invalid X-Profile-Token'}), 403
+
+    @app.route(path, endpoint='profiles')
+    def profiles_view():
+        denied = forbidden()
+        if denied:
+            return denied
+        dumps = (dump_info(directory, name) for name in reversed(list_dumps(directory)))
+        return jsonify([dump for dump in dumps if dump is not None])
+
+    @app.route(f'{path}/<name>', endpoint='profile')
+    def profile_view(name):
+        denied = forbidden()
+        if denied:
+            return denied
+        if not DUMP_NAME.fullmatch(name):
+            abort(404)
+        return send_from_directory(directory, name, as_attachment=True, mimetype='application/octet-stream')
+
+    return directory
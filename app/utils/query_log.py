@@ -0,0 +1,153 @@
+"""SQL diagnostics: a slow-query log and an N+1 detector.
+
+Statements slower than SLOW_QUERY_MS are logged on the 'app.sql' logger
+with their bound parameters redacted to type names and, when
+SLOW_QUERY_EXPLAIN is set, the database's query plan. Within one request,
+a SELECT shape (the statement text, IN lists collapsed) repeated at least
+N_PLUS_ONE_THRESHOLD times is reported as an N+1; N_PLUS_ONE_MODE picks
+'warn', 'raise' (for test suites) or 'off'.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from flask import current_app, request
+from sqlalchemy import event
+
+logger = logging.getLogger('app.sql')
+
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN ', 'mysql': 'EXPLAIN '}
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+# "IN (?, ?, ?)" and "IN (%(id_1)s, %(id_2)s)" differ only by list length
+IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s)\s*,)+\s*(?:\?|%\(\w+\)s)\s*\)')
+
+_statement_counts = ContextVar('statement_counts', default=None)
+
+
+class NPlusOneQueries(RuntimeError):
+    pass
+
+
+def statement_shape(statement):
+    return IN_LIST.sub('(...)', statement)
+
+
+def redact(parameters, executemany):
+    if executemany:
+        return f'<{len(parameters)} parameter sets>'
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def explain(conn, statement, parameters):
+    """The query plan as a list of lines; never runs the statement itself."""
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    # A raw cursor on the same connection, so the plan sees the same
+    # transaction and this does not fire the engine events again. Inside a
+    # savepoint: a failed statement aborts a PostgreSQL transaction, and the
+    # request's own statements must not pay for the log's.
+    savepoint = conn.in_transaction()
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT query_log_explain')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT query_log_explain')
+            raise
+        finally:
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT query_log_explain')
+    finally:
+        cursor.close()
+    # SQLite rows are (id, parent, notused, detail); others are one column
+    return [str(row[-1]) for row in rows]
+
+
+def is_full_scan(plan):
+    # SQLite reports "SCAN todo" for a table scan, "SCAN todo USING INDEX ..." otherwise
+    return any(line.startswith('SCAN ') and 'INDEX' not in line for line in plan)
+
+
+def log_slow_query(conn, statement, parameters, executemany, elapsed, with_plan=True):
+    plan = []
+    if with_plan and not executemany:
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception as e:
+            plan = [f'unavailable: {e.__class__.__name__}']
+
+    logger.warning(
+        'Slow query (%.1f ms)%s: %s | params: %s | plan: %s',
+        elapsed * 1000,
+        ' [full scan]' if is_full_scan(plan) else '',
+        ' '.join(statement.split()),
+        redact(parameters, executemany),
+        ' / '.join(plan) or '-',
+    )
+
+
+def install_query_log(engine, slow_query_ms=200, with_plan=True):
+    """Time statements for the slow-query log and count SELECT shapes for
+    the request being checked, if any. slow_query_ms=None disables the log."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_log_start'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_log_start']
+
+        counts = _statement_counts.get()
+        if counts is not None and statement.lstrip()[:6].upper() == 'SELECT':
+            counts[statement_shape(statement)] += 1
+
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            log_slow_query(conn, statement, parameters, executemany, elapsed, with_plan)
+
+
+def start_statement_counts():
+    if current_app.config.get('N_PLUS_ONE_MODE', 'warn') != 'off':
+        _statement_counts.set(Counter())
+
+
+def check_statement_counts(route):
+    """Report SELECT shapes repeated past the threshold during this request."""
+    counts = _statement_counts.get()
+    if counts is None:
+        return
+    _statement_counts.set(None)
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+    repeated = [(shape, count) for shape, count in counts.items() if count >= threshold]
+    if not repeated:
+        return
+
+    message = f'Possible N+1 in {route}: ' + '; '.join(
+        f'{count}x {" ".join(shape.split())}' for shape, count in repeated
+    )
+    if current_app.config.get('N_PLUS_ONE_MODE', 'warn') == 'raise':
+        raise NPlusOneQueries(message)
+    logger.warning(message)
+
+
+def init_query_log(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            install_query_log(engine, app.config.get('SLOW_QUERY_MS', 200), app.config.get('SLOW_QUERY_EXPLAIN', True))
+
+    @app.before_request
+    def before_request():
+        start_statement_counts()
+
+    @app.after_request
+    def after_request(response):
+        check_statement_counts(f'{request.method} {request.path}')
+        return response
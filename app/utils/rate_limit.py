@@ -0,0 +1,215 @@
+"""Token-bucket rate limiting for the endpoints listed in RATE_LIMITS.
+
+Each rule is 'ip:COUNT/PERIOD' or 'user:COUNT/PERIOD': a bucket of COUNT
+tokens per client IP or per JWT identity, refilled evenly over PERIOD.
+User rules fall back to the IP when the request carries no valid token.
+Requests over a limit get 429 with Retry-After and never reach the view.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from app.utils.cache import InMemoryRedis
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+SCOPES = ('ip', 'user')
+TOO_MANY_REQUESTS = {'error': 'Too many requests, please retry later'}
+
+RateLimit = namedtuple('RateLimit', 'scope rate burst')
+
+# KEYS[1] = bucket; ARGV = rate, burst, cost, now (a negative cost refunds).
+# Returns {allowed, retry_after}
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost, now = tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed, retry_after = 0, (cost - tokens) / rate
+if tokens >= cost then
+    tokens, allowed, retry_after = math.min(burst, tokens - cost), 1, 0
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+def parse_rate_limit(rule):
+    """'ip:10/minute' -> RateLimit('ip', 10 / 60, 10)"""
+    try:
+        scope, _, amount = rule.strip().partition(':')
+        count, _, period = amount.partition('/')
+        count = int(count)
+        seconds = PERIODS[period.strip()]
+    except (KeyError, ValueError):
+        raise ValueError(f'Invalid rate limit {rule!r}; expected e.g. "ip:10/minute"')
+    if scope not in SCOPES or count < 1:
+        raise ValueError(f'Invalid rate limit {rule!r}; scope must be ip or user and the count positive')
+    return RateLimit(scope, count / seconds, count)
+
+
+def parse_rate_limits(config):
+    """{endpoint: 'rule; rule'} -> {endpoint: (RateLimit, ...)}"""
+    return {
+        endpoint: tuple(parse_rate_limit(rule) for rule in rules.split(';') if rule.strip())
+        for endpoint, rules in config.items()
+    }
+
+
+def refill(tokens, updated, now, rate, burst, cost=1):
+    """One token-bucket step: (allowed, tokens left, seconds until cost tokens
+    are there). A negative cost puts tokens back, up to the burst."""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return True, min(burst, tokens - cost), 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class LocalBuckets:
+    """Per-process buckets, spread over shards with a lock each so requests
+    for different clients rarely wait on one another. Each shard keeps at
+    most max_keys / shards buckets; full buckets go first, as forgetting
+    them changes nothing, then the least recently used."""
+
+    blocking = False
+
+    def __init__(self, shards=16, max_keys=100000, clock=time.monotonic):
+        self.clock = clock
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def take(self, key, rate, burst, cost=1):
+        buckets, lock = self._shards[hash(key) % len(self._shards)]
+        now = self.clock()
+        with lock:
+            tokens, updated, _ = buckets.pop(key, (burst, now, now))
+            allowed, tokens, retry_after = refill(tokens, updated, now, rate, burst, cost)
+            buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(buckets) > self.max_keys_per_shard:
+                self._prune(buckets, now)
+        return allowed, retry_after
+
+    def _prune(self, buckets, now):
+        for key in [key for key, (_, _, full_at) in buckets.items() if full_at <= now]:
+            del buckets[key]
+        # Insertion order is last use, since take() re-inserts
+        while len(buckets) > self.max_keys_per_shard:
+            del buckets[next(iter(buckets))]
+
+    def __len__(self):
+        return sum(len(buckets) for buckets, _ in self._shards)
+
+
+class RedisBuckets:
+    """Buckets shared by every worker: one Redis hash per bucket, updated
+    atomically by a Lua script in a single round trip. Idle buckets expire
+    once they would be full again."""
+
+    blocking = True
+
+    def __init__(self, client, prefix='todos:ratelimit:', clock=time.time):
+        self.prefix = prefix
+        self.clock = clock
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, retry_after = self.script(keys=[self.prefix + key], args=[rate, burst, cost, self.clock()])
+        return bool(int(allowed)), float(retry_after)
+
+
+def token_bucket_script(client, keys, args):
+    """TOKEN_BUCKET_SCRIPT for InMemoryRedis, run in process."""
+    rate, burst, cost, now = (float(arg) for arg in args)
+    tokens, updated = client.hget(keys[0], 'tokens'), client.hget(keys[0], 'updated')
+    allowed, tokens, retry_after = refill(
+        burst if tokens is None else tokens, now if updated is None else updated, now, rate, burst, cost
+    )
+    client.hset(keys[0], 'tokens', tokens)
+    client.hset(keys[0], 'updated', now)
+    client.pexpire(keys[0], math.ceil((burst - tokens) / rate * 1000) + 1000)
+    return [int(allowed), str(retry_after)]
+
+
+InMemoryRedis.scripts[TOKEN_BUCKET_SCRIPT] = token_bucket_script
+
+
+class RateLimiter:
+    def __init__(self, buckets, limits):
+        self.buckets = buckets
+        self.limits = limits
+        self.blocking = buckets.blocking
+
+    def keys_by_user(self, endpoint):
+        return any(limit.scope == 'user' for limit in self.limits.get(endpoint, ()))
+
+    def check(self, endpoint, ip, identity=None):
+        """Take a token from each of the endpoint's buckets; returns the
+        seconds to wait when any of them is empty, else None. A rejected
+        request costs nothing: the tokens the other buckets gave are put
+        back, so one rule's lockout does not drain the rest."""
+        taken = []
+        wait = None
+        for limit in self.limits.get(endpoint, ()):
+            if limit.scope == 'user' and identity is not None:
+                key = f'{endpoint}:user:{identity}'
+            else:
+                key = f'{endpoint}:ip:{ip}'
+            allowed, retry_after = self.buckets.take(key, limit.rate, limit.burst)
+            if allowed:
+                taken.append((key, limit))
+            else:
+                wait = max(wait or 0.0, retry_after)
+        if wait is not None:
+            for key, limit in taken:
+                self.buckets.take(key, limit.rate, limit.burst, cost=-1)
+        return wait
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
+
+
+def request_identity():
+    # The view's own jwt_required reports bad tokens; here they only mean
+    # the request is limited by IP
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return None
+    return get_jwt_identity()
+
+
+def init_rate_limit(app):
+    backend = app.config.get('RATE_LIMIT_BACKEND', 'local')
+    if backend == 'none':
+        return None
+
+    if backend == 'local':
+        buckets = LocalBuckets(app.config.get('RATE_LIMIT_SHARDS', 16), app.config.get('RATE_LIMIT_MAX_KEYS', 100000))
+    elif backend == 'redis':
+        import redis
+        buckets = RedisBuckets(redis.Redis.from_url(app.config['RATE_LIMIT_URL']))
+    elif backend == 'memory':
+        buckets = RedisBuckets(InMemoryRedis())
+    else:
+        raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {backend}')
+
+    limiter = RateLimiter(buckets, parse_rate_limits(app.config.get('RATE_LIMITS', {})))
+    app.extensions['rate_limiter'] = limiter
+
+    @app.before_request
+    def rate_limit():
+        endpoint = request.endpoint
+        if endpoint not in limiter.limits:
+            return None
+        identity = request_identity() if limiter.keys_by_user(endpoint) else None
+        wait = limiter.check(endpoint, request.remote_addr, identity)
+        if wait is not None:
+            return jsonify(TOO_MANY_REQUESTS), 429, {'Retry-After': retry_after(wait)}
+        return None
+
+    return limiter
@@ -0,0 +1,196 @@
+"""Read replicas for the read-only todo views.
+
+SQLALCHEMY_REPLICA_URIS become the binds replica_0, replica_1, ... Views
+decorated with replica_read run their queries on one of them, round robin,
+through the RoutingSession in app/utils/engine.py; everything else, writes
+included, stays on the primary. A user who wrote in the last REPLICA_STICKY_SECONDS reads from the
+primary, so they see their own writes. Stickiness is kept per process: with
+several workers, keep it at least as long as replicas may lag.
+
+At most every REPLICA_CHECK_SECONDS a read checks the replicas: it reads
+the heartbeat row on the primary and on each replica, then stamps a new
+beat on the primary. A replica whose beat trails the primary's by more than
+REPLICA_MAX_LAG_SECONDS, or that cannot be read, is out of rotation until
+a later check finds it healthy; a replica query failing mid-request takes
+it out at once and the view is retried on the primary.
+
+`flask sync-replicas` copies a SQLite primary onto SQLite replicas, standing
+in for replication when trying this out locally.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from functools import wraps
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from app import db
+from app.models.heartbeat import ReplicaHeartbeat
+from app.utils.engine import read_bind, replica_bind_names
+
+logger = logging.getLogger('app.replicas')
+
+
+class ReplicaRouter:
+    def __init__(self, names, sticky_seconds=5, max_lag=10, check_interval=5, clock=time.monotonic):
+        self.names = list(names)
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.clock = clock
+        self.healthy = list(self.names)
+        self.lag = {}
+        self._turn = 0
+        self._written = {}
+        self._next_check = None
+        self._lock = threading.Lock()
+
+    def mark_write(self, user_id):
+        now = self.clock()
+        with self._lock:
+            if len(self._written) > 10000:
+                self._written = {user: until for user, until in self._written.items() if until > now}
+            self._written[user_id] = now + self.sticky_seconds
+
+    def is_sticky(self, user_id):
+        return self._written.get(user_id, 0) > self.clock()
+
+    def pick(self, user_id):
+        """The bind key to read from, or None for the primary."""
+        if self.is_sticky(user_id):
+            return None
+        self.check()
+        with self._lock:
+            if not self.healthy:
+                return None
+            self._turn += 1
+            return self.healthy[self._turn % len(self.healthy)]
+
+    def mark_down(self, name):
+        with self._lock:
+            if name in self.healthy:
+                self.healthy.remove(name)
+        logger.warning('Replica %s failed a query; out of rotation until the next check', name)
+
+    def check(self):
+        now = self.clock()
+        with self._lock:
+            if self._next_check is not None and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+
+        heartbeat = select(ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == 1)
+        with db.engine.connect() as connection:
+            beat = connection.scalar(heartbeat)
+        healthy, lag = [], {}
+        for name in self.names:
+            try:
+                with db.engines[name].connect() as connection:
+                    replica_beat = connection.scalar(heartbeat)
+            except SQLAlchemyError as e:
+                logger.warning('Replica %s is unreachable: %s', name, e.__class__.__name__)
+                lag[name] = None
+                continue
+            if beat is None:
+                lag[name] = 0.0
+            elif replica_beat is None:
+                lag[name] = float('inf')
+            else:
+                lag[name] = max(0.0, beat - replica_beat)
+            if lag[name] <= self.max_lag:
+                healthy.append(name)
+            else:
+                logger.warning('Replica %s lags by %.1fs; out of rotation', name, lag[name])
+
+        with self._lock:
+            self.healthy = healthy
+            self.lag = lag
+        stamp_heartbeat()
+
+
+def stamp_heartbeat(now=None):
+    beat_at = now if now is not None else time.time()
+    try:
+        with db.engine.execution_options(write_transaction=True).begin() as connection:
+            if not connection.execute(update(ReplicaHeartbeat).where(ReplicaHeartbeat.id == 1).values(beat_at=beat_at)).rowcount:
+                connection.execute(insert(ReplicaHeartbeat).values(id=1, beat_at=beat_at))
+    except SQLAlchemyError as e:
+        # A busy primary skips a beat; replicas then look a beat further behind
+        logger.warning('Could not stamp the replica heartbeat: %s', e.__class__.__name__)
+
+
+def get_replica_router():
+    return current_app.extensions.get('replicas')
+
+
+def mark_write(user_id):
+    """Pin the user's reads to the primary for the sticky window."""
+    router = get_replica_router()
+    if router is not None:
+        router.mark_write(user_id)
+
+
+def replica_read(view):
+    """Run a read-only view against a replica when one is healthy. Must sit
+    below jwt_required and above the decorators that read the database
+    (conditional_get)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = get_replica_router()
+        name = router.pick(get_jwt_identity()) if router is not None else None
+        if name is None:
+            return view(*args, **kwargs)
+        token = read_bind.set(name)
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            router.mark_down(name)
+            db.session.rollback()
+        finally:
+            read_bind.reset(token)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def copy_sqlite_database(source_engine, target_engine):
+    # The engines' URLs, which Flask-SQLAlchemy resolved against the instance folder
+    source = sqlite3.connect(source_engine.url.database)
+    target = sqlite3.connect(target_engine.url.database)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def init_replicas(app):
+    names = replica_bind_names(app.config)
+    if not names:
+        return None
+    # Replicas copy the primary's tables rather than having their own, so
+    # create_all and drop_all must leave them alone
+    for name in names:
+        db.metadatas.pop(name, None)
+    router = ReplicaRouter(
+        names,
+        sticky_seconds=app.config.get('REPLICA_STICKY_SECONDS', 5),
+        max_lag=app.config.get('REPLICA_MAX_LAG_SECONDS', 10),
+        check_interval=app.config.get('REPLICA_CHECK_SECONDS', 5),
+    )
+    app.extensions['replicas'] = router
+    return router
+
+
+@click.command('sync-replicas')
+@with_appcontext
+def sync_replicas_command():
+    """Copy the SQLite primary onto each SQLite replica."""
+    stamp_heartbeat()
+    names = replica_bind_names(current_app.config)
+    for name in names:
+        copy_sqlite_database(db.engine, db.engines[name])
+    click.echo(f'Copied the primary to {len(names)} replica(s)')
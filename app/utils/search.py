@@ -0,0 +1,146 @@
+import re
+from sqlalchemy import case, column, func, literal, literal_column, or_, select, table, text
+from app.models.todo import Todo
+from app.utils.fast_read import TODO_COLUMNS
+from app.utils.pagination import decode_cursor, encode_cursor, is_int, keyset_after, parse_limit
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_QUERY_TERMS = 16
+
+# Contentless FTS5 index: the todo table already holds the text, so the index
+# only stores postings. The owner column holds a "u<user_id>" token, which lets
+# FTS5 intersect the search with the user's own documents instead of ranking
+# every match in the table and throwing away other users' rows afterwards.
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS todo_fts
+       USING fts5(title, description, owner, content='', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS todo_fts_insert AFTER INSERT ON todo BEGIN
+         INSERT INTO todo_fts(rowid, title, description, owner)
+         VALUES (new.id, new.title, coalesce(new.description, ''), 'u' || new.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS todo_fts_delete AFTER DELETE ON todo BEGIN
+         INSERT INTO todo_fts(todo_fts, rowid, title, description, owner)
+         VALUES ('delete', old.id, old.title, coalesce(old.description, ''), 'u' || old.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS todo_fts_update AFTER UPDATE OF title, description, user_id ON todo BEGIN
+         INSERT INTO todo_fts(todo_fts, rowid, title, description, owner)
+         VALUES ('delete', old.id, old.title, coalesce(old.description, ''), 'u' || old.user_id);
+         INSERT INTO todo_fts(rowid, title, description, owner)
+         VALUES (new.id, new.title, coalesce(new.description, ''), 'u' || new.user_id);
+       END""",
+]
+
+SQLITE_BACKFILL = """INSERT INTO todo_fts(rowid, title, description, owner)
+    SELECT id, title, coalesce(description, ''), 'u' || user_id FROM todo"""
+
+POSTGRES_DOCUMENT = "to_tsvector('simple', title || ' ' || coalesce(description, ''))"
+
+POSTGRES_DDL = [
+    f'CREATE INDEX IF NOT EXISTS ix_todo_search ON todo USING gin (user_id, ({POSTGRES_DOCUMENT}))',
+]
+
+fts = table('todo_fts', column('rowid'))
+
+
+def init_search(app, db, engine=None):
+    """Create the full-text index and its sync triggers if they are missing
+    (on engine, by default the app's); call after the tables exist."""
+    with app.app_context():
+        engine = engine or db.engine
+        with engine.begin() as connection:
+            if engine.dialect.name == 'sqlite':
+                # Triggers go away with the todo table, and an index that
+                # missed writes cannot be trusted: rebuild it from scratch
+                in_sync = connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'todo_fts_insert'"
+                )).first()
+                for statement in SQLITE_DDL:
+                    connection.exec_driver_sql(statement)
+                if not in_sync:
+                    connection.exec_driver_sql("INSERT INTO todo_fts(todo_fts) VALUES ('delete-all')")
+                    connection.exec_driver_sql(SQLITE_BACKFILL)
+            elif engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS btree_gin')
+                for statement in POSTGRES_DDL:
+                    connection.exec_driver_sql(statement)
+
+
+def search_terms(raw):
+    """Split a search into (word, is_prefix) pairs; a trailing * asks for a prefix match."""
+    terms = re.findall(r'(\w+)(\*?)', raw or '')
+    if not terms:
+        raise ValueError('Search query q is required')
+    return [(word, bool(star)) for word, star in terms[:MAX_QUERY_TERMS]]
+
+
+def fts5_terms(terms):
+    # Every term quoted, so user input can never be parsed as FTS5 syntax.
+    # Prefixes are opt-in: a prefix query merges the postings of every
+    # matching token, which costs far more than an exact term.
+    return [f'"{word}"*' if prefix else f'"{word}"' for word, prefix in terms]
+
+
+def fts5_query(user_id, quoted_terms, columns='{title description}'):
+    return f'owner:u{int(user_id)} AND {columns}: ({" ".join(quoted_terms)})'
+
+
+def fts5_rowids(expression):
+    return select(fts.c.rowid).where(literal_column('todo_fts').op('MATCH')(expression))
+
+
+def is_rank(value):
+    return is_int(value) or isinstance(value, float)
+
+
+def parse_search_args(args):
+    """Validate the query string of a search request; raises ValueError."""
+    params = {
+        'terms': search_terms(args.get('q')),
+        'limit': parse_limit(args.get('limit'), default=DEFAULT_SEARCH_LIMIT),
+        'after': None,
+    }
+    if args.get('cursor'):
+        params['after'] = decode_cursor(args['cursor'], 'rank', is_rank)
+    return params
+
+
+def search_query(dialect, user_id, params):
+    """Ranked, user-scoped select of TODO_COLUMNS plus a trailing rank column;
+    lower ranks are better matches."""
+    terms = params['terms']
+
+    if dialect == 'sqlite':
+        # Rank by how many of the terms appear in the title. bm25() would need
+        # each term's frequency across every user's todos, which means reading
+        # its whole posting list; these lookups stay within the user's todos.
+        quoted = fts5_terms(terms)
+        title_hits = [
+            case((Todo.id.in_(fts5_rowids(fts5_query(user_id, [term], 'title'))), 1), else_=0)
+            for term in quoted
+        ]
+        ranked = (
+            select(*TODO_COLUMNS, (-sum(title_hits[1:], title_hits[0])).label('rank'))
+            .where(Todo.id.in_(fts5_rowids(fts5_query(user_id, quoted))))
+        )
+    elif dialect == 'postgresql':
+        document = literal_column(POSTGRES_DOCUMENT)
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{word}:*' if prefix else word for word, prefix in terms))
+        ranked = select(*TODO_COLUMNS, (-func.ts_rank(document, tsquery)).label('rank')).where(document.op('@@')(tsquery))
+    else:
+        # No native full-text support wired up: unindexed substring match
+        ranked = select(*TODO_COLUMNS, literal(0.0).label('rank'))
+        for word, _ in terms:
+            pattern = f'%{word}%'
+            ranked = ranked.where(or_(Todo.title.ilike(pattern), Todo.description.ilike(pattern)))
+
+    # Rank in a subquery so the keyset seek can compare against it
+    ranked = ranked.where(Todo.user_id == user_id).subquery('ranked')
+    query = select(*ranked.c)
+    if params['after'] is not None:
+        value, last_id = params['after']
+        query = query.where(keyset_after(ranked.c.rank, ranked.c.id, value, last_id))
+    return query.order_by(ranked.c.rank, ranked.c.id)
+
+
+def search_cursor(row):
+    return encode_cursor('rank', row[-1], row[0])
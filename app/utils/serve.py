@@ -0,0 +1,114 @@
+"""`flask serve`: the app under gunicorn's threaded workers.
+
+The master builds the app once (preload) and forks the workers from it, so
+imports, the OpenAPI document and the rest of the app's memory are shared
+copy-on-write instead of rebuilt per worker. Each worker then drops the
+database connections it inherited and opens its own pool before taking
+traffic.
+
+Sizing: one worker per CPU, since the GIL lets a worker use only one, and
+enough threads to keep every CPU busy while requests wait on the database:
+CPUs * (1 + SERVE_IO_RATIO) in all, where the ratio is time spent waiting
+over time spent computing. Connections arriving while a worker restarts
+wait in the listen backlog, which the master keeps open.
+
+Each worker also has its own bcrypt process pool. Unless
+PASSWORD_HASH_POOL_SIZE sets its size, the pools split the CPUs between
+them (CPUs // workers, at least 1), so a burst of logins cannot start more
+hashing processes than there are CPUs.
+
+`kill -HUP` replaces the workers gracefully, waiting up to
+SERVE_GRACEFUL_TIMEOUT for requests in flight, but they fork from the code
+the master loaded. To deploy new code send USR2, which starts a new master
+alongside the old one, then QUIT to the old master.
+"""
+import gc
+import math
+import os
+import click
+from flask.cli import pass_script_info
+
+
+def serve_options(config, cpu_count=None):
+    """gunicorn settings from the SERVE_* config."""
+    cpus = cpu_count or os.cpu_count() or 1
+    workers = config.get('SERVE_WORKERS') or cpus
+    threads = config.get('SERVE_THREADS') or max(1, math.ceil(cpus * (1 + config.get('SERVE_IO_RATIO', 3.0)) / workers))
+    return {
+        'bind': config.get('SERVE_BIND', '0.0.0.0:5000'),
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': config.get('SERVE_TIMEOUT', 30),
+        'graceful_timeout': config.get('SERVE_GRACEFUL_TIMEOUT', 30),
+        'keepalive': config.get('SERVE_KEEPALIVE', 5),
+        # Recycling workers bounds slow leaks; the jitter keeps them from all
+        # restarting at once
+        'max_requests': config.get('SERVE_MAX_REQUESTS', 10000),
+        'max_requests_jitter': config.get('SERVE_MAX_REQUESTS_JITTER', 1000),
+    }
+
+
+def warm_master(app):
+    """Build what every worker would otherwise build on its first request
+    (the OpenAPI document, the compiled request schemas), then move it out
+    of the garbage collector's way: collections touch every tracked
+    object's header, which would copy the shared pages."""
+    from app.utils.validation import compile_schemas
+
+    app.extensions['openapi'].load()
+    compile_schemas()
+    gc.collect()
+    gc.freeze()
+
+
+def warm_worker(app, threads):
+    """Replace the connections inherited from the master with the worker's
+    own and open as many as its threads will use at once."""
+    from app import db
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        # close=False leaves the parent's sockets alone
+        engine.dispose(close=False)
+        size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+        connections = [engine.connect() for _ in range(max(1, min(threads, size)))]
+        for connection in connections:
+            connection.close()
+
+
+def run_server(app, options):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('post_fork', lambda server, worker: warm_worker(app, options['threads']))
+
+        def load(self):
+            return app
+
+    warm_master(app)
+    Server().run()
+
+
+@click.command('serve')
+@click.option('--bind', '-b', default=None, help='Address to listen on; defaults to SERVE_BIND.')
+@click.option('--workers', '-w', type=int, default=None, help='Worker processes; defaults to SERVE_WORKERS or one per CPU.')
+@click.option('--threads', type=int, default=None, help='Threads per worker; defaults to SERVE_THREADS or the I/O ratio sizing.')
+@pass_script_info
+def serve_command(info, bind, workers, threads):
+    """Serve the app with gunicorn."""
+    app = info.load_app()
+    config = dict(app.config)
+    for key, value in [('SERVE_BIND', bind), ('SERVE_WORKERS', workers), ('SERVE_THREADS', threads)]:
+        if value is not None:
+            config[key] = value
+    options = serve_options(config)
+    # Before the fork: the workers' pools are created lazily, at this size
+    app.extensions['password_hasher'].init_app(app, workers=options['workers'])
+    click.echo(f"Serving on {options['bind']} with {options['workers']} workers x {options['threads']} threads")
+    run_server(app, options)
@@ -0,0 +1,324 @@
+"""Horizontal sharding of users and their todos.
+
+With SQLALCHEMY_SHARD_URIS set, each user's row, todos, tombstones and
+search index live in one of the binds shard_0, shard_1, ..., picked by a
+consistent-hash ring over the user id (SHARD_VNODES points per shard), so
+adding a shard moves only about 1/N of the users. The default database
+keeps the tables that are not per user: the user directory (ids and
+emails), shard placements, revoked tokens.
+
+RoutingSession asks ShardRouter.bind_for() for every statement. Statements
+on sharded tables, and raw connections, go to the current user's shard:
+the one selected with using_shard() or select_user_shard(), or else the
+JWT identity's. A statement on a sharded table with no user to go by
+raises NoShardSelected rather than reading the default database.
+
+Ids stay unique across shards: user ids come from the directory, todo ids
+are sequence * SHARD_ID_SLOTS + the index of the shard that created the
+todo, from a counter kept in that shard and bumped in the write's own
+transaction.
+
+`flask move-user` moves one user to another shard, offline: restart the
+app afterwards, as each process caches the placements. The group-commit
+writer, read replicas and the ASGI app do not support sharding.
+"""
+import bisect
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+import click
+from flask import current_app, g, has_app_context, has_request_context
+from flask.cli import with_appcontext
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, event, inspect, insert, select, update
+from sqlalchemy.sql.util import find_tables
+from app import db
+from app.models.shard import IdSequence, ShardPlacement, UserDirectory
+from app.models.todo import Todo, TodoTombstone
+from app.models.user import User
+from app.utils.engine import shard_bind_names
+
+SHARDED_TABLES = frozenset({'user', 'todo', 'todo_tombstone', 'todo_fts', 'id_sequence'})
+# The id spaces allocate_ids hands out, each a counter row in every shard
+ID_SEQUENCES = ('todo',)
+# Shard index is the low part of a todo id; this caps the number of shards
+SHARD_ID_SLOTS = 1024
+
+# The shard selected explicitly, for code running outside a user's request
+_current_shard = ContextVar('current_shard', default=None)
+
+
+class NoShardSelected(RuntimeError):
+    pass
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    def __init__(self, names, vnodes=64):
+        points = sorted((ring_hash(f'{name}#{i}'), name) for name in names for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def lookup(self, key):
+        index = bisect.bisect(self._hashes, ring_hash(str(key)))
+        return self._names[index % len(self._names)]
+
+
+def statement_tables(mapper, clause):
+    if mapper is not None:
+        return {inspect(mapper).local_table.name}
+    if clause is None:
+        return set()
+    return {table.name for table in find_tables(clause, include_crud=True)}
+
+
+class ShardRouter:
+    def __init__(self, names, vnodes=64):
+        self.names = list(names)
+        self.ring = HashRing(self.names, vnodes)
+        self._placements = None
+        self._lock = threading.Lock()
+
+    def shard_for(self, user_id):
+        user_id = int(user_id)
+        placements = self._placements
+        if placements is None:
+            placements = self._load_placements()
+        return placements.get(user_id) or self.ring.lookup(user_id)
+
+    def shard_index(self, name):
+        return self.names.index(name)
+
+    def reload(self):
+        self._placements = None
+
+    def _load_placements(self):
+        # A plain read on its own connection, even inside a write request,
+        # which may already hold the default database's write lock
+        with db.engine.connect().execution_options(write_transaction=False) as connection:
+            placements = dict(connection.execute(select(ShardPlacement.user_id, ShardPlacement.shard)).all())
+        with self._lock:
+            self._placements = placements
+        return placements
+
+    def current_shard(self):
+        name = _current_shard.get()
+        if name is not None:
+            return name
+        if not has_request_context():
+            return None
+        user_id = g.get('shard_user_id')
+        if user_id is None:
+            try:
+                user_id = get_jwt_identity()
+            except RuntimeError:
+                # No verified token in this request (yet)
+                return None
+        return self.shard_for(user_id) if user_id is not None else None
+
+    def bind_for(self, mapper, clause):
+        """The shard bind key for a statement, or None for the default database."""
+        tables = statement_tables(mapper, clause)
+        if tables and tables.isdisjoint(SHARDED_TABLES):
+            return None
+        name = self.current_shard()
+        if name is None and tables:
+            raise NoShardSelected(f'No shard selected for a statement on {", ".join(sorted(tables))}')
+        return name
+
+
+def get_shard_router():
+    return current_app.extensions.get('shards') if has_app_context() else None
+
+
+@contextmanager
+def using_shard(name):
+    token = _current_shard.set(name)
+    try:
+        yield name
+    finally:
+        _current_shard.reset(token)
+
+
+def each_shard():
+    """Run the body once per shard with that shard selected; once, with
+    nothing selected, when sharding is off."""
+    router = get_shard_router()
+    if router is None:
+        yield None
+        return
+    for name in router.names:
+        with using_shard(name):
+            yield name
+        db.session.remove()
+
+
+def select_user_shard(user_id):
+    """Route the rest of this request to user_id's shard."""
+    g.shard_user_id = user_id
+
+
+def user_by_email(email):
+    """The user with this email, from their shard when sharding."""
+    router = get_shard_router()
+    if router is None:
+        return User.query.filter_by(email=email).first()
+    user_id = db.session.scalar(select(UserDirectory.id).where(UserDirectory.email == email))
+    if user_id is None:
+        return None
+    select_user_shard(user_id)
+    return db.session.get(User, user_id)
+
+
+def new_user_id(email):
+    """An id for a new user, registered in the directory, with the request
+    routed to its shard; None (the database assigns one) when not sharding.
+    Call it once user_by_email() has found no user.
+
+    The directory and the shard cannot commit together, so this commits the
+    session with the entry before the caller adds the user; an entry left
+    without its user (the user's commit failed) is handed out again by the
+    next registration for that email.
+    """
+    if get_shard_router() is None:
+        return None
+    user_id = db.session.scalar(select(UserDirectory.id).where(UserDirectory.email == email))
+    if user_id is None:
+        entry = UserDirectory(email=email)
+        db.session.add(entry)
+        db.session.commit()
+        user_id = entry.id
+    select_user_shard(user_id)
+    return user_id
+
+
+def seed_id_sequences(connection):
+    """Create the counters allocate_ids bumps. create_schema runs this, so
+    concurrent first writes never race to insert them."""
+    existing = set(connection.scalars(select(IdSequence.name)))
+    for name in ID_SEQUENCES:
+        if name not in existing:
+            connection.execute(insert(IdSequence).values(name=name, next_value=1))
+
+
+def allocate_ids(connection, shard, name, count):
+    """count ids for the id space name, unique across shards; runs in the
+    caller's transaction on shard's connection, so ids of a rolled-back
+    write are handed out again, but never to two committed rows."""
+    next_value = connection.scalar(
+        update(IdSequence).where(IdSequence.name == name)
+        .values(next_value=IdSequence.next_value + count).returning(IdSequence.next_value)
+    )
+    if next_value is None:
+        raise RuntimeError(f'No {name} id sequence on {shard}; run `flask init-db`')
+    index = get_shard_router().shard_index(shard)
+    return [sequence * SHARD_ID_SLOTS + index for sequence in range(next_value - count, next_value)]
+
+
+def assign_todo_ids(rows):
+    """Fill in 'id' for rows about to be bulk inserted into todo."""
+    router = get_shard_router()
+    if router is None or not rows:
+        return rows
+    shard = router.current_shard()
+    connection = db.session.connection(bind_arguments={'mapper': inspect(Todo)})
+    for row, todo_id in zip(rows, allocate_ids(connection, shard, 'todo', len(rows))):
+        row['id'] = todo_id
+    return rows
+
+
+@event.listens_for(Todo, 'before_insert')
+def assign_todo_id(mapper, connection, target):
+    router = get_shard_router()
+    if router is not None and target.id is None:
+        target.id = allocate_ids(connection, router.current_shard(), 'todo', 1)[0]
+
+
+def move_user(user_id, target):
+    """Copy a user's rows to the target shard, record the placement, then
+    delete them from every other shard; returns the shard they were on. Run
+    it with the app stopped. Safe to run again if interrupted: once the
+    placement is recorded a rerun finds the user on the target and only
+    deletes what is left elsewhere."""
+    router = get_shard_router()
+    source = router.shard_for(user_id)
+    if target not in router.names:
+        raise ValueError(f'Unknown shard: {target}')
+
+    users, todos, tombstones = User.__table__, Todo.__table__, TodoTombstone.__table__
+
+    def delete_user(connection):
+        connection.execute(delete(tombstones).where(tombstones.c.user_id == user_id))
+        connection.execute(delete(todos).where(todos.c.user_id == user_id))
+        connection.execute(delete(users).where(users.c.id == user_id))
+
+    if source != target:
+        with db.engines[source].connect() as connection:
+            user = connection.execute(select(users).where(users.c.id == user_id)).mappings().first()
+            if user is None:
+                raise ValueError(f'User {user_id} is not on {source}')
+            todo_rows = [dict(row) for row in connection.execute(select(todos).where(todos.c.user_id == user_id)).mappings()]
+            tombstone_rows = [
+                {key: value for key, value in row.items() if key != 'id'}
+                for row in connection.execute(select(tombstones).where(tombstones.c.user_id == user_id)).mappings()
+            ]
+
+        with db.engines[target].execution_options(write_transaction=True).begin() as connection:
+            # Leftovers of an interrupted move
+            delete_user(connection)
+            connection.execute(insert(users), [dict(user)])
+            if todo_rows:
+                connection.execute(insert(todos), todo_rows)
+            if tombstone_rows:
+                connection.execute(insert(tombstones), tombstone_rows)
+
+        with db.engine.execution_options(write_transaction=True).begin() as connection:
+            connection.execute(delete(ShardPlacement).where(ShardPlacement.user_id == user_id))
+            if router.ring.lookup(user_id) != target:
+                connection.execute(insert(ShardPlacement).values(user_id=user_id, shard=target))
+        router.reload()
+
+    # The source's rows, and any an earlier run left behind
+    for name in router.names:
+        if name != target:
+            with db.engines[name].execution_options(write_transaction=True).begin() as connection:
+                delete_user(connection)
+    return source
+
+
+def sharded_tables():
+    return [table for table in db.metadata.sorted_tables if table.name in SHARDED_TABLES]
+
+
+def init_sharding(app):
+    names = shard_bind_names(app.config)
+    if not names:
+        return None
+    # The shards' tables are created by create_schema, not create_all
+    for name in names:
+        db.metadatas.pop(name, None)
+    if len(names) > SHARD_ID_SLOTS:
+        raise ValueError(f'At most {SHARD_ID_SLOTS} shards are supported')
+    for setting in ('WRITE_QUEUE_ENABLED', 'SQLALCHEMY_REPLICA_URIS'):
+        if app.config.get(setting):
+            raise ValueError(f'{setting} cannot be combined with SQLALCHEMY_SHARD_URIS')
+    router = ShardRouter(names, app.config.get('SHARD_VNODES', 64))
+    app.extensions['shards'] = router
+    return router
+
+
+@click.command('move-user')
+@click.argument('user_id', type=int)
+@click.argument('shard')
+@with_appcontext
+def move_user_command(user_id, shard):
+    """Move a user's rows to another shard (with the app stopped)."""
+    try:
+        source = move_user(user_id, shard)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'User {user_id} is on {shard} (was {source})')
@@ -0,0 +1,164 @@
+from datetime import datetime
+from functools import wraps
+import click
+from flask import g, make_response, request
+from flask.cli import with_appcontext
+from sqlalchemy import case, false, func, select, true, update
+from app import db
+from app.models.todo import Todo, PRIORITY_RANKS
+from app.models.user import User
+from app.utils.sharding import each_shard
+from app.utils.todo_query import parse_list_args
+
+PRIORITY_COUNTERS = {priority: f'{priority}_priority_count' for priority in PRIORITY_RANKS}
+COUNTER_FIELDS = ('todo_count', 'completed_count', *PRIORITY_COUNTERS.values())
+RECONCILE_BATCH_SIZE = 500
+
+
+def todo_counts(completed, priority):
+    """The counters one todo contributes to."""
+    counts = {'todo_count': 1}
+    if completed:
+        counts['completed_count'] = 1
+    if priority in PRIORITY_COUNTERS:
+        counts[PRIORITY_COUNTERS[priority]] = 1
+    return counts
+
+
+def count_deltas(before=None, after=None, deltas=None):
+    """Counter changes for one todo going from before to after, each a
+    (completed, priority) pair or None; pass deltas to accumulate into it."""
+    deltas = {} if deltas is None else deltas
+    for sign, state in ((-1, before), (1, after)):
+        if state is not None:
+            for field, count in todo_counts(*state).items():
+                deltas[field] = deltas.get(field, 0) + sign * count
+    return deltas
+
+
+def counter_values(deltas):
+    """UPDATE values applying the deltas to the user's counters."""
+    return {field: getattr(User, field) + delta for field, delta in deltas.items() if delta}
+
+
+def counters(row):
+    return {field: getattr(row, field) or 0 for field in COUNTER_FIELDS}
+
+
+def total_count(counts, params):
+    """How many todos match the list filters, when the counters can tell;
+    None for filter combinations they do not cover."""
+    if params['due_before'] is not None or params['due_after'] is not None:
+        return None
+    if params['priority'] is not None:
+        if params['completed'] is not None:
+            return None
+        return counts[PRIORITY_COUNTERS[params['priority']]]
+    if params['completed'] is None:
+        return counts['todo_count']
+    if params['completed']:
+        return counts['completed_count']
+    return counts['todo_count'] - counts['completed_count']
+
+
+def total_count_header(view):
+    """Add X-Total-Count to list responses from the counters that
+    conditional_get loaded into g.todo_counts; never runs COUNT(*).
+
+    Must sit below conditional_get and above cached_response, so cache hits
+    get the header too. Omitted when the filters are not covered by counters.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        try:
+            total = total_count(g.todo_counts, parse_list_args(request.args))
+        except ValueError:
+            total = None
+        if total is not None:
+            response.headers['X-Total-Count'] = str(total)
+        return response
+    return wrapper
+
+
+def overdue_count(user_id, now=None):
+    # Overdue depends on the clock, so it cannot be a maintained counter. The
+    # (user_id, completed, due_date) index bounds this to the overdue rows.
+    return db.session.scalar(
+        select(func.count()).select_from(Todo).where(
+            Todo.user_id == user_id,
+            Todo.completed == false(),
+            Todo.due_date < (now or datetime.utcnow())
+        )
+    )
+
+
+def user_stats(user_id):
+    row = db.session.execute(select(*(getattr(User, field) for field in COUNTER_FIELDS)).where(User.id == user_id)).first()
+    counts = counters(row) if row else dict.fromkeys(COUNTER_FIELDS, 0)
+    return {
+        'total': counts['todo_count'],
+        'completed': counts['completed_count'],
+        'active': counts['todo_count'] - counts['completed_count'],
+        'overdue': overdue_count(user_id),
+        'by_priority': {priority: counts[field] for priority, field in PRIORITY_COUNTERS.items()},
+    }
+
+
+def grouped_counts(user_ids):
+    """Recompute the counters from the todo table with one grouped query."""
+    columns = [
+        func.count().label('todo_count'),
+        func.sum(case((Todo.completed == true(), 1), else_=0)).label('completed_count'),
+    ] + [
+        func.sum(case((Todo.priority == priority, 1), else_=0)).label(field)
+        for priority, field in PRIORITY_COUNTERS.items()
+    ]
+    rows = db.session.execute(
+        select(Todo.user_id, *columns).where(Todo.user_id.in_(user_ids)).group_by(Todo.user_id)
+    )
+    return {row.user_id: counters(row) for row in rows}
+
+
+def reconcile_stats(batch_size=RECONCILE_BATCH_SIZE):
+    """Rewrite every user's counters from the todo table; returns how many
+    users had drifted. Each batch of users is its own short transaction."""
+    fixed = 0
+    last_id = 0
+    while True:
+        # Write lock first (BEGIN IMMEDIATE on SQLite, row locks elsewhere) so
+        # no todo write lands between the grouped read and the update
+        db.session.connection(execution_options={'write_transaction': True})
+        users = db.session.execute(
+            select(User.id, *(getattr(User, field) for field in COUNTER_FIELDS))
+            .where(User.id > last_id).order_by(User.id).limit(batch_size).with_for_update()
+        ).all()
+        if not users:
+            db.session.rollback()
+            return fixed
+
+        actual = grouped_counts([user.id for user in users])
+        empty = dict.fromkeys(COUNTER_FIELDS, 0)
+        drifted = [
+            dict(actual.get(user.id, empty), id=user.id)
+            for user in users if counters(user) != actual.get(user.id, empty)
+        ]
+        if drifted:
+            db.session.execute(update(User), drifted)
+        db.session.commit()
+
+        fixed += len(drifted)
+        last_id = users[-1].id
+
+
+@click.command('reconcile-stats')
+@click.option('--batch-size', default=RECONCILE_BATCH_SIZE, show_default=True)
+@with_appcontext
+def reconcile_stats_command(batch_size):
+    """Recompute the per-user todo counters behind /api/todos/stats."""
+    fixed = 0
+    for _ in each_shard():
+        fixed += reconcile_stats(batch_size)
+    click.echo(f'Reconciled todo counters; {fixed} user(s) corrected')
@@ -0,0 +1,25 @@
+from flask import current_app, stream_with_context
+from app.utils.fast_read import fetch_chunks, to_dicts
+
+STREAM_CHUNK_SIZE = 500
+
+
+def stream_json_array(query, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream a filter_todos() query as one JSON array without materializing it.
+
+    Rows are fetched chunk_size at a time and each chunk is encoded and sent
+    before the next is loaded, so memory stays flat however large the
+    collection is. The bytes match what jsonify() would have produced.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield '['
+        separator = ''
+        for chunk in fetch_chunks(query, chunk_size):
+            # Encode the chunk as an array and drop its brackets
+            yield separator + dumps(to_dicts(chunk), separators=(',', ':'))[1:-1]
+            separator = ','
+        yield ']\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
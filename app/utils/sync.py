@@ -0,0 +1,141 @@
+"""Delta sync for GET /api/todos/changes.
+
+Every write bumps the user's todos_version and stamps the todos it writes
+(change_seq) or the tombstones of those it deletes with the new version.
+A sync token is a position (change_seq, id) in that sequence, so a client
+gets exactly the rows written since its last sync, from an index seek, no
+matter how many todos it has.
+
+Clients apply a page's `deleted` ids before its `items`: an id can appear
+in both when SQLite reuses it for a todo created after the delete.
+"""
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, select, update
+from app import db
+from app.models.todo import Todo, TodoTombstone
+from app.models.user import User
+from app.utils.fast_read import to_dicts, todo_select
+from app.utils.pagination import decode_cursor, encode_cursor, is_int, keyset_after, parse_limit
+from app.utils.sharding import each_shard
+
+SYNC_KEY = 'changes'
+DEFAULT_SYNC_LIMIT = 200
+PRUNE_BATCH_SIZE = 1000
+
+
+class SyncExpired(ValueError):
+    pass
+
+
+def parse_since(raw):
+    """The (change_seq, id) position a token points at; None for a full sync."""
+    if raw is None:
+        return None
+    return decode_cursor(raw, SYNC_KEY, is_int)
+
+
+def sync_token(change_seq, last_id):
+    return encode_cursor(SYNC_KEY, change_seq, last_id)
+
+
+def changes_since(user_id, since, limit=DEFAULT_SYNC_LIMIT):
+    """One page of changes after the since position; returns (rows, deleted
+    ids, next token, has_more). Rows are todo_select() tuples.
+
+    Reads are capped at the version current when the page starts, so a
+    write committing meanwhile is left whole for the next call."""
+    state = db.session.execute(
+        select(User.todos_version, User.tombstone_floor).where(User.id == user_id)
+    ).first()
+    version, floor = state if state else (0, 0)
+    # A full sync has nothing to delete, so pruned tombstones do not matter
+    if since is not None and since[0] <= floor:
+        raise SyncExpired('Sync token has expired; fetch the full list again')
+
+    seq, last_id = since or (0, 0)
+    # Caught up: answered from the user row alone
+    if seq > version:
+        return [], [], sync_token(seq, last_id), False
+
+    todos = db.session.connection().execute(
+        todo_select().add_columns(Todo.change_seq).where(
+            Todo.user_id == user_id,
+            # The plain range is what the index seeks on; the keyset OR is not
+            Todo.change_seq.between(seq, version),
+            keyset_after(Todo.change_seq, Todo.id, seq, last_id)
+        ).order_by(Todo.change_seq, Todo.id).limit(limit + 1)
+    ).all()
+    tombstones = [] if since is None else db.session.connection().execute(
+        select(TodoTombstone.change_seq, TodoTombstone.todo_id).where(
+            TodoTombstone.user_id == user_id,
+            TodoTombstone.change_seq.between(seq, version),
+            keyset_after(TodoTombstone.change_seq, TodoTombstone.todo_id, seq, last_id)
+        ).order_by(TodoTombstone.change_seq, TodoTombstone.todo_id).limit(limit + 1)
+    ).all()
+
+    # Merge both streams in (change_seq, id) order
+    changes = sorted(
+        [(row[-1], row[0], row) for row in todos] + [(row.change_seq, row.todo_id, None) for row in tombstones],
+        key=lambda change: change[:2]
+    )
+    page, has_more = changes[:limit], len(changes) > limit
+    rows = [row[:-1] for _, _, row in page if row is not None]
+    deleted = [todo_id for _, todo_id, row in page if row is None]
+    if has_more:
+        token = sync_token(*page[-1][:2])
+    else:
+        # (version + 1, 0) is everything after version, whatever the id
+        token = sync_token(version + 1, 0)
+    return rows, deleted, token, has_more
+
+
+def sync_response(user_id, args):
+    """The /todos/changes body; raises ValueError (InvalidCursor, SyncExpired)
+    for bad requests."""
+    since = parse_since(args.get('since'))
+    limit = parse_limit(args.get('limit'), default=DEFAULT_SYNC_LIMIT)
+    rows, deleted, token, has_more = changes_since(user_id, since, limit)
+    return {'items': to_dicts(rows), 'deleted': deleted, 'next_since': token, 'has_more': has_more}
+
+
+def prune_tombstones(older_than, batch_size=PRUNE_BATCH_SIZE, now=None):
+    """Delete tombstones older than the timedelta, raising each affected
+    user's tombstone_floor to match; returns how many were deleted."""
+    cutoff = (now or datetime.utcnow()) - older_than
+    pruned = 0
+    while True:
+        db.session.connection(execution_options={'write_transaction': True})
+        rows = db.session.execute(
+            select(TodoTombstone.id, TodoTombstone.user_id, TodoTombstone.change_seq)
+            .where(TodoTombstone.deleted_at < cutoff)
+            .order_by(TodoTombstone.deleted_at).limit(batch_size)
+        ).all()
+        if not rows:
+            db.session.rollback()
+            return pruned
+
+        # Oldest first, so each batch's floors are at least the stored ones
+        floors = {}
+        for row in rows:
+            floors[row.user_id] = max(floors.get(row.user_id, 0), row.change_seq)
+        db.session.execute(update(User), [{'id': user_id, 'tombstone_floor': floor} for user_id, floor in floors.items()])
+        db.session.execute(delete(TodoTombstone).where(TodoTombstone.id.in_([row.id for row in rows])))
+        db.session.commit()
+        pruned += len(rows)
+
+
+@click.command('prune-tombstones')
+@click.option('--days', type=int, default=None, help='Retention; defaults to TOMBSTONE_RETENTION_DAYS.')
+@click.option('--batch-size', default=PRUNE_BATCH_SIZE, show_default=True)
+@with_appcontext
+def prune_tombstones_command(days, batch_size):
+    """Delete todo tombstones that sync clients no longer need."""
+    if days is None:
+        days = current_app.config.get('TOMBSTONE_RETENTION_DAYS', 30)
+    pruned = 0
+    for _ in each_shard():
+        pruned += prune_tombstones(timedelta(days=days), batch_size)
+    click.echo(f'Pruned {pruned} tombstone(s) older than {days} day(s)')
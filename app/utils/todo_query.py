@@ -0,0 +1,137 @@
+from datetime import datetime
+from app.models.todo import Todo, PRIORITY_RANKS, priority_rank
+from app.utils.pagination import InvalidCursor, decode_cursor, encode_cursor, is_int, keyset_after, parse_limit
+
+VALID_PRIORITIES = list(PRIORITY_RANKS)
+
+SORT_KEYS = {
+    'id': Todo.id,
+    'due_date': Todo.due_date,
+    'priority': priority_rank,
+    'created_at': Todo.created_at,
+    'updated_at': Todo.updated_at,
+}
+
+DATETIME_SORT_KEYS = ('due_date', 'created_at', 'updated_at')
+
+# What sort_value() can put in a cursor for each sort key
+CURSOR_VALUE_CHECKS = {
+    'id': is_int,
+    'due_date': lambda value: value is None or isinstance(value, str),
+    'priority': lambda value: value is None or (is_int(value) and value in PRIORITY_RANKS.values()),
+    'created_at': lambda value: value is None or isinstance(value, str),
+    'updated_at': lambda value: value is None or isinstance(value, str),
+}
+
+
+def _parse_bool(name, raw):
+    value = raw.lower()
+    if value in ('true', '1'):
+        return True
+    if value in ('false', '0'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+def _parse_datetime(name, raw):
+    try:
+        return datetime.fromisoformat(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid date format for {name}')
+
+
+def parse_list_args(args):
+    """Validate the query string of a todo list request.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    params = {
+        'completed': None,
+        'priority': None,
+        'due_before': None,
+        'due_after': None,
+        'sort': 'id',
+        'descending': False,
+        'paginate': 'limit' in args or 'cursor' in args,
+        'stream': False,
+        'limit': None,
+        'after': None,
+    }
+
+    if 'stream' in args:
+        params['stream'] = _parse_bool('stream', args['stream'])
+    if 'completed' in args:
+        params['completed'] = _parse_bool('completed', args['completed'])
+    if 'priority' in args:
+        if args['priority'] not in VALID_PRIORITIES:
+            raise ValueError(f'Priority must be one of: {", ".join(VALID_PRIORITIES)}')
+        params['priority'] = args['priority']
+    if 'due_before' in args:
+        params['due_before'] = _parse_datetime('due_before', args['due_before'])
+    if 'due_after' in args:
+        params['due_after'] = _parse_datetime('due_after', args['due_after'])
+
+    sort = args.get('sort', 'id')
+    if sort.startswith('-'):
+        params['descending'] = True
+        sort = sort[1:]
+    if sort not in SORT_KEYS:
+        raise ValueError(f'Sort must be one of: {", ".join(SORT_KEYS)}')
+    params['sort'] = sort
+
+    if params['paginate']:
+        params['limit'] = parse_limit(args.get('limit'))
+        if args.get('cursor'):
+            value, last_id = decode_cursor(args['cursor'], args.get('sort', 'id'), CURSOR_VALUE_CHECKS[sort])
+            if value is not None and sort in DATETIME_SORT_KEYS:
+                try:
+                    value = datetime.fromisoformat(value)
+                except (TypeError, ValueError):
+                    raise InvalidCursor('Invalid cursor')
+            params['after'] = (value, last_id)
+
+    return params
+
+
+def filter_todos(query, user_id, params):
+    """Apply user scoping, filters, ordering and the keyset seek to a query."""
+    query = query.filter(Todo.user_id == user_id)
+
+    if params['completed'] is not None:
+        query = query.filter(Todo.completed == params['completed'])
+    if params['priority'] is not None:
+        query = query.filter(Todo.priority == params['priority'])
+    if params['due_before'] is not None:
+        query = query.filter(Todo.due_date < params['due_before'])
+    if params['due_after'] is not None:
+        query = query.filter(Todo.due_date > params['due_after'])
+
+    column = SORT_KEYS[params['sort']]
+    descending = params['descending']
+
+    if params['after'] is not None:
+        value, last_id = params['after']
+        if params['sort'] == 'id':
+            query = query.filter(Todo.id < last_id if descending else Todo.id > last_id)
+        else:
+            query = query.filter(keyset_after(column, Todo.id, value, last_id, descending))
+
+    if params['sort'] == 'id':
+        return query.order_by(Todo.id.desc() if descending else Todo.id)
+    if descending:
+        return query.order_by(column.desc().nulls_last(), Todo.id.desc())
+    return query.order_by(column.asc().nulls_first(), Todo.id)
+
+
+def sort_value(todo, sort):
+    if sort == 'priority':
+        return PRIORITY_RANKS.get(todo.priority)
+    value = getattr(todo, sort)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def next_cursor(todo, params):
+    sort_param = f"-{params['sort']}" if params['descending'] else params['sort']
+    return encode_cursor(sort_param, sort_value(todo, params['sort']), todo.id)
@@ -0,0 +1,189 @@
+"""Request validation compiled from the marshmallow schemas in app/schemas.
+
+marshmallow's load() takes every field through several layers of method
+calls on each request. A compiled schema reads the schema once and keeps,
+per load field, a plain type check for the common field types and set or
+length checks for its OneOf and Length validators. Values those checks do
+not accept are handed to the marshmallow field itself, so results and
+error messages are exactly what load() would give; valid input simply
+never reaches marshmallow. Unknown keys are ignored, as with
+load(unknown=EXCLUDE).
+
+Schemas are compiled on first use rather than at import: importing
+marshmallow takes longer than the rest of create_app. `flask serve`
+compiles them in the master, before forking the workers.
+"""
+from datetime import datetime
+from functools import wraps
+from flask import jsonify, request
+
+
+class ValidationFailed(ValueError):
+    """Invalid input; errors maps each field (or '_schema') to its messages,
+    like marshmallow's ValidationError.messages."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        field, messages = next(iter(errors.items()))
+        super().__init__(f'{field}: {messages[0]}')
+
+
+def error_body(error):
+    return {'error': str(error), 'errors': error.errors}
+
+
+def fast_type(field):
+    """value -> loaded value for the input a field type most often gets;
+    raises ValueError for anything else, which marshmallow then handles."""
+    from marshmallow import fields
+
+    if isinstance(field, fields.String):
+        def load_string(value):
+            if type(value) is not str:
+                raise ValueError(value)
+            return value
+        return load_string
+    if isinstance(field, fields.Boolean):
+        def load_bool(value):
+            if value is not True and value is not False:
+                raise ValueError(value)
+            return value
+        return load_bool
+    if isinstance(field, fields.Integer):
+        def load_int(value):
+            if type(value) is not int:
+                raise ValueError(value)
+            return value
+        return load_int
+    if isinstance(field, fields.DateTime) and field.format in (None, 'iso', 'iso8601'):
+        # What marshmallow itself calls for ISO 8601
+        def load_datetime(value):
+            if type(value) is not str:
+                raise ValueError(value)
+            return datetime.fromisoformat(value)
+        return load_datetime
+    return None
+
+
+def fast_check(validator):
+    """A predicate for validators with a cheaper equivalent, else one that
+    calls the validator."""
+    from marshmallow import ValidationError, validate
+
+    if isinstance(validator, validate.OneOf):
+        try:
+            choices = frozenset(validator.choices)
+            return lambda value: value in choices
+        except TypeError:
+            pass
+    if isinstance(validator, validate.Length) and validator.equal is None:
+        low, high = validator.min, validator.max
+        return lambda value: (low is None or len(value) >= low) and (high is None or len(value) <= high)
+
+    def passes(value):
+        try:
+            validator(value)
+        except ValidationError:
+            return False
+        return True
+    return passes
+
+
+def compile_field(field):
+    """(value, key, data) -> loaded value; raises marshmallow's ValidationError."""
+    convert = fast_type(field)
+    checks = [fast_check(validator) for validator in field.validators]
+    allow_none = field.allow_none
+    slow = field.deserialize
+
+    if convert is None:
+        return lambda value, key, data: slow(value, key, data)
+
+    def load(value, key, data):
+        if value is None and allow_none:
+            return None
+        try:
+            loaded = convert(value)
+        except (TypeError, ValueError):
+            return slow(value, key, data)
+        for check in checks:
+            if not check(loaded):
+                return slow(value, key, data)
+        return loaded
+    return load
+
+
+class CompiledSchema:
+    def __init__(self, schema):
+        from marshmallow import ValidationError, missing
+
+        self.schema = schema
+        self.missing = missing
+        self.validation_error = ValidationError
+        self.type_error = {'_schema': [schema.error_messages['type']]}
+        self.fields = [
+            (field.data_key or name, name, field.required, field.error_messages['required'],
+             field.load_default, compile_field(field))
+            for name, field in schema.load_fields.items()
+        ]
+
+    def load(self, data, partial=False):
+        """The loaded fields; with partial=True, only those present in data."""
+        if not isinstance(data, dict):
+            raise ValidationFailed(self.type_error)
+        missing = self.missing
+        result = {}
+        errors = {}
+        for key, name, required, required_message, default, load in self.fields:
+            value = data.get(key, missing)
+            if value is missing:
+                if partial:
+                    continue
+                if required:
+                    errors[key] = [required_message]
+                elif default is not missing:
+                    result[name] = default() if callable(default) else default
+                continue
+            try:
+                result[name] = load(value, key, data)
+            except self.validation_error as e:
+                errors[key] = e.messages
+        if errors:
+            raise ValidationFailed(errors)
+        return result
+
+
+_compiled = {}
+
+
+def compiled_schema(name):
+    """The compiled form of the schema class called name in app.schemas."""
+    schema = _compiled.get(name)
+    if schema is None:
+        import app.schemas
+        schema = _compiled[name] = CompiledSchema(getattr(app.schemas, name)())
+    return schema
+
+
+def compile_schemas():
+    import app.schemas
+    for name in app.schemas.__all__:
+        compiled_schema(name)
+
+
+def validate_json(schema_name, partial=False):
+    """Load the JSON body with the named schema and pass the result to the
+    view as `data`; invalid bodies get 400 with the errors per field.
+
+    The schema is named rather than passed so that importing the routes
+    does not import marshmallow."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                data = compiled_schema(schema_name).load(request.get_json(), partial)
+            except ValidationFailed as e:
+                return jsonify(error_body(e)), 400
+            return view(*args, data=data, **kwargs)
+        return wrapper
+    return decorator
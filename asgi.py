@@ -0,0 +1,4 @@
+﻿from app import create_app
+
+# uvicorn asgi:app
+app = create_app(asgi=True)
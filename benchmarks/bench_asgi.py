@@ -0,0 +1,29 @@
+"""Requests per second and tail latency of the WSGI (gunicorn) and ASGI
+(uvicorn) servers under the same concurrent mix of list reads and creates.
+
+    python benchmarks/bench_asgi.py [requests] [concurrency] [workers]
+"""
+import sys
+
+from common import fresh_database, free_port, load_test
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    workers = sys.argv[3] if len(sys.argv) > 3 else '2'
+
+    for name, server in [('gunicorn (sync, threads)', 'wsgi'), ('uvicorn (asgi)', 'asgi')]:
+        env = fresh_database()
+        port = free_port()
+        if server == 'wsgi':
+            command = [sys.executable, '-m', 'gunicorn', '-w', workers, '--threads', '8',
+                       '-b', f'127.0.0.1:{port}', 'run:app']
+        else:
+            command = [sys.executable, '-m', 'uvicorn', '--workers', workers, '--log-level', 'warning',
+                       '--port', str(port), 'asgi:app']
+        load_test(name, command, port, env, total, concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Compare one request per todo against POST /api/todos/batch.
+
+    python benchmarks/bench_batch.py [count]
+"""
+import sys
+
+from common import auth_headers, make_app, report, timed
+
+
+def one_by_one(client, headers, count):
+    ids = []
+    for i in range(count):
+        ids.append(client.post('/api/todos', json={'title': f'Todo {i}'}, headers=headers).get_json()['id'])
+    for todo_id in ids:
+        client.put(f'/api/todos/{todo_id}', json={'completed': True}, headers=headers)
+    for todo_id in ids:
+        client.delete(f'/api/todos/{todo_id}', headers=headers)
+
+
+def batched(client, headers, count):
+    response = client.post('/api/todos/batch', json={
+        'operations': [{'op': 'create', 'data': {'title': f'Todo {i}'}} for i in range(count)]
+    }, headers=headers)
+    ids = [result['todo']['id'] for result in response.get_json()['results']]
+    client.post('/api/todos/batch', json={
+        'operations': [{'op': 'update', 'id': todo_id, 'data': {'completed': True}} for todo_id in ids]
+    }, headers=headers)
+    client.post('/api/todos/batch', json={
+        'operations': [{'op': 'delete', 'id': todo_id} for todo_id in ids]
+    }, headers=headers)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    app = make_app()
+    client = app.test_client()
+    headers = auth_headers(client)
+
+    seconds, _ = timed(one_by_one, client, headers, count)
+    report('one request per operation', count * 3, seconds)
+
+    seconds, _ = timed(batched, client, headers, count)
+    report('POST /api/todos/batch', count * 3, seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""CPU cost against bytes saved when compressing real responses: a single
+todo, a 50-item page, the whole 1000-todo list (buffered and streamed in
+chunks) and the OpenAPI document, at several gzip levels.
+
+    python benchmarks/bench_compression.py [repeats]
+"""
+import sys
+import time
+
+from common import auth_headers, make_app
+
+from app.utils.compression import compress, compress_chunks, compression_settings
+
+
+def cost(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats * 1e6, result
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    app = make_app(RESPONSE_CACHE_BACKEND='none', COMPRESSION_ENABLED=False)
+    client = app.test_client()
+    headers = auth_headers(client)
+    for start in range(0, 1000, 100):
+        client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': f'Todo {i}', 'description': f'Description of todo {i}',
+                                      'priority': ('low', 'medium', 'high')[i % 3]}}
+            for i in range(start, start + 100)
+        ]}, headers=headers)
+
+    todo_id = client.get('/api/todos?limit=1', headers=headers).get_json()['items'][0]['id']
+    payloads = [
+        ('single todo', client.get(f'/api/todos/{todo_id}', headers=headers).get_data()),
+        ('page of 50', client.get('/api/todos?limit=50', headers=headers).get_data()),
+        ('1000 todos', client.get('/api/todos', headers=headers).get_data()),
+        ('openapi', client.get('/api/swagger.json').get_data()),
+    ]
+    with client.get('/api/todos?stream=true', headers=headers) as response:
+        chunks = list(response.response)
+
+    print(f'{"payload":<22} {"level":>5} {"bytes":>9} {"gzipped":>9} {"ratio":>6} {"us/op":>9} {"MB/s":>7}')
+    for level in (1, 6, 9):
+        settings = compression_settings({'COMPRESSION_LEVEL': level})
+        for name, body in payloads:
+            micros, compressed = cost(lambda: compress(body, 'gzip', settings), repeats)
+            print(f'{name:<22} {level:>5} {len(body):>9} {len(compressed):>9} {len(body) / len(compressed):>6.1f} '
+                  f'{micros:>9.1f} {len(body) / micros:>7.1f}')
+        size = sum(len(chunk) for chunk in chunks)
+        micros, compressed = cost(lambda: b''.join(compress_chunks(iter(chunks), 'gzip', settings)), repeats)
+        print(f'{"1000 todos, streamed":<22} {level:>5} {size:>9} {len(compressed):>9} {size / len(compressed):>6.1f} '
+              f'{micros:>9.1f} {size / micros:>7.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Todo creates per second against client concurrency, with the group-commit
+writer off (every request commits on its own) and on.
+
+Each run starts `flask serve` on a new SQLite file with as many threads as
+clients, so requests contend for the write lock the way they do in
+production.
+
+    python benchmarks/bench_group_commit.py [writes per run] [workers]
+"""
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import CREDENTIALS, fresh_database, free_port, report, request, start
+
+CONCURRENCY = (1, 4, 16, 64)
+
+
+def run(env, concurrency, total, workers):
+    port = free_port()
+    command = [sys.executable, '-m', 'flask', '--app', 'run.py', 'serve', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(concurrency)]
+    process = start(command, port, env)
+    try:
+        request(port, 'POST', '/api/register', CREDENTIALS)
+        _, body = request(port, 'POST', '/api/login', CREDENTIALS)
+        headers = {'Authorization': f"Bearer {json.loads(body)['access_token']}"}
+
+        def create(index):
+            return request(port, 'POST', '/api/todos', {'title': f'Todo {index}'}, headers)[0]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            statuses = list(executor.map(create, range(total)))
+        seconds = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+    return seconds, sum(1 for status in statuses if status != 201)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    for concurrency in CONCURRENCY:
+        for name, enabled in [('writer off', 'false'), ('writer on', 'true')]:
+            env = fresh_database(WRITE_QUEUE_ENABLED=enabled, RESPONSE_CACHE_BACKEND='none')
+            seconds, errors = run(env, concurrency, total, workers)
+            report(f'{concurrency:>3} clients, {name}', total, seconds, 'writes')
+            if errors:
+                print(f'{"":<40} {errors} failed')
+
+
+if __name__ == '__main__':
+    main()
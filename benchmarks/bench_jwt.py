@@ -0,0 +1,64 @@
+"""Authenticated requests per second with and without the verified-token
+cache, and revocation checks through the Bloom filter against a database
+lookup per request.
+
+    python benchmarks/bench_jwt.py [requests] [revoked tokens]
+"""
+import sys
+from datetime import datetime, timedelta
+
+from common import auth_headers, make_app, report, timed
+
+
+def hammer(client, headers, count):
+    for _ in range(count):
+        client.get('/api/todos', query_string={'limit': 1}, headers=headers)
+
+
+def seed_revoked(db, count):
+    from sqlalchemy import insert
+    from app.models.token import RevokedToken
+
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    db.session.execute(insert(RevokedToken), [
+        {'jti': f'revoked-{i:031d}', 'user_id': 1, 'expires_at': expires_at} for i in range(count)
+    ])
+    db.session.commit()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    revoked = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    from app import db
+    from app.models.token import RevokedToken
+
+    for name, cache_size in [('verify every request', 0), ('verified-token cache', 10000)]:
+        app = make_app(JWT_CACHE_SIZE=cache_size, RESPONSE_CACHE_BACKEND='none')
+        client = app.test_client()
+        headers = auth_headers(client)
+        hammer(client, headers, 10)
+        report(name, count, timed(hammer, client, headers, count)[0], 'requests')
+
+    app = make_app()
+    with app.app_context():
+        seed_revoked(db, revoked)
+        blocklist = app.extensions['token_blocklist']
+        blocklist.refresh()
+        jtis = [f'live-{i:032d}' for i in range(count)]
+
+        def bloom():
+            for jti in jtis:
+                blocklist.is_revoked(jti)
+
+        def database():
+            for jti in jtis:
+                db.session.query(RevokedToken.id).filter_by(jti=jti).first()
+
+        report(f'bloom filter ({revoked} revoked)', count, timed(bloom)[0], 'checks')
+        report(f'database lookup ({revoked} revoked)', count, timed(database)[0], 'checks')
+        print(f'database lookups from bloom false positives: {blocklist.lookups}')
+
+
+if __name__ == '__main__':
+    main()
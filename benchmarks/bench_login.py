@@ -0,0 +1,65 @@
+"""Login throughput, and latency of a cheap request during a login storm,
+for a range of password-hashing pool sizes.
+
+    python benchmarks/bench_login.py [logins] [concurrency] [pool sizes...]
+"""
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import auth_headers, make_app, report
+
+CREDENTIALS = {'email': 'bench@example.com', 'password': 'password123'}
+
+
+def run(pool_size, logins, concurrency):
+    app = make_app(PASSWORD_HASH_POOL_SIZE=pool_size, PASSWORD_HASH_MAX_PENDING=logins)
+    headers = auth_headers(app.test_client(), **CREDENTIALS)
+    local = threading.local()
+
+    def login(_):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client.post('/api/login', json=CREDENTIALS).status_code
+
+    # Cheap requests issued alongside the storm show how much logins block others
+    latencies = []
+    done = threading.Event()
+
+    def poll():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/api/todos', headers=headers)
+            latencies.append(time.perf_counter() - start)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        statuses = list(executor.map(login, range(logins)))
+    seconds = time.perf_counter() - start
+    done.set()
+    poller.join()
+
+    report(f'pool_size={pool_size} logins', statuses.count(200), seconds, 'logins')
+    if latencies:
+        print(f'{"":<40} GET /api/todos during storm: median {statistics.median(latencies) * 1000:.1f} ms, '
+              f'max {max(latencies) * 1000:.1f} ms over {len(latencies)} requests')
+
+    from app import password_hasher
+    password_hasher.shutdown()
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    pool_sizes = [int(n) for n in sys.argv[3:]] or [0, 1, 2, 4]
+    for pool_size in pool_sizes:
+        run(pool_size, logins, concurrency)
+
+
+if __name__ == '__main__':
+    main()
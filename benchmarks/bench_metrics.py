@@ -0,0 +1,81 @@
+"""Per-request cost of the metrics instrumentation.
+
+Times exactly the work the instrumentation adds to a request that runs three
+SQL statements: the before/after request hooks, three pairs of cursor events
+and the Server-Timing header. The budget is 50 microseconds per request; the
+script exits non-zero above it. An end-to-end comparison of the same request
+with METRICS_ENABLED on and off is printed too, for scale, but on a busy
+machine its noise is larger than the overhead.
+
+    python benchmarks/bench_metrics.py [requests] [rounds]
+"""
+import statistics
+import sys
+import time
+
+from common import auth_headers, make_app
+
+BUDGET_US = 50
+STATEMENTS = 3
+
+
+def hooks_per_request(app, requests):
+    from app import db
+
+    before = [hook for hook in app.before_request_funcs[None] if hook.__module__ == 'app.utils.metrics']
+    after = [hook for hook in app.after_request_funcs[None] if hook.__module__ == 'app.utils.metrics']
+    with app.test_request_context('/api/todos/1'):
+        engine = db.engine
+        before_cursor = [listener for listener in engine.dispatch.before_cursor_execute if listener.__module__ == 'app.utils.metrics']
+        after_cursor = [listener for listener in engine.dispatch.after_cursor_execute if listener.__module__ == 'app.utils.metrics']
+        response = app.response_class('{}')
+        args = (None, None, 'SELECT 1', (), None, False)
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            for hook in before:
+                hook()
+            for _ in range(STATEMENTS):
+                for listener in before_cursor:
+                    listener(*args)
+                for listener in after_cursor:
+                    listener(*args)
+            for hook in after:
+                hook(response)
+        return (time.perf_counter() - start) / requests
+
+
+def end_to_end(client, url, headers, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(url, headers=headers)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    clients = {}
+    for enabled in (False, True):
+        app = make_app(METRICS_ENABLED=enabled, METRICS_SERVER_TIMING=enabled, RESPONSE_CACHE_BACKEND='none')
+        client = app.test_client()
+        headers = auth_headers(client)
+        todo = client.post('/api/todos', json={'title': 'Measured'}, headers=headers).get_json()
+        clients[enabled] = (app, client, f"/api/todos/{todo['id']}", headers)
+
+    timings = {False: [], True: []}
+    for _ in range(rounds):
+        for enabled in (False, True):
+            timings[enabled].append(end_to_end(*clients[enabled][1:], requests))
+    off = statistics.median(timings[False]) * 1e6
+    on = statistics.median(timings[True]) * 1e6
+    print(f'end to end: metrics off {off:.1f} us/request, on {on:.1f} us/request')
+
+    hooks = statistics.median(hooks_per_request(clients[True][0], requests) for _ in range(rounds)) * 1e6
+    print(f'instrumentation: {hooks:.1f} us/request ({STATEMENTS} statements), budget {BUDGET_US} us')
+    sys.exit(0 if hooks <= BUDGET_US else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""What the profiling hook costs: requests per second with it off, on but
+not triggered, and profiling every request with each profiler.
+
+    python benchmarks/bench_profiling.py [requests]
+"""
+import sys
+import tempfile
+
+from common import auth_headers, make_app, report, timed
+
+CASES = [
+    ('profiling off', {}),
+    ('enabled, not triggered', {'PROFILING_ENABLED': True}),
+    ('every request, sampling', {'PROFILING_ENABLED': True, 'PROFILING_SAMPLE_RATE': 1.0, 'PROFILING_PROFILER': 'sampling'}),
+    ('every request, cprofile', {'PROFILING_ENABLED': True, 'PROFILING_SAMPLE_RATE': 1.0}),
+]
+
+
+def hammer(client, headers, count):
+    for _ in range(count):
+        client.get('/api/todos', query_string={'limit': 20}, headers=headers)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    for name, overrides in CASES:
+        app = make_app(RESPONSE_CACHE_BACKEND='none', PROFILING_DIR=tempfile.mkdtemp(prefix='todo-profiles-'), **overrides)
+        client = app.test_client()
+        headers = auth_headers(client)
+        for i in range(20):
+            client.post('/api/todos', json={'title': f'Todo {i}'}, headers=headers)
+        hammer(client, headers, 10)
+        report(name, count, timed(hammer, client, headers, count)[0], 'requests')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Cost of a rate-limit check, alone and with many threads sharing one
+bucket store, for a single lock (shards=1) against the default sharding.
+Every thread limits its own client key, as concurrent requests from
+different clients do.
+
+    python benchmarks/bench_rate_limit.py [checks_per_thread] [threads]
+"""
+import sys
+import threading
+import time
+
+from common import report
+
+from app.utils.cache import InMemoryRedis
+from app.utils.rate_limit import LocalBuckets, RedisBuckets
+
+
+def hammer(buckets, threads, checks):
+    def worker(index):
+        key = f'todos.create_todo:ip:10.0.0.{index}'
+        for _ in range(checks):
+            buckets.take(key, 1e9, 1e9)
+
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    checks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    for name, buckets in [
+        ('local, 1 shard', LocalBuckets(shards=1)),
+        ('local, 16 shards', LocalBuckets(shards=16)),
+        ('memory (Redis stand-in)', RedisBuckets(InMemoryRedis())),
+    ]:
+        report(f'{name}, 1 thread', checks, hammer(buckets, 1, checks), 'checks')
+        report(f'{name}, {threads} threads', checks * threads, hammer(buckets, threads, checks), 'checks')
+
+
+if __name__ == '__main__':
+    main()
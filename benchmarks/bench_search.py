@@ -0,0 +1,90 @@
+"""Search latency as the todo table grows, next to a LIKE over the user's todos.
+
+The measured user keeps the same 1000 todos while other users' todos are
+added around them, all with words drawn from one small vocabulary, so every
+search term is common across the table. Exact-term search latency should
+track the user's own todos rather than the table size; prefix terms merge
+every matching token's postings and grow with the table.
+
+    python benchmarks/bench_search.py [max rows] [users] [repeats]
+"""
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from common import auth_headers, make_app
+
+WORDS = ('milk bread eggs report invoice meeting dentist garden paint garage call email plan review '
+         'budget taxes travel flight hotel laundry dishes vacuum groceries gym yoga piano lesson school '
+         'birthday gift party cake doctor pharmacy insurance renew passport visa bank transfer').split()
+USER_ROWS = 1000
+
+
+def seed(db, start, stop, users):
+    from sqlalchemy import insert
+    from app.models.todo import Todo
+
+    rng = random.Random(start)
+    now = datetime.utcnow()
+    for offset in range(start, stop, 10000):
+        db.session.execute(insert(Todo), [
+            {'user_id': 1 if i < USER_ROWS else 2 + i % users, 'title': ' '.join(rng.sample(WORDS, 3)),
+             'description': ' '.join(rng.sample(WORDS, 6)), 'completed': False, 'priority': 'medium',
+             'created_at': now, 'updated_at': now}
+            for i in range(offset, min(offset + 10000, stop))
+        ])
+        db.session.commit()
+
+
+def measure(client, headers, url, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        assert client.get(url, headers=headers).status_code == 200
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def like_search(db, user_id, term):
+    from sqlalchemy import or_
+    from app.models.todo import Todo
+    pattern = f'%{term}%'
+    return (Todo.query.filter(Todo.user_id == user_id)
+            .filter(or_(Todo.title.like(pattern), Todo.description.like(pattern)))
+            .order_by(Todo.id).limit(20).all())
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    from app import db
+    # The response cache would answer every repeat after the first
+    app = make_app(RESPONSE_CACHE_BACKEND='none')
+    client = app.test_client()
+    headers = auth_headers(client)
+
+    sizes = [size for size in (10_000, 100_000, 1_000_000, 10_000_000) if size < max_rows] + [max_rows]
+    seeded = 0
+    print(f'{"rows":>10} {"fts ms":>10} {"fts 2 terms":>12} {"fts prefix":>12} {"like ms":>10}')
+    for size in sizes:
+        with app.app_context():
+            seed(db, seeded, size, users)
+        seeded = size
+
+        fts = measure(client, headers, '/api/todos/search?q=milk', repeats)
+        fts_two = measure(client, headers, '/api/todos/search?q=milk%20dentist', repeats)
+        fts_prefix = measure(client, headers, '/api/todos/search?q=mil*', repeats)
+        with app.app_context():
+            start = time.perf_counter()
+            for _ in range(repeats):
+                like_search(db, 1, 'milk')
+            like = (time.perf_counter() - start) / repeats * 1000
+        print(f'{size:>10} {fts:>10.2f} {fts_two:>12.2f} {fts_prefix:>12.2f} {like:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
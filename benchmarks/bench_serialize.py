@@ -0,0 +1,54 @@
+"""Rows serialized per second: ORM + to_dict() versus Core rows, for each
+installed JSON provider.
+
+    python benchmarks/bench_serialize.py [rows] [repeats]
+"""
+import sys
+
+from common import auth_headers, make_app, report, timed
+
+
+def seed(client, headers, rows):
+    for start in range(0, rows, 500):
+        client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': f'Todo {i}', 'description': 'Some description',
+                                      'due_date': '2030-01-01T12:00:00'}}
+            for i in range(start, min(start + 500, rows))
+        ]}, headers=headers)
+
+
+def orm_path(app, user_id):
+    from app.models.todo import Todo
+    todos = Todo.query.filter_by(user_id=user_id).all()
+    return app.json.response([todo.to_dict() for todo in todos]).get_data()
+
+
+def fast_path(app, user_id):
+    from app.models.todo import Todo
+    from app.utils.fast_read import fetch, to_dicts, todo_select
+    rows = fetch(todo_select().filter(Todo.user_id == user_id))
+    return app.json.response(to_dicts(rows)).get_data()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    from app.utils.json_provider import init_json_provider, orjson
+    app = make_app()
+    client = app.test_client()
+    seed(client, auth_headers(client), rows)
+
+    providers = ['default'] + (['orjson'] if orjson else [])
+    for provider in providers:
+        app.config['JSON_PROVIDER'] = provider
+        init_json_provider(app)
+        with app.test_request_context():
+            for name, path in [('ORM + to_dict()', orm_path), ('Core rows', fast_path)]:
+                path(app, 1)  # warm up
+                seconds, _ = timed(lambda: [path(app, 1) for _ in range(repeats)])
+                report(f'{provider:<8} {name}', rows * repeats, seconds, 'rows')
+
+
+if __name__ == '__main__':
+    main()
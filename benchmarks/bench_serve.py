@@ -0,0 +1,35 @@
+"""Throughput of `flask serve` (preloaded gunicorn, autotuned workers and
+threads) against the Flask development server that `python run.py` and
+the old Docker setup started, under the same mix of list reads and creates.
+
+The dev server runs with the debugger like run.py does, but without the
+reloader, which would leave its child process behind.
+
+    python benchmarks/bench_serve.py [requests] [concurrency]
+"""
+import sys
+
+from common import fresh_database, free_port, load_test
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+    flask = [sys.executable, '-m', 'flask', '--app', 'run.py']
+    for name, args in [
+        ('dev server (run.py, debug)', ['--debug', 'run', '--no-reload']),
+        ('dev server (no debug)', ['run']),
+        ('flask serve', ['serve']),
+    ]:
+        env = fresh_database()
+        port = free_port()
+        if args[0] == 'serve':
+            address = ['--bind', f'127.0.0.1:{port}']
+        else:
+            address = ['--host', '127.0.0.1', '--port', str(port)]
+        load_test(name, flask + args + address, port, env, total, concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Cold start: how long a fresh interpreter takes to import the app, build it
+with create_app() and answer its first authenticated request. Each run is a
+new process, like a gunicorn worker or an autoscaled container; medians are
+reported in milliseconds.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from common import auth_headers, make_app
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/todos', headers={'Authorization': sys.argv[1]})
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'first_request': answered - created}))
+"""
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    app = make_app()
+    headers = auth_headers(app.test_client())
+    env = dict(os.environ, DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'], SECRET_KEY=app.config['SECRET_KEY'])
+
+    timings = {'import': [], 'create_app': [], 'first_request': [], 'process': []}
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, headers['Authorization']],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings['process'].append(time.perf_counter() - start)
+        for phase, seconds in json.loads(output.splitlines()[-1]).items():
+            timings[phase].append(seconds)
+
+    for phase, values in timings.items():
+        print(f'{phase:<16} {statistics.median(values) * 1000:8.1f} ms  (min {min(values) * 1000:.1f}, {runs} runs)')
+
+
+if __name__ == '__main__':
+    main()
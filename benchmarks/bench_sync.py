@@ -0,0 +1,91 @@
+"""Delta sync against a full re-download as one user's collection grows.
+
+At each size the client holds a sync token, ten todos are then written
+(updates, creates and deletes), and the script times fetching just those
+changes next to fetching the whole list. The changes call should stay
+flat while the full list grows with the collection.
+
+    python benchmarks/bench_sync.py [max todos] [repeats]
+"""
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from common import auth_headers, make_app
+
+
+def seed(db, user_id, start, stop):
+    from sqlalchemy import insert, update
+    from app.models.todo import Todo
+    from app.models.user import User
+
+    now = datetime.utcnow()
+    for offset in range(start, stop, 10000):
+        count = min(offset + 10000, stop) - offset
+        version = db.session.scalar(
+            update(User).where(User.id == user_id)
+            .values(todos_version=User.todos_version + 1, todo_count=User.todo_count + count)
+            .returning(User.todos_version)
+        )
+        db.session.execute(insert(Todo), [
+            {'user_id': user_id, 'title': f'Todo {i}', 'description': 'Seeded', 'completed': False,
+             'priority': 'medium', 'created_at': now, 'updated_at': now, 'change_seq': version}
+            for i in range(offset, offset + count)
+        ])
+        db.session.commit()
+
+
+def write_changes(client, headers, todo_ids):
+    for todo_id in todo_ids[:4]:
+        client.put(f'/api/todos/{todo_id}', json={'completed': True}, headers=headers)
+    for todo_id in todo_ids[4:7]:
+        client.delete(f'/api/todos/{todo_id}', headers=headers)
+    for i in range(3):
+        client.post('/api/todos', json={'title': f'New {i}'}, headers=headers)
+
+
+def measure(client, headers, url, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000, len(response.get_data())
+
+
+def main():
+    max_todos = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    from app import db
+    from app.models.todo import Todo
+    # The response cache would answer every repeat of the full list after the first
+    app = make_app(RESPONSE_CACHE_BACKEND='none')
+    client = app.test_client()
+    headers = auth_headers(client)
+
+    sizes = [size for size in (1_000, 10_000) if size < max_todos] + [max_todos]
+    seeded = 0
+    print(f'{"todos":>10} {"changes ms":>11} {"bytes":>8} {"full list ms":>13} {"bytes":>10}')
+    for size in sizes:
+        with app.app_context():
+            seed(db, 1, seeded, size)
+            todo_ids = [todo_id for (todo_id,) in db.session.query(Todo.id).filter(Todo.user_id == 1).order_by(Todo.id.desc()).limit(7)]
+        seeded = size
+
+        # Catch up to a current token, as a client that already synced would be
+        body = {'has_more': True, 'next_since': None}
+        while body['has_more']:
+            query = {'limit': 500, 'since': body['next_since']} if body['next_since'] else {'limit': 500}
+            body = client.get('/api/todos/changes', query_string=query, headers=headers).get_json()
+        token = body['next_since']
+
+        write_changes(client, headers, todo_ids)
+        changes_ms, changes_bytes = measure(client, headers, f'/api/todos/changes?since={token}', repeats)
+        full_ms, full_bytes = measure(client, headers, '/api/todos', max(1, repeats // 5))
+        print(f'{size:>10} {changes_ms:>11.2f} {changes_bytes:>8} {full_ms:>13.2f} {full_bytes:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Validations per second: the compiled schemas against marshmallow's own
+load() (with unknown=EXCLUDE, as the compiled form behaves) on the same
+payloads.
+
+    python benchmarks/bench_validation.py [iterations]
+"""
+import sys
+import time
+
+from common import report
+
+from marshmallow import EXCLUDE, ValidationError
+
+import app.schemas
+from app.utils.validation import ValidationFailed, compiled_schema
+
+CASES = [
+    ('create todo', 'TodoSchema', False, {'title': 'Buy milk', 'description': 'Two litres', 'completed': False,
+                                          'priority': 'high', 'due_date': '2030-01-01T09:30:00'}),
+    ('update todo (partial)', 'TodoSchema', True, {'completed': True}),
+    ('register', 'UserSchema', False, {'email': 'someone@example.com', 'password': 'password123'}),
+    ('invalid todo', 'TodoSchema', False, {'priority': 'urgent', 'due_date': 'soon'}),
+]
+
+
+def run(load, data, partial, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            load(data, partial)
+        except (ValidationError, ValidationFailed):
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    for name, schema_name, partial, data in CASES:
+        schema = getattr(app.schemas, schema_name)()
+        compiled = compiled_schema(schema_name)
+        report(f'{name}: marshmallow', iterations,
+               run(lambda d, p: schema.load(d, partial=p, unknown=EXCLUDE), data, partial, iterations), 'validations')
+        report(f'{name}: compiled', iterations, run(compiled.load, data, partial, iterations), 'validations')
+
+
+if __name__ == '__main__':
+    main()
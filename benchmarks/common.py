@@ -0,0 +1,140 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+
+
+def make_config(**overrides):
+    """Config pointing at a throwaway file-based SQLite database, so commits
+    pay for real fsyncs like they do in production."""
+    directory = tempfile.mkdtemp(prefix='todo-bench-')
+    # Benchmarks hammer single endpoints from one client, which is exactly
+    # what the rate limiter is there to stop
+    attrs = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        'RATE_LIMIT_BACKEND': 'none',
+        # Seeding runs bulk inserts that would all land in the slow-query log
+        'SLOW_QUERY_MS': None,
+    }
+    attrs.update(overrides)
+    return type('BenchConfig', (Config,), attrs)
+
+
+def make_app(**overrides):
+    from app import create_app
+    from app.utils.db_setup import create_schema
+
+    app = create_app(make_config(**overrides))
+    create_schema(app)
+    return app
+
+
+def auth_headers(client, email='bench@example.com', password='password123'):
+    client.post('/api/register', json={'email': email, 'password': password})
+    token = client.post('/api/login', json={'email': email, 'password': password}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def report(name, count, seconds, unit='ops'):
+    print(f'{name:<40} {count:>8} {unit} in {seconds:8.3f}s  {count / seconds:12.1f} {unit}/s')
+
+
+# Helpers for benchmarks that run real servers in subprocesses
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CREDENTIALS = {'email': 'bench@example.com', 'password': 'password123'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request(method, path, json.dumps(body) if body is not None else None,
+                           dict(headers or {}, **{'Content-Type': 'application/json'}))
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def wait_until_up(port, process):
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            request(port, 'GET', '/api/swagger.json')
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('server did not start')
+
+
+def start(command, port, env):
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(port, process)
+    return process
+
+
+def load_test(name, command, port, env, total, concurrency):
+    """Start the server, then send total requests from concurrency threads:
+    one create for every four list reads."""
+    process = start(command, port, env)
+    try:
+        request(port, 'POST', '/api/register', CREDENTIALS)
+        _, body = request(port, 'POST', '/api/login', CREDENTIALS)
+        headers = {'Authorization': f"Bearer {json.loads(body)['access_token']}"}
+
+        def one(index):
+            started = time.perf_counter()
+            if index % 5 == 0:
+                status, _ = request(port, 'POST', '/api/todos', {'title': f'Todo {index}'}, headers)
+            else:
+                status, _ = request(port, 'GET', '/api/todos?limit=50', headers=headers)
+            return status, time.perf_counter() - started
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(one, range(total)))
+        seconds = time.perf_counter() - start_time
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status >= 400)
+    report(name, total, seconds, 'requests')
+    print(f'{"":<40} p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, {errors} errors')
+
+
+def fresh_database(**env):
+    """Environment for a server subprocess on a new SQLite file, with its
+    schema created."""
+    directory = tempfile.mkdtemp(prefix='todo-bench-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+               BCRYPT_LOG_ROUNDS='4', RATE_LIMIT_BACKEND='none', **env)
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'run.py', 'init-db'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    return env
@@ -1,11 +1,164 @@
 ﻿import os
 from datetime import timedelta
-from dotenv import load_dotenv
 
-load_dotenv()
+# Only the .env next to this file: load_dotenv() without a path searches the
+# caller's directory and its parents on every import, and the dotenv import
+# itself is skipped when there is nothing to load
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///todo.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Async driver URL for `uvicorn asgi:app`; derived from DATABASE_URL when unset
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+    # uvicorn workers, which uvicorn also reads as its --workers default;
+    # the password hash pools split the CPUs between them
+    ASGI_WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+    # Read replicas for the list, single todo, stats and search views,
+    # comma-separated. A user reads from the primary for
+    # REPLICA_STICKY_SECONDS after writing; replicas lagging by more than
+    # REPLICA_MAX_LAG_SECONDS (checked every REPLICA_CHECK_SECONDS) are skipped
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '10'))
+    REPLICA_CHECK_SECONDS = float(os.getenv('REPLICA_CHECK_SECONDS', '5'))
+
+    # Shard users and their todos over these databases, comma-separated, by a
+    # consistent-hash ring with SHARD_VNODES points per shard. DATABASE_URL
+    # then holds only the user directory, shard placements and revoked tokens
+    SQLALCHEMY_SHARD_URIS = [uri for uri in os.getenv('SHARD_DATABASE_URLS', '').split(',') if uri]
+    SHARD_VNODES = int(os.getenv('SHARD_VNODES', '64'))
+
+    # Engine profile: 'sqlite' (WAL + pragmas), 'server' (connection pool
+    # settings), 'none', or 'auto' to choose from the database URI
+    DB_PROFILE = os.getenv('DB_PROFILE', 'auto')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', str(64 * 1024)))
+    SQLITE_BEGIN_IMMEDIATE_FOR_WRITES = True
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    # `flask serve`: gunicorn workers (0 = one per CPU) and
+    # threads per worker (0 = sized from SERVE_IO_RATIO, the time a request
+    # waits on I/O over the time it computes)
+    SERVE_BIND = os.getenv('SERVE_BIND', '0.0.0.0:5000')
+    SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', '0'))
+    SERVE_THREADS = int(os.getenv('SERVE_THREADS', '0'))
+    SERVE_IO_RATIO = float(os.getenv('SERVE_IO_RATIO', '3'))
+    SERVE_TIMEOUT = int(os.getenv('SERVE_TIMEOUT', '30'))
+    SERVE_GRACEFUL_TIMEOUT = int(os.getenv('SERVE_GRACEFUL_TIMEOUT', '30'))
+    SERVE_KEEPALIVE = int(os.getenv('SERVE_KEEPALIVE', '5'))
+    # Workers restart after this many requests, plus up to the jitter, so
+    # they do not all restart together; 0 never recycles them
+    SERVE_MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', '10000'))
+    SERVE_MAX_REQUESTS_JITTER = int(os.getenv('SERVE_MAX_REQUESTS_JITTER', '1000'))
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    # Verified token claims kept per process (0 disables the cache)
+    JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', '10000'))
+    # Bloom filter over revoked token ids: sized for this many revocations at
+    # this false positive rate, and refreshed from the database this often
+    JWT_BLOCKLIST_CAPACITY = int(os.getenv('JWT_BLOCKLIST_CAPACITY', '100000'))
+    JWT_BLOCKLIST_ERROR_RATE = float(os.getenv('JWT_BLOCKLIST_ERROR_RATE', '0.001'))
+    JWT_BLOCKLIST_REFRESH_SECONDS = float(os.getenv('JWT_BLOCKLIST_REFRESH_SECONDS', '5'))
+    # Each refresh rereads revocations this far behind the newest it has
+    # seen, for transactions that commit late and clocks that disagree
+    JWT_BLOCKLIST_OVERLAP_SECONDS = float(os.getenv('JWT_BLOCKLIST_OVERLAP_SECONDS', '60'))
+    # Deleted todos are reported by /api/todos/changes for this long; older
+    # sync tokens get 410 and must resync (`flask prune-tombstones`)
+    TOMBSTONE_RETENTION_DAYS = int(os.getenv('TOMBSTONE_RETENTION_DAYS', '30'))
+
+    # bcrypt work factor; stored hashes with another cost are upgraded on login
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))
+    # Processes hashing passwords, per worker (0 hashes on the request thread;
+    # unset, the CPUs split between `flask serve`'s workers), and how many
+    # more hashes may wait before requests are rejected with 503
+    PASSWORD_HASH_POOL_SIZE = int(os.environ['PASSWORD_HASH_POOL_SIZE']) if os.getenv('PASSWORD_HASH_POOL_SIZE') else None
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
+    # Group commit: create/update/delete go through one writer thread per
+    # process, which applies up to WRITE_QUEUE_BATCH_SIZE of them in one
+    # transaction, waiting up to WRITE_QUEUE_MAX_WAIT_MS for a batch to fill
+    WRITE_QUEUE_ENABLED = os.getenv('WRITE_QUEUE_ENABLED', 'false').lower() == 'true'
+    WRITE_QUEUE_BATCH_SIZE = int(os.getenv('WRITE_QUEUE_BATCH_SIZE', '64'))
+    WRITE_QUEUE_MAX_WAIT_MS = float(os.getenv('WRITE_QUEUE_MAX_WAIT_MS', '0'))
+    WRITE_QUEUE_MAX_PENDING = int(os.getenv('WRITE_QUEUE_MAX_PENDING', '1024'))
+    WRITE_QUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_TIMEOUT', '30'))
+
+    # Encoded GET /api/todos bodies: 'local' (per process), 'redis' (shared,
+    # needs RESPONSE_CACHE_URL), 'memory' (in-process Redis stand-in) or 'none'
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'local')
+    RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL')
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '300'))
+
+    # 'auto' uses orjson when installed, 'orjson' requires it, 'default' is Flask's
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+    # Serve todo GETs from Core column tuples instead of hydrated ORM objects
+    READ_FAST_PATH = os.getenv('READ_FAST_PATH', 'true').lower() == 'true'
+
+    # gzip (or brotli, when installed and preferred) JSON responses of at
+    # least COMPRESSION_MIN_SIZE bytes for clients that accept it. Levels
+    # trade CPU for bytes: gzip 1-9, brotli 0-11
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', '6'))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+
+    # Per-route latency, status and SQL metrics in Prometheus format on
+    # METRICS_PATH. The endpoint answers only requests sending
+    # Authorization: Bearer METRICS_TOKEN, and is off while that is unset.
+    # METRICS_SERVER_TIMING also reports each response's query count and DB
+    # time to the client in a Server-Timing header; off by default, as that
+    # shows anyone how a route queries the database
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'false').lower() == 'true'
+
+    # Profile single requests: those sending X-Profile: PROFILING_TOKEN and a
+    # PROFILING_SAMPLE_RATE fraction of the rest, with 'cprofile' or
+    # 'sampling'. Dumps (the newest PROFILING_MAX_DUMPS) are listed on
+    # PROFILING_PATH for requests sending the token in X-Profile-Token
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+    PROFILING_PROFILER = os.getenv('PROFILING_PROFILER', 'cprofile')
+    PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))
+    PROFILING_DIR = os.getenv('PROFILING_DIR')
+    PROFILING_MAX_DUMPS = int(os.getenv('PROFILING_MAX_DUMPS', '50'))
+    PROFILING_PATH = os.getenv('PROFILING_PATH', '/admin/profiles')
+
+    # Statements slower than this many milliseconds are logged on 'app.sql'
+    # with redacted parameters and their query plan; 'off' disables the log
+    SLOW_QUERY_MS = None if os.getenv('SLOW_QUERY_MS', '200') == 'off' else float(os.getenv('SLOW_QUERY_MS', '200'))
+    SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+    # A SELECT repeated this many times in one request is reported as an N+1;
+    # 'warn' logs it, 'raise' fails the request (use in test suites), 'off'
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', '5'))
+    N_PLUS_ONE_MODE = os.getenv('N_PLUS_ONE_MODE', 'warn')
+
+    # Token buckets per endpoint: 'ip:COUNT/PERIOD' or 'user:COUNT/PERIOD'
+    # (JWT identity), several separated by ';'. Backend 'local' (per process),
+    # 'redis' (shared, needs RATE_LIMIT_URL), 'memory' (in-process Redis
+    # stand-in) or 'none' to turn limiting off
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+    RATE_LIMIT_URL = os.getenv('RATE_LIMIT_URL')
+    RATE_LIMIT_SHARDS = int(os.getenv('RATE_LIMIT_SHARDS', '16'))
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+    RATE_LIMITS = {
+        'auth.login': 'ip:10/minute',
+        'auth.register': 'ip:5/minute',
+        'todos.create_todo': 'user:120/minute',
+        'todos.update_todo': 'user:120/minute',
+        'todos.delete_todo': 'user:120/minute',
+        'todos.batch_todos': 'user:20/minute',
+    }
@@ -7,10 +7,18 @@ setup(
     install_requires=[
         'flask',
         'flask-sqlalchemy',
-        'flask-jwt-extended',
-        'flask-bcrypt',
+        # app/utils/jwt_cache.py overrides JWTManager._decode_jwt_from_config
+        'flask-jwt-extended>=4.6,<4.7',
+        'bcrypt',
         'flask-cors',
         'python-dotenv',
         'marshmallow'
     ],
+    extras_require={
+        # Faster JSON encoding; the app falls back to Flask's encoder without it
+        'fast': ['orjson'],
+        # `uvicorn asgi:app`; add asyncpg or aiomysql for server databases.
+        # SQLAlchemy 2.1 no longer installs greenlet, which its asyncio needs
+        'asgi': ['uvicorn', 'asgiref', 'aiosqlite', 'sqlalchemy[asyncio]>=2.1,<2.2'],
+    },
 )
@@ -3,3 +3,36 @@ import sys
 
 # Add the root directory to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Fail any request that repeats a SELECT past N_PLUS_ONE_THRESHOLD; read by
+# config.py, so it has to be set before the app modules are imported
+os.environ.setdefault('N_PLUS_ONE_MODE', 'raise')
+
+import pytest  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.utils.db_setup import create_schema  # noqa: E402
+from config import Config  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app from Config plus the given config overrides, on a SQLite
+    file in tmp_path unless SQLALCHEMY_DATABASE_URI is among them, with its
+    schema created. Call it again for a restarted app on the same files."""
+    apps = []
+
+    def make(**overrides):
+        attrs = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'todo.db'}"}
+        attrs.update(overrides)
+        app = create_app(type('TestConfig', (Config,), attrs))
+        create_schema(app)
+        apps.append(app)
+        return app
+
+    yield make
+
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
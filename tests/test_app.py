@@ -1,11 +1,32 @@
 ﻿import pytest
+import gzip
 import os
 import tempfile
-from app import create_app, db
+import threading
+import tracemalloc
+from app import create_app, db, password_hasher
+from config import Config
 from app.models.user import User
 from app.models.todo import Todo
+from app.models.token import RevokedToken
+from app.utils import json_provider
+from app.utils.blocklist import BloomFilter
+from app.utils.cache import InMemoryRedis, NullCache
+from app.utils.db_setup import create_schema
+from app.utils.hashing import hash_cost
+from app.utils.json_provider import init_json_provider
+from app.utils.pagination import encode_cursor
+from app.utils.jwt_cache import VerifiedTokenCache
+from app.utils.query_log import NPlusOneQueries, explain, install_query_log, log_slow_query, statement_shape
+from app.utils.rate_limit import LocalBuckets, RateLimiter, RedisBuckets, parse_rate_limit, parse_rate_limits
+from app.utils.todo_query import filter_todos, parse_list_args
+from app.utils.validation import ValidationFailed, compiled_schema
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
 
 @pytest.fixture
 def app():
@@ -14,8 +35,7 @@ def app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
     
     # Create tables
-    with app.app_context():
-        db.create_all()
+    create_schema(app)
         
     yield app
     
@@ -111,6 +131,27 @@ class TestAuth:
         })
         assert response.status_code == 400
 
+    def test_login_rehashes_stale_work_factor(self, app, client):
+        password_hasher.rounds = 4
+        client.post('/api/register', json={'email': 'rehash@example.com', 'password': 'password123'})
+
+        password_hasher.rounds = 5
+        response = client.post('/api/login', json={'email': 'rehash@example.com', 'password': 'password123'})
+        assert response.status_code == 200
+        with app.app_context():
+            user = User.query.filter_by(email='rehash@example.com').first()
+            assert hash_cost(user.password_hash) == 5
+
+    def test_login_rejected_when_hasher_saturated(self, client, monkeypatch):
+        client.post('/api/register', json={'email': 'busy@example.com', 'password': 'password123'})
+
+        full = threading.BoundedSemaphore(1)
+        full.acquire()
+        monkeypatch.setattr(password_hasher, '_slots', full)
+        response = client.post('/api/login', json={'email': 'busy@example.com', 'password': 'password123'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
 class TestTodos:
     def test_create_todo(self, client, auth_token):
         headers = {'Authorization': f'Bearer {auth_token}'}
@@ -215,4 +256,1116 @@ class TestTodos:
         # Try with invalid token
         headers = {'Authorization': 'Bearer invalid_token'}
         response = client.get('/api/todos', headers=headers)
-        assert response.status_code == 422
\ No newline at end of file
+        assert response.status_code == 422
+
+class TestPagination:
+    def test_cursor_walks_all_todos_once(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        for i in range(5):
+            client.post('/api/todos', json={'title': f'Todo {i}'}, headers=headers)
+
+        seen = []
+        response = client.get('/api/todos?limit=2', headers=headers)
+        while True:
+            assert response.status_code == 200
+            data = response.get_json()
+            assert len(data['items']) <= 2
+            seen.extend(todo['id'] for todo in data['items'])
+            if not data['next_cursor']:
+                break
+            response = client.get(f"/api/todos?limit=2&cursor={data['next_cursor']}", headers=headers)
+
+        assert len(seen) == 5
+        assert seen == sorted(seen)
+
+    def test_invalid_cursor(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        response = client.get('/api/todos?cursor=not-a-cursor', headers=headers)
+        assert response.status_code == 400
+
+    def test_invalid_limit(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        response = client.get('/api/todos?limit=0', headers=headers)
+        assert response.status_code == 400
+
+        response = client.get('/api/todos?limit=abc', headers=headers)
+        assert response.status_code == 400
+
+
+
+class TestFiltering:
+    @pytest.fixture
+    def seeded(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todos = [
+            {'title': 'A', 'priority': 'low', 'due_date': '2030-01-03T00:00:00'},
+            {'title': 'B', 'priority': 'high', 'due_date': '2030-01-01T00:00:00', 'completed': True},
+            {'title': 'C', 'priority': 'medium'},
+            {'title': 'D', 'priority': 'high', 'due_date': '2030-01-02T00:00:00'},
+            {'title': 'E', 'priority': 'low'},
+        ]
+        for todo in todos:
+            client.post('/api/todos', json=todo, headers=headers)
+        return headers
+
+    def titles(self, response):
+        assert response.status_code == 200
+        return [todo['title'] for todo in response.get_json()]
+
+    def test_filters(self, client, seeded):
+        assert self.titles(client.get('/api/todos?completed=true', headers=seeded)) == ['B']
+        assert self.titles(client.get('/api/todos?priority=low', headers=seeded)) == ['A', 'E']
+        response = client.get('/api/todos?due_after=2030-01-01T12:00:00&due_before=2030-01-03T00:00:00', headers=seeded)
+        assert self.titles(response) == ['D']
+
+    def test_sort(self, client, seeded):
+        assert self.titles(client.get('/api/todos?sort=-priority', headers=seeded)) == ['D', 'B', 'C', 'E', 'A']
+        assert self.titles(client.get('/api/todos?sort=due_date', headers=seeded)) == ['C', 'E', 'B', 'D', 'A']
+        assert self.titles(client.get('/api/todos?sort=-due_date', headers=seeded)) == ['A', 'D', 'B', 'E', 'C']
+
+    @pytest.mark.parametrize('sort', ['due_date', '-due_date', 'priority', '-priority', 'created_at'])
+    def test_cursor_pages_match_unpaged_order(self, client, seeded, sort):
+        expected = self.titles(client.get(f'/api/todos?sort={sort}', headers=seeded))
+
+        seen = []
+        response = client.get(f'/api/todos?sort={sort}&limit=2', headers=seeded)
+        while True:
+            data = response.get_json()
+            seen.extend(todo['title'] for todo in data['items'])
+            if not data['next_cursor']:
+                break
+            response = client.get(f"/api/todos?sort={sort}&limit=2&cursor={data['next_cursor']}", headers=seeded)
+
+        assert seen == expected
+
+    def test_invalid_arguments(self, client, seeded):
+        for query in ['completed=maybe', 'priority=urgent', 'due_before=tomorrow', 'sort=title']:
+            response = client.get(f'/api/todos?{query}', headers=seeded)
+            assert response.status_code == 400
+
+    def test_cursor_must_match_sort(self, client, seeded):
+        cursor = client.get('/api/todos?sort=due_date&limit=1', headers=seeded).get_json()['next_cursor']
+        response = client.get(f'/api/todos?sort=priority&limit=1&cursor={cursor}', headers=seeded)
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('sort', ['due_date', 'created_at'])
+    def test_cursor_with_non_string_date(self, client, seeded, sort):
+        cursor = encode_cursor(sort, 123, 5)
+        response = client.get(f'/api/todos?sort={sort}&limit=1&cursor={cursor}', headers=seeded)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid cursor'
+
+    @pytest.mark.parametrize('sort, value, last_id', [
+        ('id', None, True),
+        ('id', 'x', 5),
+        ('-priority', 'high', 5),
+        ('priority', 7, 5),
+        ('priority', False, 5),
+        ('due_date', ['2030-01-01'], 5),
+    ])
+    def test_cursor_values_checked_against_sort(self, client, seeded, sort, value, last_id):
+        cursor = encode_cursor(sort, value, last_id)
+        response = client.get(f'/api/todos?sort={sort}&limit=1&cursor={cursor}', headers=seeded)
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('query_string, index', [
+        ('sort=due_date&limit=10', 'ix_todo_user_due_date'),
+        ('sort=-priority&limit=10', 'ix_todo_user_priority_rank'),
+        ('sort=updated_at&limit=10', 'ix_todo_user_updated_at'),
+        ('completed=false&sort=due_date', 'ix_todo_user_completed_due_date'),
+        ('priority=high', 'ix_todo_user_priority'),
+    ])
+    def test_query_plan_uses_index(self, app, query_string, index):
+        with app.app_context():
+            params = parse_list_args(MultiDict(parse_qsl(query_string)))
+            query = filter_todos(Todo.query, 1, params)
+            if params['limit']:
+                query = query.limit(params['limit'])
+            compiled = query.statement.compile(dialect=db.engine.dialect)
+            args = tuple(compiled.params[name] for name in compiled.positiontup)
+            plan = db.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + compiled.string, args
+            ).all()
+
+        details = ' '.join(row[-1] for row in plan)
+        assert f'USING INDEX {index}' in details
+        assert 'SCAN todo' not in details
+        assert 'TEMP B-TREE' not in details
+
+
+class TestBatch:
+    def test_mixed_operations(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        first = client.post('/api/todos', json={'title': 'Keep'}, headers=headers).get_json()
+        second = client.post('/api/todos', json={'title': 'Drop'}, headers=headers).get_json()
+
+        response = client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': 'New', 'priority': 'high'}},
+            {'op': 'update', 'id': first['id'], 'data': {'completed': True}},
+            {'op': 'create', 'data': {'title': 'Newer', 'due_date': '2030-01-01T00:00:00'}},
+            {'op': 'delete', 'id': second['id']},
+        ]}, headers=headers)
+        assert response.status_code == 200
+        results = response.get_json()['results']
+        assert [result['status'] for result in results] == [201, 200, 201, 204]
+        assert results[0]['todo']['title'] == 'New'
+        assert results[0]['todo']['priority'] == 'high'
+        assert results[1]['todo']['completed'] is True
+        assert results[1]['todo']['updated_at'] >= first['updated_at']
+        assert results[2]['todo']['due_date'] == '2030-01-01T00:00:00'
+
+        titles = sorted(todo['title'] for todo in client.get('/api/todos', headers=headers).get_json())
+        assert titles == ['Keep', 'New', 'Newer']
+
+    def test_invalid_operation_rejects_whole_batch(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        response = client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': 'Valid'}},
+            {'op': 'create', 'data': {'title': 'Bad', 'priority': 'urgent'}},
+            {'op': 'delete', 'id': 9999},
+        ]}, headers=headers)
+        assert response.status_code == 400
+        results = response.get_json()['results']
+        assert [result['status'] for result in results] == [None, 400, 404]
+
+        assert client.get('/api/todos', headers=headers).get_json() == []
+
+    def test_empty_batch(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        response = client.post('/api/todos/batch', json={'operations': []}, headers=headers)
+        assert response.status_code == 400
+
+
+class TestConditionalGet:
+    def test_list_not_modified_until_write(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        client.post('/api/todos', json={'title': 'First'}, headers=headers)
+
+        response = client.get('/api/todos', headers=headers)
+        etag = response.headers['ETag']
+        assert response.status_code == 200
+
+        response = client.get('/api/todos', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.data == b''
+
+        client.post('/api/todos', json={'title': 'Second'}, headers=headers)
+        response = client.get('/api/todos', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        assert len(response.get_json()) == 2
+
+    def test_etag_depends_on_query(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        all_todos = client.get('/api/todos', headers=headers).headers['ETag']
+        completed = client.get('/api/todos?completed=true', headers=headers).headers['ETag']
+        assert all_todos != completed
+
+    def test_item_not_modified_without_loading_rows(self, app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todo_id = client.post('/api/todos', json={'title': 'Item'}, headers=headers).get_json()['id']
+        etag = client.get(f'/api/todos/{todo_id}', headers=headers).headers['ETag']
+
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = client.get(f'/api/todos/{todo_id}', headers={**headers, 'If-None-Match': etag})
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        assert response.status_code == 304
+        assert len(statements) == 1
+        assert 'FROM todo' not in statements[0]
+
+        client.put(f'/api/todos/{todo_id}', json={'completed': True}, headers=headers)
+        response = client.get(f'/api/todos/{todo_id}', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.get_json()['completed'] is True
+
+
+class TestResponseCache:
+    def test_hit_after_miss_and_invalidated_by_write(self, app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        client.post('/api/todos', json={'title': 'Cached'}, headers=headers)
+
+        first = client.get('/api/todos', headers=headers)
+        second = client.get('/api/todos', headers=headers)
+        assert first.headers['X-Cache'] == 'MISS'
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.data == first.data
+
+        client.post('/api/todos', json={'title': 'Fresh'}, headers=headers)
+        third = client.get('/api/todos', headers=headers)
+        assert third.headers['X-Cache'] == 'MISS'
+        assert len(third.get_json()) == 2
+
+        stats = app.extensions['response_cache'].stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+
+    def test_filters_are_cached_separately(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        client.post('/api/todos', json={'title': 'Open'}, headers=headers)
+
+        assert len(client.get('/api/todos', headers=headers).get_json()) == 1
+        response = client.get('/api/todos?completed=true', headers=headers)
+        assert response.headers['X-Cache'] == 'MISS'
+        assert response.get_json() == []
+
+
+class TestStreaming:
+    def create_todos(self, client, headers, count):
+        for start in range(0, count, 500):
+            client.post('/api/todos/batch', json={'operations': [
+                {'op': 'create', 'data': {'title': f'Todo {i}', 'description': 'x' * 100}}
+                for i in range(start, min(start + 500, count))
+            ]}, headers=headers)
+
+    def test_stream_matches_buffered_list(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        self.create_todos(client, headers, 1203)
+
+        buffered = client.get('/api/todos?priority=medium', headers=headers).get_json()
+        streamed = client.get('/api/todos?priority=medium&stream=true', headers=headers)
+        assert streamed.is_streamed
+        assert json.loads(streamed.data) == buffered
+        assert streamed.data == client.get('/api/todos?priority=medium', headers=headers).data
+
+        empty = client.get('/api/todos?completed=true&stream=true', headers=headers)
+        assert json.loads(empty.data) == []
+
+    def test_export(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        self.create_todos(client, headers, 3)
+
+        response = client.get('/api/todos/export', headers=headers)
+        assert response.status_code == 200
+        assert 'attachment' in response.headers['Content-Disposition']
+        assert [todo['title'] for todo in json.loads(response.data)] == ['Todo 0', 'Todo 1', 'Todo 2']
+
+        response = client.get('/api/todos/export?limit=10', headers=headers)
+        assert response.status_code == 400
+
+    def test_peak_memory_independent_of_collection_size(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+
+        def peak(url):
+            tracemalloc.start()
+            try:
+                response = client.get(url, headers=headers, buffered=False)
+                size = sum(len(chunk) for chunk in response.iter_encoded())
+                response.close()
+                return tracemalloc.get_traced_memory()[1], size
+            finally:
+                tracemalloc.stop()
+
+        self.create_todos(client, headers, 1000)
+        small_peak, small_size = peak('/api/todos/export')
+
+        self.create_todos(client, headers, 4000)
+        large_peak, large_size = peak('/api/todos/export')
+        buffered_peak, _ = peak('/api/todos')
+
+        assert large_size > 4 * small_size
+        # Five times the rows, but the streamed peak barely moves
+        assert large_peak < small_peak * 1.5
+        assert large_peak < buffered_peak / 3
+
+
+
+class TestReadFastPath:
+    @pytest.fixture(params=['default', 'orjson'])
+    def provider_app(self, request, app):
+        if request.param == 'orjson' and json_provider.orjson is None:
+            pytest.skip('orjson is not installed')
+        app.config['JSON_PROVIDER'] = request.param
+        init_json_provider(app)
+        app.extensions['response_cache'] = NullCache()
+        return app
+
+    def test_byte_for_byte_parity_with_to_dict(self, provider_app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        client.post('/api/todos', json={'title': 'Plain'}, headers=headers)
+        client.post('/api/todos', json={
+            'title': 'Caf\u00e9 \u2615', 'description': 'quote " and \\ slash',
+            'due_date': '2030-01-01T08:30:00.123456', 'priority': 'high', 'completed': True
+        }, headers=headers)
+        client.post('/api/todos', json={'title': 'Midnight', 'due_date': '2030-02-01T00:00:00'}, headers=headers)
+
+        urls = ['/api/todos', '/api/todos?limit=2', '/api/todos?sort=-due_date', '/api/todos?stream=true']
+        urls += [f"/api/todos/{todo['id']}" for todo in client.get('/api/todos', headers=headers).get_json()]
+
+        for url in urls:
+            provider_app.config['READ_FAST_PATH'] = True
+            fast = client.get(url, headers=headers).data
+            provider_app.config['READ_FAST_PATH'] = False
+            orm = client.get(url, headers=headers).data
+            assert fast == orm, url
+
+    def test_falls_back_without_orjson(self, app, monkeypatch):
+        monkeypatch.setattr(json_provider, 'orjson', None)
+
+        app.config['JSON_PROVIDER'] = 'auto'
+        assert isinstance(init_json_provider(app), DefaultJSONProvider)
+
+        app.config['JSON_PROVIDER'] = 'orjson'
+        with pytest.raises(RuntimeError):
+            init_json_provider(app)
+
+class TestSearch:
+    @pytest.fixture
+    def seeded(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todos = [
+            {'title': 'Buy milk', 'description': 'Semi-skimmed'},
+            {'title': 'Call the vet', 'description': 'Ask about milk for the kitten'},
+            {'title': 'Milk and bread'},
+            {'title': 'Café meeting', 'description': 'Quarterly planning'},
+        ]
+        for todo in todos:
+            client.post('/api/todos', json=todo, headers=headers)
+        return headers
+
+    def titles(self, response):
+        assert response.status_code == 200
+        return [todo['title'] for todo in response.get_json()['items']]
+
+    def test_ranks_title_matches_first(self, client, seeded):
+        titles = self.titles(client.get('/api/todos/search?q=milk', headers=seeded))
+        assert set(titles[:2]) == {'Buy milk', 'Milk and bread'}
+        assert titles[2] == 'Call the vet'
+
+    def test_prefix_diacritics_and_all_terms(self, client, seeded):
+        assert self.titles(client.get('/api/todos/search?q=quart', headers=seeded)) == []
+        assert self.titles(client.get('/api/todos/search?q=quart*', headers=seeded)) == ['Café meeting']
+        assert self.titles(client.get('/api/todos/search?q=cafe', headers=seeded)) == ['Café meeting']
+        assert self.titles(client.get('/api/todos/search?q=milk%20bread', headers=seeded)) == ['Milk and bread']
+
+    def test_fts_syntax_is_not_interpreted(self, client, seeded):
+        response = client.get('/api/todos/search?q=milk%20OR%20NEAR(%22x', headers=seeded)
+        assert response.status_code == 200
+        assert client.get('/api/todos/search?q=%20*%20', headers=seeded).status_code == 400
+
+    def test_index_follows_updates_and_deletes(self, client, seeded):
+        todo_id = client.get('/api/todos/search?q=vet', headers=seeded).get_json()['items'][0]['id']
+        client.put(f'/api/todos/{todo_id}', json={'title': 'Call the plumber', 'description': ''}, headers=seeded)
+        assert self.titles(client.get('/api/todos/search?q=vet', headers=seeded)) == []
+        assert self.titles(client.get('/api/todos/search?q=plumber', headers=seeded)) == ['Call the plumber']
+
+        client.delete(f'/api/todos/{todo_id}', headers=seeded)
+        assert self.titles(client.get('/api/todos/search?q=plumber', headers=seeded)) == []
+
+    def test_scoped_to_user(self, client, seeded):
+        other = {'email': 'other@example.com', 'password': 'password123'}
+        client.post('/api/register', json=other)
+        token = client.post('/api/login', json=other).get_json()['access_token']
+        response = client.get('/api/todos/search?q=milk', headers={'Authorization': f'Bearer {token}'})
+        assert self.titles(response) == []
+
+    def test_cursor_pages_match_single_page(self, client, seeded):
+        expected = self.titles(client.get('/api/todos/search?q=milk', headers=seeded))
+
+        seen = []
+        response = client.get('/api/todos/search?q=milk&limit=1', headers=seeded)
+        while True:
+            data = response.get_json()
+            seen.extend(todo['title'] for todo in data['items'])
+            if not data['next_cursor']:
+                break
+            response = client.get(f"/api/todos/search?q=milk&limit=1&cursor={data['next_cursor']}", headers=seeded)
+
+        assert seen == expected
+
+    @pytest.mark.parametrize('rank', [[1], {'a': 1}, '1', True, None])
+    def test_cursor_rank_must_be_a_number(self, client, seeded, rank):
+        cursor = encode_cursor('rank', rank, 1)
+        assert client.get(f'/api/todos/search?q=milk&cursor={cursor}', headers=seeded).status_code == 400
+
+class TestStats:
+    @pytest.fixture
+    def headers(self, auth_token):
+        return {'Authorization': f'Bearer {auth_token}'}
+
+    def stats(self, client, headers):
+        response = client.get('/api/todos/stats', headers=headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    def test_counters_follow_every_write_path(self, client, headers):
+        a = client.post('/api/todos', json={'title': 'A', 'priority': 'high'}, headers=headers).get_json()
+        b = client.post('/api/todos', json={'title': 'B', 'priority': 'low', 'completed': True}, headers=headers).get_json()
+        client.post('/api/todos', json={'title': 'C'}, headers=headers)
+        assert self.stats(client, headers) == {
+            'total': 3, 'completed': 1, 'active': 2, 'overdue': 0,
+            'by_priority': {'low': 1, 'medium': 1, 'high': 1}
+        }
+
+        client.put(f"/api/todos/{a['id']}", json={'completed': True, 'priority': 'low'}, headers=headers)
+        client.delete(f"/api/todos/{b['id']}", headers=headers)
+        assert self.stats(client, headers) == {
+            'total': 2, 'completed': 1, 'active': 1, 'overdue': 0,
+            'by_priority': {'low': 1, 'medium': 1, 'high': 0}
+        }
+
+        client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': 'D', 'priority': 'high', 'completed': True}},
+            {'op': 'update', 'id': a['id'], 'data': {'completed': False}},
+            {'op': 'delete', 'id': a['id'] + 2},
+        ]}, headers=headers)
+        assert self.stats(client, headers) == {
+            'total': 2, 'completed': 1, 'active': 1, 'overdue': 0,
+            'by_priority': {'low': 1, 'medium': 0, 'high': 1}
+        }
+
+    def test_overdue(self, client, headers):
+        client.post('/api/todos', json={'title': 'Late', 'due_date': '2000-01-01T00:00:00'}, headers=headers)
+        client.post('/api/todos', json={'title': 'Done late', 'due_date': '2000-01-01T00:00:00', 'completed': True}, headers=headers)
+        client.post('/api/todos', json={'title': 'Later', 'due_date': '2999-01-01T00:00:00'}, headers=headers)
+        assert self.stats(client, headers)['overdue'] == 1
+
+    def test_total_count_header(self, app, client, headers):
+        for todo in [{'title': 'A', 'priority': 'high'}, {'title': 'B', 'completed': True}, {'title': 'C'}]:
+            client.post('/api/todos', json=todo, headers=headers)
+
+        statements = []
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+        response = client.get('/api/todos?limit=1', headers=headers)
+        assert response.headers['X-Total-Count'] == '3'
+        assert not any('count(' in sql.lower() for sql in statements)
+
+        assert client.get('/api/todos?limit=1', headers=headers).headers['X-Total-Count'] == '3'  # cache hit
+        assert client.get('/api/todos?completed=false', headers=headers).headers['X-Total-Count'] == '2'
+        assert client.get('/api/todos?priority=medium', headers=headers).headers['X-Total-Count'] == '2'
+        assert 'X-Total-Count' not in client.get('/api/todos?due_before=2030-01-01T00:00:00', headers=headers).headers
+
+    def test_reconcile_fixes_drift(self, app, client, headers):
+        from app.utils.stats import reconcile_stats
+        client.post('/api/todos', json={'title': 'A', 'completed': True}, headers=headers)
+        client.post('/api/todos', json={'title': 'B', 'priority': 'high'}, headers=headers)
+        expected = self.stats(client, headers)
+
+        db.session.execute(User.__table__.update().values(todo_count=99, completed_count=0, high_priority_count=5))
+        db.session.commit()
+        assert self.stats(client, headers)['total'] == 99
+
+        db.session.remove()  # start fresh, as the CLI command does
+        assert reconcile_stats() == 1
+        assert reconcile_stats() == 0
+        assert self.stats(client, headers) == expected
+
+        db.session.remove()
+        result = app.test_cli_runner().invoke(args=['reconcile-stats'])
+        assert '0 user(s) corrected' in result.output
+
+class TestMetrics:
+    def test_server_timing_counts_queries(self, app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todo = client.post('/api/todos', json={'title': 'Timed'}, headers=headers).get_json()
+        # Opt-in: it tells any client how the route queries the database
+        assert 'Server-Timing' not in client.get(f"/api/todos/{todo['id']}", headers=headers).headers
+        app.config['METRICS_SERVER_TIMING'] = True
+
+        statements = []
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+        timing = client.get(f"/api/todos/{todo['id']}", headers=headers).headers['Server-Timing']
+        db_part, app_part, total_part = timing.split(', ')
+        assert db_part.startswith('db;dur=') and app_part.startswith('app;dur=') and total_part.startswith('total;dur=')
+        assert statements and f'desc="{len(statements)} queries"' in db_part
+
+    @pytest.fixture
+    def scraper(self, app):
+        app.config['METRICS_TOKEN'] = 'scrape-me'
+        return {'Authorization': 'Bearer scrape-me'}
+
+    def test_prometheus_exposition(self, client, auth_token, scraper):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todo = client.post('/api/todos', json={'title': 'Counted'}, headers=headers).get_json()
+        client.get(f"/api/todos/{todo['id']}", headers=headers)
+        client.get(f"/api/todos/{todo['id'] + 1000}", headers=headers)
+
+        response = client.get('/metrics', headers=scraper)
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+        text = response.get_data(as_text=True)
+        route = 'method="GET",route="/api/todos/<int:todo_id>"'
+        assert f'http_request_duration_seconds_count{{{route}}} 2' in text
+        assert f'http_requests_total{{{route},status="200"}} 1' in text
+        assert f'http_requests_total{{{route},status="404"}} 1' in text
+        assert f'db_queries_per_request_bucket{{{route},le="10"}} 2' in text
+        assert '# TYPE db_time_seconds_per_request histogram' in text
+
+    def test_response_cache_counters(self, client, auth_token, scraper):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+
+        def counters():
+            text = client.get('/metrics', headers=scraper).get_data(as_text=True)
+            return {line.split('{')[0]: int(line.rsplit(' ', 1)[1])
+                    for line in text.splitlines() if line.startswith('response_cache_')}
+
+        client.post('/api/todos', json={'title': 'Cached'}, headers=headers)
+        before = counters()
+        client.get('/api/todos', headers=headers)
+        client.get('/api/todos', headers=headers)
+        after = counters()
+        assert after['response_cache_hits_total'] - before['response_cache_hits_total'] == 1
+        assert after['response_cache_misses_total'] - before['response_cache_misses_total'] == 1
+        assert after['response_cache_entries'] >= 1
+
+    def test_endpoint_needs_the_token(self, app, client, auth_token):
+        assert client.get('/metrics').status_code == 404
+        assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 404
+
+        app.config['METRICS_TOKEN'] = 'scrape-me'
+        assert client.get('/metrics').status_code == 403
+        assert client.get('/metrics', headers={'Authorization': f'Bearer {auth_token}'}).status_code == 403
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
+
+    def test_disabled(self):
+        config = type('NoMetricsConfig', (Config,), {'TESTING': True, 'METRICS_ENABLED': False})
+        app = create_app(config)
+        client = app.test_client()
+        assert client.get('/metrics').status_code == 404
+        assert 'Server-Timing' not in client.get('/api/swagger.json').headers
+
+
+class TestProfiling:
+    def make_client(self, tmp_path, **overrides):
+        attrs = {'TESTING': True, 'PROFILING_ENABLED': True, 'PROFILING_TOKEN': 'let-me-in',
+                 'PROFILING_DIR': str(tmp_path)}
+        attrs.update(overrides)
+        return create_app(type('ProfilingConfig', (Config,), attrs)).test_client()
+
+    def test_token_header_profiles_request(self, tmp_path):
+        import pstats
+        client = self.make_client(tmp_path)
+        assert 'X-Profile-Id' not in client.get('/api/swagger.json', headers={'X-Profile': 'guess'}).headers
+
+        response = client.get('/api/swagger.json', headers={'X-Profile': 'let-me-in', 'X-Request-ID': 'abc-123'})
+        name = response.headers['X-Profile-Id']
+        assert name.endswith('-GET-api_swagger_json-abc-123.prof')
+        assert pstats.Stats(str(tmp_path / name)).total_calls > 0
+
+        assert client.get('/admin/profiles').status_code == 403
+        admin = {'X-Profile-Token': 'let-me-in'}
+        listing = client.get('/admin/profiles', headers=admin).get_json()
+        assert [(dump['name'], dump['route'], dump['request_id']) for dump in listing] == [(name, 'api_swagger_json', 'abc-123')]
+        download = client.get(f'/admin/profiles/{name}', headers=admin)
+        assert download.status_code == 200 and download.data == (tmp_path / name).read_bytes()
+        assert client.get('/admin/profiles/..%2Fconfig.py', headers=admin).status_code == 404
+
+    def test_sampled_dumps_are_a_bounded_ring(self, tmp_path):
+        client = self.make_client(tmp_path, PROFILING_SAMPLE_RATE=1.0, PROFILING_PROFILER='sampling',
+                                  PROFILING_INTERVAL_MS=0.5, PROFILING_MAX_DUMPS=2)
+        names = [client.get('/api/swagger.json').headers['X-Profile-Id'] for _ in range(3)]
+        assert all(name.endswith('.folded') for name in names)
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted(names[1:])
+
+    def test_listing_skips_foreign_files(self, tmp_path):
+        client = self.make_client(tmp_path)
+        name = client.get('/api/swagger.json', headers={'X-Profile': 'let-me-in'}).headers['X-Profile-Id']
+        for stray in ('.DS_Store', 'notes.prof', f'{name}.tmp', '.dump.prof.swp', 'x-GET-route-id.prof'):
+            (tmp_path / stray).write_text('not a dump')
+
+        admin = {'X-Profile-Token': 'let-me-in'}
+        response = client.get('/admin/profiles', headers=admin)
+        assert response.status_code == 200
+        assert [dump['name'] for dump in response.get_json()] == [name]
+        assert client.get('/admin/profiles/notes.prof', headers=admin).status_code == 404
+
+    def test_disabled_by_default(self, client):
+        assert 'X-Profile-Id' not in client.get('/api/swagger.json', headers={'X-Profile': ''}).headers
+        assert client.get('/admin/profiles').status_code == 404
+
+
+class TestQueryLog:
+    def test_slow_query_log_redacts_parameters(self, app, client, caplog):
+        with app.app_context():
+            install_query_log(db.engine, slow_query_ms=0)
+        credentials = {'email': 'private@example.com', 'password': 'password123'}
+        client.post('/api/register', json=credentials)
+        token = client.post('/api/login', json=credentials).get_json()['access_token']
+
+        with caplog.at_level('WARNING', logger='app.sql'):
+            client.get('/api/todos?due_before=2031-05-04T00:00:00', headers={'Authorization': f'Bearer {token}'})
+            client.post('/api/login', json=credentials)
+
+        messages = [record.getMessage() for record in caplog.records if record.name == 'app.sql']
+        assert any('FROM todo' in message and 'USING INDEX' in message for message in messages)
+        assert all('Slow query' in message and '| plan: ' in message for message in messages)
+        assert not any('private@example.com' in message or '2031' in message for message in messages)
+
+    def test_failed_explain_is_rolled_back_to_a_savepoint(self):
+        executed = []
+
+        class Cursor:
+            def execute(self, statement, parameters=None):
+                executed.append(statement.split()[0])
+                if statement.startswith('EXPLAIN'):
+                    raise RuntimeError('could not determine data type of parameter $1')
+
+            def close(self):
+                pass
+
+        class Connection:
+            dialect = type('Dialect', (), {'name': 'postgresql'})
+            connection = type('DBAPIConnection', (), {'cursor': lambda self: Cursor()})()
+
+            def in_transaction(self):
+                return True
+
+        with pytest.raises(RuntimeError):
+            explain(Connection(), 'SELECT 1 WHERE 1 = %s', ('x',))
+        assert executed == ['SAVEPOINT', 'EXPLAIN', 'ROLLBACK', 'RELEASE']
+
+        log_slow_query(Connection(), 'SELECT 1 WHERE 1 = %s', ('x',), False, 1.0)
+
+    def test_n_plus_one_raises_in_strict_mode(self, app, client, caplog):
+        @app.route('/n-plus-one')
+        def n_plus_one():
+            for todo_id in range(app.config['N_PLUS_ONE_THRESHOLD']):
+                db.session.get(Todo, todo_id + 1)
+            return {}
+
+        assert app.config['N_PLUS_ONE_MODE'] == 'raise'
+        with pytest.raises(NPlusOneQueries, match='GET /n-plus-one'):
+            client.get('/n-plus-one')
+
+        app.config['N_PLUS_ONE_MODE'] = 'warn'
+        with caplog.at_level('WARNING', logger='app.sql'):
+            assert client.get('/n-plus-one').status_code == 200
+        assert any('Possible N+1 in GET /n-plus-one' in record.getMessage() for record in caplog.records)
+
+    def test_in_lists_share_a_shape(self):
+        assert statement_shape('SELECT * FROM todo WHERE id IN (?, ?, ?)') == statement_shape('SELECT * FROM todo WHERE id IN (?, ?)')
+        assert statement_shape('WHERE id IN (%(id_1)s, %(id_2)s)') == 'WHERE id IN (...)'
+
+
+class TestStartup:
+    def test_create_app_leaves_schema_to_init_db(self, tmp_path):
+        config = type('FreshConfig', (Config,), {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'fresh.db'}",
+        })
+        app = create_app(config)
+        with app.app_context():
+            assert not db.inspect(db.engine).get_table_names()
+
+        result = app.test_cli_runner().invoke(args=['init-db'])
+        assert result.exit_code == 0
+        with app.app_context():
+            assert {'user', 'todo', 'todo_fts'} <= set(db.inspect(db.engine).get_table_names())
+            db.engine.dispose()
+
+    def test_init_db_upgrades_an_existing_database(self, tmp_path):
+        config = type('FreshConfig', (Config,), {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'old.db'}",
+        })
+        app = create_app(config)
+        with app.app_context():
+            # The schema as the first release created it
+            with db.engine.begin() as connection:
+                for statement in [
+                    'CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL UNIQUE, '
+                    'password_hash VARCHAR(128), created_at DATETIME)',
+                    'CREATE TABLE todo (id INTEGER PRIMARY KEY, title VARCHAR(100) NOT NULL, description VARCHAR(200), '
+                    'completed BOOLEAN, due_date DATETIME, priority VARCHAR(20), created_at DATETIME, '
+                    'updated_at DATETIME, user_id INTEGER NOT NULL REFERENCES user (id))',
+                    "INSERT INTO user VALUES (1, 'old@example.com', NULL, '2024-01-01 00:00:00')",
+                    "INSERT INTO todo VALUES (1, 'A', NULL, 1, NULL, 'high', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1)",
+                    "INSERT INTO todo VALUES (2, 'B', NULL, 0, NULL, 'low', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1)",
+                ]:
+                    connection.exec_driver_sql(statement)
+
+        for _ in range(2):
+            result = app.test_cli_runner().invoke(args=['init-db'])
+            assert result.exit_code == 0, result.output
+        with app.app_context():
+            user = db.session.get(User, 1)
+            assert (user.todos_version, user.tombstone_floor) == (0, 0)
+            assert (user.todo_count, user.completed_count, user.high_priority_count, user.low_priority_count) == (2, 1, 1, 1)
+            assert {todo.change_seq for todo in Todo.query} == {0}
+            indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('todo')}
+            assert {'ix_todo_user_due_date', 'ix_todo_user_change_seq'} <= indexes
+            db.session.remove()
+            db.engine.dispose()
+
+    def test_openapi_document_is_precomputed(self, client):
+        response = client.get('/api/swagger.json')
+        assert response.status_code == 200
+        assert response.cache_control.public and response.cache_control.max_age == 3600
+        assert client.get('/api/swagger.json', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+        spec = response.get_json()
+        schemas = spec['components']['schemas']
+        assert schemas['Todo']['properties']['priority']['enum'] == ['low', 'medium', 'high']
+        assert schemas['Todo']['properties']['id']['readOnly'] is True
+        assert schemas['User']['properties']['password'] == {'type': 'string', 'writeOnly': True, 'minLength': 6}
+        assert spec['paths']['/api/login']['post']['requestBody']['content']['application/json']['schema'] == {'$ref': '#/components/schemas/Login'}
+        assert client.get('/api/swagger.json').get_data() == response.get_data()
+
+        export = spec['paths']['/api/todos/export']['get']
+        assert [parameter['name'] for parameter in export['parameters']] == ['completed', 'priority', 'due_before', 'due_after', 'sort']
+        assert export['responses']['200']['content']['application/json']['schema']['type'] == 'array'
+
+
+class TestRateLimit:
+    def test_login_limited_by_ip(self, app, client):
+        app.extensions['rate_limiter'].limits = parse_rate_limits({'auth.login': 'ip:3/minute'})
+        credentials = {'email': 'limited@example.com', 'password': 'password123'}
+        client.post('/api/register', json=credentials)
+
+        statuses = [client.post('/api/login', json=credentials).status_code for _ in range(3)]
+        assert statuses == [200, 200, 200]
+        response = client.post('/api/login', json=credentials)
+        assert response.status_code == 429
+        # 20s per token, less however long the three logins took
+        assert 1 <= int(response.headers['Retry-After']) <= 20
+        assert response.get_json() == {'error': 'Too many requests, please retry later'}
+
+        other = client.post('/api/login', json=credentials, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        assert other.status_code == 200
+
+    def test_writes_limited_per_user(self, app, client, auth_token):
+        app.extensions['rate_limiter'].limits = parse_rate_limits({'todos.create_todo': 'user:2/minute'})
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        statuses = [client.post('/api/todos', json={'title': 'Hi'}, headers=headers).status_code for _ in range(3)]
+        assert statuses == [201, 201, 429]
+
+        other = {'email': 'other@example.com', 'password': 'password123'}
+        client.post('/api/register', json=other)
+        token = client.post('/api/login', json=other).get_json()['access_token']
+        response = client.post('/api/todos', json={'title': 'Hi'}, headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 201
+
+    def test_bucket_refills(self):
+        now = [0.0]
+        for buckets in (LocalBuckets(clock=lambda: now[0]), RedisBuckets(InMemoryRedis(), clock=lambda: now[0])):
+            now[0] = 0.0
+            limit = parse_rate_limit('ip:2/second')
+            assert [buckets.take('k', limit.rate, limit.burst)[0] for _ in range(3)] == [True, True, False]
+            assert buckets.take('k', limit.rate, limit.burst)[1] == pytest.approx(0.5)
+            now[0] = 0.5
+            assert buckets.take('k', limit.rate, limit.burst) == (True, 0.0)
+            now[0] = 60.0
+            assert [buckets.take('k', limit.rate, limit.burst)[0] for _ in range(3)] == [True, True, False]
+
+    def test_rejected_request_takes_no_tokens(self):
+        now = [0.0]
+        for buckets in (LocalBuckets(clock=lambda: now[0]), RedisBuckets(InMemoryRedis(), clock=lambda: now[0])):
+            limiter = RateLimiter(buckets, parse_rate_limits({'todos.create_todo': 'ip:1/minute; user:3/minute'}))
+            assert limiter.check('todos.create_todo', '10.0.0.1', 1) is None
+            # Locked out by IP; the user's bucket keeps its two tokens
+            assert all(limiter.check('todos.create_todo', '10.0.0.1', 1) for _ in range(5))
+            assert limiter.check('todos.create_todo', '10.0.0.2', 1) is None
+            assert limiter.check('todos.create_todo', '10.0.0.3', 1) is None
+            assert limiter.check('todos.create_todo', '10.0.0.4', 1) == pytest.approx(20.0)
+            # Refunds never overfill a bucket
+            assert buckets.take('full', 1.0, 2, cost=-1) == (True, 0.0)
+            assert [buckets.take('full', 1.0, 2)[0] for _ in range(3)] == [True, True, False]
+
+    def test_local_buckets_are_bounded(self):
+        now = [0.0]
+        buckets = LocalBuckets(shards=2, max_keys=10, clock=lambda: now[0])
+        for index in range(100):
+            buckets.take(f'ip:{index}', 1.0, 5)
+        assert len(buckets) <= 10
+
+    def test_invalid_rules(self):
+        assert parse_rate_limit('user:120/minute') == ('user', 2.0, 120)
+        for rule in ('host:1/minute', 'ip:0/minute', 'ip:ten/minute', 'ip:10/fortnight', 'ip'):
+            with pytest.raises(ValueError):
+                parse_rate_limit(rule)
+
+
+class TestSync:
+    def sync(self, client, headers, since=None, limit=None):
+        items, deleted = [], []
+        while True:
+            query = {key: value for key, value in (('since', since), ('limit', limit)) if value}
+            response = client.get('/api/todos/changes', query_string=query, headers=headers)
+            assert response.status_code == 200
+            body = response.get_json()
+            items += body['items']
+            deleted += body['deleted']
+            since = body['next_since']
+            if not body['has_more']:
+                return items, deleted, since
+
+    def test_changes_since_token(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        ids = [client.post('/api/todos', json={'title': f'Todo {i}'}, headers=headers).get_json()['id'] for i in range(5)]
+
+        items, deleted, since = self.sync(client, headers, limit=2)
+        assert [item['id'] for item in items] == ids and deleted == []
+        assert self.sync(client, headers, since)[:2] == ([], [])
+
+        client.put(f'/api/todos/{ids[1]}', json={'completed': True}, headers=headers)
+        client.delete(f'/api/todos/{ids[2]}', headers=headers)
+        client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': 'Batched'}},
+            {'op': 'update', 'id': ids[0], 'data': {'title': 'Renamed'}},
+            {'op': 'delete', 'id': ids[3]},
+        ]}, headers=headers)
+
+        items, deleted, since = self.sync(client, headers, since, limit=1)
+        assert [(item['id'], item['title'], item['completed']) for item in items] == [
+            (ids[1], 'Todo 1', True), (ids[0], 'Renamed', False), (ids[4] + 1, 'Batched', False)
+        ]
+        assert deleted == [ids[2], ids[3]]
+        assert self.sync(client, headers, since)[:2] == ([], [])
+
+        # A full sync lists only what is still there
+        items, deleted, _ = self.sync(client, headers)
+        assert sorted(item['id'] for item in items) == [ids[0], ids[1], ids[4], ids[4] + 1] and deleted == []
+
+    def test_pruned_tombstones_expire_old_tokens(self, app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todo_id = client.post('/api/todos', json={'title': 'Doomed'}, headers=headers).get_json()['id']
+        _, _, since = self.sync(client, headers)
+        client.delete(f'/api/todos/{todo_id}', headers=headers)
+
+        db.session.remove()
+        result = app.test_cli_runner().invoke(args=['prune-tombstones', '--days', '30'])
+        assert 'Pruned 0 tombstone(s)' in result.output
+        assert self.sync(client, headers, since)[1] == [todo_id]
+
+        db.session.remove()
+        result = app.test_cli_runner().invoke(args=['prune-tombstones', '--days', '0'])
+        assert 'Pruned 1 tombstone(s)' in result.output
+        response = client.get('/api/todos/changes', query_string={'since': since}, headers=headers)
+        assert response.status_code == 410
+        assert self.sync(client, headers)[:2] == ([], [])
+
+    def test_invalid_token(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        assert client.get('/api/todos/changes?since=bogus', headers=headers).status_code == 400
+        assert client.get('/api/todos/changes?limit=0', headers=headers).status_code == 400
+        for change_seq in ['3', None, True]:
+            since = encode_cursor('changes', change_seq, 1)
+            assert client.get(f'/api/todos/changes?since={since}', headers=headers).status_code == 400
+
+
+class TestCompression:
+    def add_todos(self, client, headers, count):
+        client.post('/api/todos/batch', json={'operations': [
+            {'op': 'create', 'data': {'title': f'Todo {i}', 'description': 'Compressible text'}} for i in range(count)
+        ]}, headers=headers)
+
+    def test_list_gzipped_when_accepted(self, app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        self.add_todos(client, headers, 20)
+        app.config['METRICS_SERVER_TIMING'] = True
+        plain = client.get('/api/todos', headers=headers)
+        assert 'Content-Encoding' not in plain.headers and plain.headers['Vary'].endswith('Accept-Encoding')
+
+        response = client.get('/api/todos', headers=dict(headers, **{'Accept-Encoding': 'gzip, deflate'}))
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.get_data()) == plain.get_data()
+        assert len(response.get_data()) < len(plain.get_data()) / 3
+        assert response.headers['ETag'] == f"W/{plain.headers['ETag']}"
+        # The view's cache headers are kept, and Server-Timing, added after compression, too
+        assert response.headers['Cache-Control'] == plain.headers['Cache-Control'] == 'private, no-cache'
+        assert 'Server-Timing' in response.headers
+
+        # Either form of the tag revalidates
+        for etag in (response.headers['ETag'], plain.headers['ETag']):
+            assert client.get('/api/todos', headers=dict(headers, **{'If-None-Match': etag})).status_code == 304
+
+        refused = client.get('/api/todos', headers=dict(headers, **{'Accept-Encoding': 'gzip;q=0'}))
+        assert 'Content-Encoding' not in refused.headers
+
+    def test_small_bodies_sent_as_is(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}', 'Accept-Encoding': 'gzip'}
+        todo_id = client.post('/api/todos', json={'title': 'Small'}, headers=headers).get_json()['id']
+        response = client.get(f'/api/todos/{todo_id}', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_json()['title'] == 'Small'
+
+    def test_streamed_list_compressed_in_chunks(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        self.add_todos(client, headers, 30)
+        plain = client.get('/api/todos?stream=true', headers=headers).get_data()
+
+        response = client.get('/api/todos?stream=true', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+        assert response.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in response.headers
+        assert gzip.decompress(response.get_data()) == plain
+
+    def test_openapi_document_compressed_once(self, app, client):
+        headers = {'Accept-Encoding': 'gzip'}
+        response = client.get('/api/swagger.json', headers=headers)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['ETag'].endswith('-gzip"')
+        assert json.loads(gzip.decompress(response.get_data())) == client.get('/api/swagger.json').get_json()
+
+        compressed = app.extensions['openapi'].compressed.get('gzip')
+        assert client.get('/api/swagger.json', headers=headers).get_data() == compressed
+        assert app.extensions['openapi'].compressed.get('gzip') is compressed
+        assert client.get('/api/swagger.json', headers=dict(headers, **{'If-None-Match': response.headers['ETag']})).status_code == 304
+
+
+class TestValidation:
+    PAYLOADS = [
+        {'title': 'Plain'},
+        {'title': 'Full', 'description': 'd', 'completed': True, 'priority': 'high', 'due_date': '2030-01-01T09:30:00'},
+        {'title': 'Loose types', 'completed': 'yes', 'due_date': None, 'id': 7, 'unknown': 1},
+        {'title': ''},
+        {'title': 5, 'priority': 'urgent', 'completed': 'maybe'},
+        {'description': None, 'due_date': 'tomorrow'},
+        {'title': 'Aware', 'due_date': '2030-01-01T09:30:00+02:00'},
+        {},
+    ]
+
+    def marshmallow_load(self, name, data, partial):
+        import app.schemas
+        from marshmallow import EXCLUDE, ValidationError
+        try:
+            return app.schemas.__dict__[name]().load(data, partial=partial, unknown=EXCLUDE)
+        except ValidationError as e:
+            return e.messages
+
+    def compiled_load(self, name, data, partial):
+        try:
+            return compiled_schema(name).load(data, partial)
+        except ValidationFailed as e:
+            return e.errors
+
+    def test_compiled_schema_matches_marshmallow(self):
+        for partial in (False, True):
+            for data in self.PAYLOADS:
+                assert self.compiled_load('TodoSchema', data, partial) == self.marshmallow_load('TodoSchema', data, partial)
+        for data in [{'email': 'a@example.com', 'password': 'secret1'}, {'email': 'nope', 'password': '123'},
+                     {'email': 'a@example.com'}, {'email': None, 'password': ['x']}]:
+            for name in ('UserSchema', 'LoginSchema'):
+                assert self.compiled_load(name, data, False) == self.marshmallow_load(name, data, False)
+        assert self.compiled_load('TodoSchema', ['not', 'an', 'object'], False) == {'_schema': ['Invalid input type.']}
+
+    def test_routes_return_errors_per_field(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        response = client.post('/api/todos', json={'priority': 'urgent', 'due_date': 'soon'}, headers=headers)
+        assert response.status_code == 400
+        assert response.get_json()['errors'] == {
+            'title': ['Missing data for required field.'],
+            'due_date': ['Not a valid datetime.'],
+            'priority': ['Must be one of: low, medium, high.'],
+        }
+
+        response = client.post('/api/register', json={'email': 'nope', 'password': '123'})
+        assert set(response.get_json()['errors']) == {'email', 'password'}
+
+    def test_partial_update_writes_only_given_fields(self, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        todo = client.post('/api/todos', json={'title': 'Keep', 'priority': 'high', 'due_date': '2030-01-01T00:00:00'},
+                           headers=headers).get_json()
+        assert todo['description'] == '' and todo['completed'] is False
+
+        updated = client.put(f"/api/todos/{todo['id']}", json={'completed': True, 'due_date': None}, headers=headers).get_json()
+        assert (updated['title'], updated['priority'], updated['completed'], updated['due_date']) == ('Keep', 'high', True, None)
+
+
+class TestTokens:
+    def login(self, client):
+        credentials = {'email': 'test@example.com', 'password': 'password123'}
+        return {'Authorization': f"Bearer {client.post('/api/login', json=credentials).get_json()['access_token']}"}
+
+    def test_repeated_token_verified_once(self, app, client, auth_token, monkeypatch):
+        from flask_jwt_extended import JWTManager
+        decoded = []
+        original = JWTManager._decode_jwt_from_config
+        monkeypatch.setattr(JWTManager, '_decode_jwt_from_config',
+                            lambda self, *args, **kwargs: decoded.append(1) or original(self, *args, **kwargs))
+
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        for _ in range(3):
+            assert client.get('/api/todos', headers=headers).status_code == 200
+        assert len(decoded) == 1
+        assert app.extensions['jwt_cache'].hits == 2
+
+        # A tampered token is not a cache hit and fails verification
+        assert client.get('/api/todos', headers={'Authorization': f'Bearer {auth_token[:-2]}xx'}).status_code == 422
+
+    def test_logout_revokes_only_that_token(self, app, client, auth_token):
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        other = self.login(client)
+        blocklist = app.extensions['token_blocklist']
+        assert client.get('/api/todos', headers=headers).status_code == 200
+        assert blocklist.lookups == 0
+
+        assert client.post('/api/logout', headers=headers).status_code == 200
+        response = client.get('/api/todos', headers=headers)
+        assert response.status_code == 401 and response.get_json()['msg'] == 'Token has been revoked'
+        assert client.get('/api/todos', headers=other).status_code == 200
+
+    def test_revocations_from_other_workers_picked_up(self, app, client, auth_token):
+        from flask_jwt_extended import decode_token
+        headers = {'Authorization': f'Bearer {auth_token}'}
+        blocklist = app.extensions['token_blocklist']
+        assert client.get('/api/todos', headers=headers).status_code == 200
+
+        claims = decode_token(auth_token)
+        db.session.add(RevokedToken(jti=claims['jti'], user_id=int(claims['sub']), expires_at=datetime(2100, 1, 1)))
+        db.session.commit()
+        # Until the next refresh this process has not heard of it
+        assert client.get('/api/todos', headers=headers).status_code == 200
+        blocklist.clock = lambda: float('inf')
+        assert client.get('/api/todos', headers=headers).status_code == 401
+
+    def test_late_committed_revocations_picked_up(self, app):
+        from app.utils.blocklist import TokenBlocklist
+        now = [0.0]
+        blocklist = TokenBlocklist(refresh_interval=5, overlap=60, clock=lambda: now[0])
+        stamp = datetime(2030, 1, 1, 12, 0, 0)
+        with app.app_context():
+            db.session.add(RevokedToken(jti='seen', user_id=1, expires_at=datetime(2100, 1, 1), revoked_at=stamp))
+            db.session.commit()
+            blocklist.refresh()
+            # Stamped before 'seen' but committed after it, as a slower
+            # transaction on a server database would be
+            for jti, seconds in (('late', 30), ('too-late', 90)):
+                db.session.add(RevokedToken(jti=jti, user_id=1, expires_at=datetime(2100, 1, 1),
+                                            revoked_at=stamp - timedelta(seconds=seconds)))
+            db.session.commit()
+            now[0] = 10.0
+            blocklist.refresh()
+            assert 'late' in blocklist.bloom and 'too-late' not in blocklist.bloom
+            assert blocklist.bloom.count == 2
+
+    def test_revoked_in_memory_defers_to_the_database(self, app):
+        from app.utils.blocklist import TokenBlocklist
+        now = [0.0]
+        blocklist = TokenBlocklist(refresh_interval=5, clock=lambda: now[0])
+        assert blocklist.revoked_in_memory('jti') is None  # never refreshed
+        with app.app_context():
+            blocklist.refresh()
+        blocklist.bloom.add('revoked')
+        assert blocklist.revoked_in_memory('jti') is False
+        assert blocklist.revoked_in_memory('revoked') is None
+        now[0] = 10.0
+        assert blocklist.revoked_in_memory('jti') is None
+
+    def test_cache_entries_lapse_at_exp_and_are_bounded(self):
+        now = [1000.0]
+        cache = VerifiedTokenCache(max_entries=2, clock=lambda: now[0])
+        cache.set('a', {'sub': 1, 'exp': 1010})
+        assert cache.get('a') == {'sub': 1, 'exp': 1010}
+        now[0] = 1010
+        assert cache.get('a') is None
+
+        for token in 'bcd':
+            cache.set(token, {'exp': 2000})
+        assert len(cache) == 2 and cache.get('b') is None and cache.get('d') is not None
+
+    def test_bloom_filter_error_rate(self):
+        bloom = BloomFilter(10000, 0.001)
+        for i in range(10000):
+            bloom.add(f'revoked-{i}')
+        assert all(f'revoked-{i}' in bloom for i in range(10000))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        assert false_positives < 50
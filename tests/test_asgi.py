@@ -0,0 +1,271 @@
+import asyncio
+import gzip
+import json
+import os
+import pytest
+
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from app import create_app, db
+from app.asgi import async_database_uri
+from app.utils.db_setup import create_schema
+from app.utils.rate_limit import parse_rate_limits
+from config import Config
+
+
+@pytest.fixture
+def asgi_app(tmp_path):
+    config = type('AsgiConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'todo.db'}",
+    })
+    app = create_app(config, asgi=True)
+    create_schema(app.flask_app)
+
+    yield app
+
+    asyncio.run(app.engine.dispose())
+    with app.flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+async def call(app, method, path, body=None, headers=None, query=''):
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+                   + [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())],
+        'client': ('127.0.0.1', 1234),
+        'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    data = b''.join(m.get('body', b'') for m in sent[1:])
+    response_headers = {k.decode(): v.decode() for k, v in start['headers']}
+    if response_headers.get('content-encoding') == 'gzip':
+        data = gzip.decompress(data)
+    return start['status'], response_headers, json.loads(data) if data else None
+
+
+async def login(app, email='asgi@example.com'):
+    credentials = {'email': email, 'password': 'password123'}
+    await call(app, 'POST', '/api/register', credentials)
+    _, _, body = await call(app, 'POST', '/api/login', credentials)
+    return {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def test_async_database_uri():
+    assert str(async_database_uri('sqlite:///todo.db')) == 'sqlite+aiosqlite:///todo.db'
+    assert str(async_database_uri('postgresql://u@h/db')).startswith('postgresql+asyncpg://')
+    with pytest.raises(ValueError):
+        async_database_uri('oracle://u@h/db')
+
+
+def test_hash_pool_shares_the_cpus_between_workers(tmp_path):
+    config = type('AsgiWorkersConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'todo.db'}",
+        'PASSWORD_HASH_POOL_SIZE': None,
+        'ASGI_WORKERS': os.cpu_count() or 1,
+    })
+    app = create_app(config, asgi=True)
+    assert app.flask_app.extensions['password_hasher'].pool_size == 1
+    asyncio.run(app.engine.dispose())
+
+
+def test_auth(asgi_app):
+    async def scenario():
+        credentials = {'email': 'a@example.com', 'password': 'password123'}
+        assert (await call(asgi_app, 'POST', '/api/register', credentials))[0] == 201
+        assert (await call(asgi_app, 'POST', '/api/register', credentials))[0] == 409
+        status, _, body = await call(asgi_app, 'POST', '/api/register', {'email': 'bad', 'password': 'password123'})
+        assert status == 400 and body['errors'] == {'email': ['Not a valid email address.']}
+
+        status, _, body = await call(asgi_app, 'POST', '/api/login', credentials)
+        assert status == 200 and 'access_token' in body
+        status, _, _ = await call(asgi_app, 'POST', '/api/login', dict(credentials, password='wrong'))
+        assert status == 401
+
+        assert (await call(asgi_app, 'GET', '/api/todos'))[0] == 401
+        assert (await call(asgi_app, 'GET', '/api/todos', headers={'Authorization': 'Bearer nope'}))[0] == 422
+
+        # Logout is served by Flask; the ASGI handlers honour the revocation
+        headers = {'Authorization': f"Bearer {body['access_token']}"}
+        assert (await call(asgi_app, 'GET', '/api/todos', headers=headers))[0] == 200
+        assert (await call(asgi_app, 'POST', '/api/logout', headers=headers))[0] == 200
+        assert (await call(asgi_app, 'GET', '/api/todos', headers=headers))[0] == 401
+
+    asyncio.run(scenario())
+
+
+def test_todo_crud(asgi_app):
+    async def scenario():
+        headers = await login(asgi_app)
+
+        status, _, todo = await call(asgi_app, 'POST', '/api/todos', {'title': 'Async', 'priority': 'high'}, headers)
+        assert status == 201 and todo['title'] == 'Async'
+        assert (await call(asgi_app, 'POST', '/api/todos', {}, headers))[0] == 400
+        _, _, changes = await call(asgi_app, 'GET', '/api/todos/changes', headers=headers)
+        since = changes['next_since']
+
+        status, _, body = await call(asgi_app, 'GET', f"/api/todos/{todo['id']}", headers=headers)
+        assert status == 200 and body == todo
+
+        status, _, body = await call(asgi_app, 'PUT', f"/api/todos/{todo['id']}", {'completed': True}, headers)
+        assert status == 200 and body['completed'] is True
+        # Validated before the lookup, as in the Flask view
+        assert (await call(asgi_app, 'PUT', '/api/todos/999999', {'priority': 'urgent'}, headers))[0] == 400
+
+        status, _, body = await call(asgi_app, 'GET', '/api/todos', headers=headers)
+        assert status == 200 and [t['id'] for t in body] == [todo['id']]
+
+        assert (await call(asgi_app, 'DELETE', f"/api/todos/{todo['id']}", headers=headers))[0] == 204
+        assert (await call(asgi_app, 'GET', f"/api/todos/{todo['id']}", headers=headers))[0] == 404
+
+        # Writes on the async path feed the (Flask) changes endpoint too
+        _, _, changes = await call(asgi_app, 'GET', '/api/todos/changes', headers=headers, query=f'since={since}')
+        assert changes['items'] == [] and changes['deleted'] == [todo['id']]
+
+        other = await login(asgi_app, 'other@example.com')
+        _, _, todo = await call(asgi_app, 'POST', '/api/todos', {'title': 'Mine'}, headers)
+        assert (await call(asgi_app, 'DELETE', f"/api/todos/{todo['id']}", headers=other))[0] == 404
+
+    asyncio.run(scenario())
+
+
+def test_list_matches_flask(asgi_app):
+    async def scenario():
+        headers = await login(asgi_app)
+        for i in range(5):
+            await call(asgi_app, 'POST', '/api/todos', {'title': f'Todo {i}', 'due_date': f'2025-01-0{i + 1}T00:00:00'}, headers)
+
+        query = 'sort=-due_date&limit=2'
+        status, response_headers, page = await call(asgi_app, 'GET', '/api/todos', headers=headers, query=query)
+        assert status == 200 and response_headers['x-cache'] == 'MISS'
+        assert response_headers['x-total-count'] == '5'
+        assert [t['title'] for t in page['items']] == ['Todo 4', 'Todo 3']
+
+        _, cached_headers, cached = await call(asgi_app, 'GET', '/api/todos', headers=headers, query=query)
+        assert cached_headers['x-cache'] == 'HIT' and cached == page
+
+        status, _, _ = await call(asgi_app, 'GET', '/api/todos', query=query,
+                                  headers=dict(headers, **{'If-None-Match': response_headers['etag']}))
+        assert status == 304
+        return headers, query, page, response_headers['etag']
+
+    headers, query, page, etag = asyncio.run(scenario())
+
+    # The Flask handler sees the same data and agrees on the ETag
+    with asgi_app.flask_app.test_client() as client:
+        response = client.get(f'/api/todos?{query}', headers=headers)
+        assert response.get_json() == page
+        assert response.headers['ETag'] == etag
+        assert response.headers['X-Total-Count'] == '5'
+        assert client.get('/api/todos/stats', headers=headers).get_json()['total'] == 5
+
+
+def test_list_compressed(asgi_app):
+    async def scenario():
+        headers = await login(asgi_app)
+        for i in range(20):
+            await call(asgi_app, 'POST', '/api/todos', {'title': f'Todo {i}'}, headers)
+
+        _, plain_headers, plain = await call(asgi_app, 'GET', '/api/todos', headers=headers)
+        status, response_headers, page = await call(asgi_app, 'GET', '/api/todos',
+                                                    headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+        assert status == 200 and response_headers['content-encoding'] == 'gzip' and page == plain
+        assert int(response_headers['content-length']) < int(plain_headers['content-length'])
+        assert response_headers['etag'] == f"W/{plain_headers['etag']}"
+        status, _, _ = await call(asgi_app, 'GET', '/api/todos',
+                                  headers=dict(headers, **{'If-None-Match': response_headers['etag']}))
+        assert status == 304
+
+        _, small_headers, _ = await call(asgi_app, 'GET', f"/api/todos/{page[0]['id']}",
+                                         headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+        assert 'content-encoding' not in small_headers
+
+    asyncio.run(scenario())
+
+
+def test_other_routes_fall_back_to_flask(asgi_app):
+    async def scenario():
+        headers = await login(asgi_app)
+        status, _, body = await call(asgi_app, 'POST', '/api/todos/batch',
+                                     {'operations': [{'op': 'create', 'data': {'title': 'One'}},
+                                                     {'op': 'create', 'data': {'title': 'Two'}}]}, headers)
+        assert status == 200 and [r['status'] for r in body['results']] == [201, 201]
+
+        status, response_headers, body = await call(asgi_app, 'GET', '/api/todos', headers=headers, query='stream=true')
+        assert status == 200 and [t['title'] for t in body] == ['One', 'Two']
+
+    asyncio.run(scenario())
+
+
+def test_rate_limits(asgi_app):
+    asgi_app.rate_limiter.limits = parse_rate_limits({'auth.login': 'ip:2/minute', 'todos.create_todo': 'user:1/minute'})
+
+    async def scenario():
+        headers = await login(asgi_app)
+        assert (await call(asgi_app, 'POST', '/api/todos', {'title': 'One'}, headers))[0] == 201
+        status, response_headers, body = await call(asgi_app, 'POST', '/api/todos', {'title': 'Two'}, headers)
+        assert status == 429 and body['error'].startswith('Too many requests')
+        assert int(response_headers['retry-after']) >= 1
+
+        credentials = {'email': 'asgi@example.com', 'password': 'password123'}
+        assert (await call(asgi_app, 'POST', '/api/login', credentials))[0] == 200
+        assert (await call(asgi_app, 'POST', '/api/login', credentials))[0] == 429
+
+    asyncio.run(scenario())
+
+
+def test_writes_keep_passthrough_reads_on_the_primary(tmp_path):
+    import time
+    config = type('AsgiReplicaConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'SQLALCHEMY_REPLICA_URIS': [f"sqlite:///{tmp_path / 'replica.db'}"],
+        'REPLICA_STICKY_SECONDS': 30,
+    })
+    app = create_app(config, asgi=True)
+    create_schema(app.flask_app)
+    router = app.flask_app.extensions['replicas']
+
+    async def scenario():
+        headers = await login(app)
+        app.flask_app.test_cli_runner().invoke(args=['sync-replicas'])
+        assert (await call(app, 'POST', '/api/todos', {'title': 'Fresh'}, headers))[0] == 201
+        assert (await call(app, 'GET', '/api/todos/stats', headers=headers))[2]['total'] == 1
+
+        # Past the sticky window the replica, not yet synced, answers
+        router.clock = lambda: time.monotonic() + 60
+        assert (await call(app, 'GET', '/api/todos/stats', headers=headers))[2]['total'] == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        asyncio.run(app.engine.dispose())
+        with app.flask_app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
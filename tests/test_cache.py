@@ -0,0 +1,66 @@
+import pytest
+from app.utils.cache import InMemoryRedis, LocalCache, RedisCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestLocalCache:
+    def test_lru_eviction(self, clock):
+        cache = LocalCache(max_entries=2, ttl=60, clock=clock)
+        cache.set(1, 'a', b'A')
+        cache.set(1, 'b', b'B')
+        cache.get(1, 'a')
+        cache.set(2, 'c', b'C')
+
+        assert cache.get(1, 'b') is None
+        assert cache.get(1, 'a') == b'A'
+        assert cache.get(2, 'c') == b'C'
+
+    def test_ttl(self, clock):
+        cache = LocalCache(ttl=10, clock=clock)
+        cache.set(1, 'a', b'A')
+        clock.now = 9
+        assert cache.get(1, 'a') == b'A'
+        clock.now = 10
+        assert cache.get(1, 'a') is None
+        assert cache.stats()['entries'] == 0
+
+    def test_invalidate_only_touches_one_user(self, clock):
+        cache = LocalCache(clock=clock)
+        cache.set(1, 'a', b'A')
+        cache.set(1, 'b', b'B')
+        cache.set(2, 'a', b'other')
+
+        cache.invalidate(1)
+
+        assert cache.get(1, 'a') is None
+        assert cache.get(1, 'b') is None
+        assert cache.get(2, 'a') == b'other'
+        assert cache.stats() == {'backend': 'local', 'hits': 1, 'misses': 2, 'entries': 1}
+
+
+class TestRedisCache:
+    def test_roundtrip_invalidate_and_expiry(self, clock):
+        cache = RedisCache(InMemoryRedis(clock=clock), ttl=10)
+        cache.set(1, 'a', b'A')
+        cache.set(2, 'a', b'other')
+
+        assert cache.get(1, 'a') == b'A'
+        cache.invalidate(1)
+        assert cache.get(1, 'a') is None
+        assert cache.get(2, 'a') == b'other'
+
+        clock.now = 10
+        assert cache.get(2, 'a') is None
+        assert cache.stats() == {'backend': 'redis', 'hits': 2, 'misses': 2}
@@ -0,0 +1,93 @@
+import threading
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+from app.utils.db_setup import create_schema
+from app.utils.engine import engine_options, resolve_profile
+from config import Config
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    config = type('FileConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'todo.db'}",
+    })
+    app = create_app(config)
+    create_schema(app)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def login(client, email):
+    credentials = {'email': email, 'password': 'password123'}
+    client.post('/api/register', json=credentials)
+    token = client.post('/api/login', json=credentials).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_sqlite_pragmas_applied(file_app):
+    with file_app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        assert db.session.execute(text('PRAGMA cache_size')).scalar() == -64 * 1024
+
+
+def test_parallel_writers_and_readers(file_app):
+    headers = [login(file_app.test_client(), f'user{i}@example.com') for i in range(4)]
+    writes_per_thread = 15
+    failures = []
+
+    def writer(user_headers):
+        client = file_app.test_client()
+        for i in range(writes_per_thread):
+            response = client.post('/api/todos', json={'title': f'Todo {i}'}, headers=user_headers)
+            if response.status_code != 201:
+                failures.append(('create', response.status_code, response.get_data(as_text=True)))
+                continue
+            todo_id = response.get_json()['id']
+            response = client.put(f'/api/todos/{todo_id}', json={'completed': True}, headers=user_headers)
+            if response.status_code != 200:
+                failures.append(('update', response.status_code, response.get_data(as_text=True)))
+
+    def reader(user_headers):
+        client = file_app.test_client()
+        for _ in range(writes_per_thread * 2):
+            response = client.get('/api/todos', headers=user_headers)
+            if response.status_code != 200:
+                failures.append(('read', response.status_code, response.get_data(as_text=True)))
+
+    threads = [threading.Thread(target=writer, args=(h,)) for h in headers]
+    threads += [threading.Thread(target=reader, args=(h,)) for h in headers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    client = file_app.test_client()
+    for user_headers in headers:
+        todos = client.get('/api/todos', headers=user_headers).get_json()
+        assert len(todos) == writes_per_thread
+        assert all(todo['completed'] for todo in todos)
+
+
+def test_server_profile_pool_options():
+    config = {
+        'SQLALCHEMY_DATABASE_URI': 'postgresql://user:secret@db/todos',
+        'DB_PROFILE': 'auto',
+        'DB_POOL_SIZE': 20,
+        'DB_POOL_RECYCLE': 600,
+    }
+    profile = resolve_profile(config)
+    options = engine_options(config, profile)
+
+    assert profile == 'server'
+    assert options['pool_size'] == 20
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is True
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app import db
+from app.models.todo import Todo
+from app.models.user import User
+from app.routes.todos import _create_todo
+from app.utils.group_commit import GroupCommitWriter
+
+
+class TestGroupCommit:
+    def test_concurrent_writes_share_commits(self, make_app):
+        app = make_app(WRITE_QUEUE_ENABLED=True, WRITE_QUEUE_MAX_WAIT_MS=20)
+        client = app.test_client()
+        credentials = {'email': 'test@example.com', 'password': 'password123'}
+        client.post('/api/register', json=credentials)
+        headers = {'Authorization': f"Bearer {client.post('/api/login', json=credentials).get_json()['access_token']}"}
+
+        def create(i):
+            return app.test_client().post('/api/todos', json={'title': f'Todo {i}', 'priority': 'high'}, headers=headers)
+
+        with ThreadPoolExecutor(8) as pool:
+            responses = list(pool.map(create, range(40)))
+            missing = pool.submit(lambda: app.test_client().put('/api/todos/999', json={'completed': True}, headers=headers))
+        assert [response.status_code for response in responses] == [201] * 40
+        assert len({response.get_json()['id'] for response in responses}) == 40
+        assert missing.result().status_code == 404
+
+        writer = app.extensions['group_commit']
+        assert writer.writes == 41 and writer.batches < writer.writes
+        stats = client.get('/api/todos/stats', headers=headers).get_json()
+        assert stats['total'] == 40 and stats['by_priority']['high'] == 40
+
+        todo_id = responses[0].get_json()['id']
+        assert client.put(f'/api/todos/{todo_id}', json={'completed': True}, headers=headers).get_json()['completed'] is True
+        assert client.delete(f'/api/todos/{todo_id}', headers=headers).status_code == 204
+        assert client.get(f'/api/todos/{todo_id}', headers=headers).status_code == 404
+
+    def test_failed_write_rolls_back_alone(self, make_app):
+        app = make_app(WRITE_QUEUE_ENABLED=True)
+        with app.app_context():
+            db.session.add(User(email='test@example.com', password_hash='x'))
+            db.session.commit()
+        data = {'title': 'Kept', 'description': '', 'completed': False, 'due_date': None, 'priority': 'low'}
+
+        def create_then_fail():
+            _create_todo(1, dict(data, title='Rolled back'))
+            raise ValueError('nope')
+
+        writer = GroupCommitWriter(app, max_wait=0.5)
+        failing = writer.submit(create_then_fail)
+        kept = writer.submit(_create_todo, 1, data)
+        assert kept.result(timeout=5)['title'] == 'Kept'
+        with pytest.raises(ValueError, match='nope'):
+            failing.result()
+        assert writer.batches == 1
+        with app.app_context():
+            assert [todo.title for todo in Todo.query.all()] == ['Kept']
+            assert db.session.get(User, 1).todo_count == 1
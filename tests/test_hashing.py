@@ -0,0 +1,66 @@
+import time
+import pytest
+from flask import Flask
+from app.utils.hashing import HasherBusy, PasswordHasher, hash_cost
+
+
+def make_hasher(**config):
+    app = Flask(__name__)
+    app.config.update(BCRYPT_LOG_ROUNDS=4, **config)
+    return PasswordHasher(app)
+
+
+def test_process_pool_hash_and_check():
+    hasher = make_hasher(PASSWORD_HASH_POOL_SIZE=1, PASSWORD_HASH_MAX_PENDING=1)
+    try:
+        password_hash = hasher.hash('password123')
+        assert hash_cost(password_hash) == 4
+        assert hasher.check(password_hash, 'password123')
+        assert not hasher.check(password_hash, 'wrong')
+    finally:
+        hasher.shutdown()
+
+
+def test_long_passwords_compare_on_first_72_bytes():
+    hasher = make_hasher()
+    password_hash = hasher.hash('x' * 100)
+    assert hasher.check(password_hash, 'x' * 72)
+
+
+def test_needs_rehash():
+    hasher = make_hasher()
+    password_hash = hasher.hash('password123')
+    assert not hasher.needs_rehash(password_hash)
+    hasher.rounds = 5
+    assert hasher.needs_rehash(password_hash)
+
+
+def test_saturated_pool_rejects_fast():
+    hasher = make_hasher(PASSWORD_HASH_POOL_SIZE=0, PASSWORD_HASH_MAX_PENDING=0)
+    hasher._slots.acquire()
+    with pytest.raises(HasherBusy):
+        hasher.hash('password123')
+
+
+def test_timed_out_hash_keeps_its_slot_until_done():
+    hasher = make_hasher(PASSWORD_HASH_POOL_SIZE=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_TIMEOUT=0.05)
+    hasher.rounds = 13
+    try:
+        for _ in range(2):
+            with pytest.raises(HasherBusy):
+                hasher.hash('password123')
+        # Both jobs are still in the pool, so there is no slot for a third
+        assert not hasher._slots.acquire(blocking=False)
+
+        hasher.rounds = 4
+        hasher.timeout = None
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                assert hash_cost(hasher.hash('password123')) == 4
+                break
+            except HasherBusy:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+    finally:
+        hasher.shutdown()
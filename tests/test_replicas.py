@@ -0,0 +1,72 @@
+import os
+import time
+import pytest
+from app import db
+from app.utils.replicas import stamp_heartbeat
+
+
+@pytest.fixture
+def replicated_app(make_app, tmp_path):
+    """An app with two SQLite replicas, synced after registering a user;
+    returns the app, a client and that user's auth headers."""
+    def make(**overrides):
+        app = make_app(
+            SQLALCHEMY_REPLICA_URIS=[f"sqlite:///{tmp_path / 'replica0.db'}", f"sqlite:///{tmp_path / 'replica1.db'}"],
+            RESPONSE_CACHE_BACKEND='none',
+            **overrides,
+        )
+        client = app.test_client()
+        credentials = {'email': 'test@example.com', 'password': 'password123'}
+        client.post('/api/register', json=credentials)
+        headers = {'Authorization': f"Bearer {client.post('/api/login', json=credentials).get_json()['access_token']}"}
+        assert 'Copied the primary to 2 replica(s)' in app.test_cli_runner().invoke(args=['sync-replicas']).output
+        return app, client, headers
+    return make
+
+
+class TestReplicas:
+    def titles(self, client, headers):
+        return [todo['title'] for todo in client.get('/api/todos', headers=headers).get_json()]
+
+    def test_reads_go_to_replicas_except_after_own_writes(self, replicated_app):
+        app, client, headers = replicated_app(REPLICA_STICKY_SECONDS=30)
+        router = app.extensions['replicas']
+        client.post('/api/todos', json={'title': 'Fresh'}, headers=headers)
+        assert self.titles(client, headers) == ['Fresh']
+
+        # Past the sticky window the replicas, not yet synced, answer
+        router.clock = lambda: time.monotonic() + 60
+        assert self.titles(client, headers) == []
+        assert client.get('/api/todos/stats', headers=headers).get_json()['total'] == 0
+
+        app.test_cli_runner().invoke(args=['sync-replicas'])
+        assert self.titles(client, headers) == ['Fresh']
+        assert router.healthy == ['replica_0', 'replica_1']
+
+    def test_lagging_and_failing_replicas_leave_rotation(self, replicated_app, tmp_path):
+        app, client, headers = replicated_app(REPLICA_STICKY_SECONDS=0, REPLICA_CHECK_SECONDS=0)
+        router = app.extensions['replicas']
+        with app.app_context():
+            db.engines['replica_1'].dispose()
+        os.remove(tmp_path / 'replica1.db')
+        client.post('/api/todos', json={'title': 'Only on the primary'}, headers=headers)
+
+        assert self.titles(client, headers) == []
+        assert router.healthy == ['replica_0'] and router.lag['replica_1'] is None
+
+        with app.app_context():
+            stamp_heartbeat(time.time() + 60)
+        assert self.titles(client, headers) == ['Only on the primary']
+        assert router.healthy == [] and router.lag['replica_0'] > 50
+
+    def test_replica_failing_mid_request_falls_back_to_primary(self, replicated_app):
+        app, client, headers = replicated_app(REPLICA_STICKY_SECONDS=0, REPLICA_CHECK_SECONDS=3600)
+        client.post('/api/todos', json={'title': 'Kept'}, headers=headers)
+        app.test_cli_runner().invoke(args=['sync-replicas'])
+        with app.app_context():
+            for name in ('replica_0', 'replica_1'):
+                with db.engines[name].begin() as connection:
+                    connection.exec_driver_sql('DROP TABLE todo')
+
+        assert self.titles(client, headers) == ['Kept']
+        assert len(app.extensions['replicas'].healthy) == 1
@@ -0,0 +1,51 @@
+import os
+from sqlalchemy import text
+from app import create_app, db
+from app.utils.hashing import PasswordHasher, default_pool_size
+from app.utils.serve import serve_options, warm_worker
+from config import Config
+
+
+def test_sizing_from_cpu_count_and_io_ratio():
+    options = serve_options({'SERVE_IO_RATIO': 3}, cpu_count=4)
+    assert options['workers'] == 4
+    assert options['threads'] == 4
+    assert options['preload_app'] is True
+
+    # CPU-bound work needs no extra threads; explicit settings win
+    assert serve_options({'SERVE_IO_RATIO': 0}, cpu_count=4)['threads'] == 1
+    options = serve_options({'SERVE_WORKERS': 3, 'SERVE_THREADS': 16}, cpu_count=4)
+    assert (options['workers'], options['threads']) == (3, 16)
+
+
+def test_hash_pools_share_the_cpus_between_workers():
+    assert default_pool_size(workers=4, cpu_count=4) == 1
+    assert default_pool_size(workers=2, cpu_count=8) == 4
+    assert default_pool_size(workers=8, cpu_count=4) == 1
+
+    hasher = PasswordHasher()
+    app = create_app(type('AutoPoolConfig', (Config,), {'TESTING': True, 'PASSWORD_HASH_POOL_SIZE': None}))
+    hasher.init_app(app, workers=os.cpu_count() or 1)
+    assert hasher.pool_size == 1
+    app.config['PASSWORD_HASH_POOL_SIZE'] = 3
+    hasher.init_app(app, workers=64)
+    assert hasher.pool_size == 3
+
+
+def test_warm_worker_opens_a_fresh_pool(tmp_path):
+    config = type('FileConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'todo.db'}",
+    })
+    app = create_app(config)
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+        inherited = db.engine.pool
+
+        warm_worker(app, threads=3)
+
+        assert db.engine.pool is not inherited
+        assert db.engine.pool.checkedin() == 3
+        db.engine.dispose()
+
@@ -0,0 +1,149 @@
+import pytest
+from sqlalchemy import event, func, select
+from app import db
+from app.models.shard import UserDirectory
+from app.models.todo import Todo
+from app.models.user import User
+from app.utils.sharding import HashRing, NoShardSelected, using_shard
+
+
+@pytest.fixture
+def sharded_app(make_app, tmp_path):
+    """An app with a directory database and, by default, three shards, all
+    SQLite files in tmp_path."""
+    def make(shards=3, **overrides):
+        return make_app(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'directory.db'}",
+            SQLALCHEMY_SHARD_URIS=[f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(shards)],
+            RESPONSE_CACHE_BACKEND='none',
+            RATE_LIMIT_BACKEND='none',
+            **overrides,
+        )
+    return make
+
+
+def login(client, email):
+    credentials = {'email': email, 'password': 'password123'}
+    assert client.post('/api/register', json=credentials).status_code == 201
+    return {'Authorization': f"Bearer {client.post('/api/login', json=credentials).get_json()['access_token']}"}
+
+
+def shard_rows(app, name, statement):
+    with app.app_context():
+        with db.engines[name].connect() as connection:
+            return connection.exec_driver_sql(statement).all()
+
+
+class TestSharding:
+    def test_users_and_todos_live_on_their_shard(self, sharded_app):
+        app = sharded_app()
+        client = app.test_client()
+        router = app.extensions['shards']
+        users = {}
+        for i in range(8):
+            headers = login(client, f'user{i}@example.com')
+            for title in ('Groceries', f'Errand {i}'):
+                assert client.post('/api/todos', json={'title': title}, headers=headers).status_code == 201
+            batch = client.post('/api/todos/batch', json={'operations': [{'op': 'create', 'data': {'title': 'Batched'}},
+                                                                         {'op': 'create', 'data': {'title': 'Second'}}]},
+                                headers=headers)
+            assert [result['todo']['title'] for result in batch.get_json()['results']] == ['Batched', 'Second']
+            client.delete(f"/api/todos/{batch.get_json()['results'][1]['todo']['id']}", headers=headers)
+            users[i] = headers
+
+        assert client.post('/api/register', json={'email': 'user0@example.com', 'password': 'password123'}).status_code == 409
+        for i, headers in users.items():
+            assert [todo['title'] for todo in client.get('/api/todos?sort=created_at', headers=headers).get_json()] == \
+                ['Groceries', f'Errand {i}', 'Batched']
+            assert client.get('/api/todos/stats', headers=headers).get_json()['total'] == 3
+            assert [todo['title'] for todo in client.get('/api/todos/search?q=errand', headers=headers).get_json()['items']] == [f'Errand {i}']
+
+        placed = {}
+        todo_ids = []
+        for name in router.names:
+            user_ids = [row[0] for row in shard_rows(app, name, 'SELECT id FROM user')]
+            assert all(router.ring.lookup(user_id) == name for user_id in user_ids)
+            placed.update(dict.fromkeys(user_ids, name))
+            todo_ids += [row[0] for row in shard_rows(app, name, 'SELECT id FROM todo')]
+        assert len(placed) == 8 and len(set(placed.values())) > 1
+        assert len(todo_ids) == len(set(todo_ids)) == 24
+        assert shard_rows(app, router.names[0], "SELECT name FROM sqlite_master WHERE name = 'todo_fts'")
+
+    def test_move_user_between_shards(self, sharded_app, tmp_path):
+        app = sharded_app()
+        client = app.test_client()
+        headers = login(client, 'mover@example.com')
+        todo_id = client.post('/api/todos', json={'title': 'Moving day'}, headers=headers).get_json()['id']
+        client.delete(f"/api/todos/{client.post('/api/todos', json={'title': 'Gone'}, headers=headers).get_json()['id']}",
+                      headers=headers)
+        router = app.extensions['shards']
+        source = router.shard_for(1)
+        target = next(name for name in router.names if name != source)
+
+        result = app.test_cli_runner().invoke(args=['move-user', '1', target])
+        assert f'User 1 is on {target} (was {source})' in result.output
+        assert shard_rows(app, source, 'SELECT id FROM todo') == []
+        assert shard_rows(app, target, 'SELECT count(*) FROM todo_tombstone') == [(1,)]
+
+        # Interrupted before the source was cleaned up: a rerun finishes the job
+        with app.app_context():
+            with db.engines[source].begin() as connection:
+                connection.exec_driver_sql(f"ATTACH DATABASE '{tmp_path / f'shard{router.names.index(target)}.db'}' AS moved")
+                for table in ('user', 'todo'):
+                    connection.exec_driver_sql(f'INSERT INTO "{table}" SELECT * FROM moved."{table}"')
+        assert shard_rows(app, source, 'SELECT id FROM todo') == [(todo_id,)]
+        assert f'User 1 is on {target} (was {target})' in app.test_cli_runner().invoke(args=['move-user', '1', target]).output
+        assert shard_rows(app, source, 'SELECT id FROM todo') == []
+        assert shard_rows(app, target, 'SELECT id FROM todo') == [(todo_id,)]
+
+        # A freshly started app reads the placement from the directory
+        restarted = sharded_app().test_client()
+        assert [todo['id'] for todo in restarted.get('/api/todos', headers=headers).get_json()] == [todo_id]
+        assert restarted.get('/api/todos/search?q=moving', headers=headers).get_json()['items'][0]['id'] == todo_id
+        created = restarted.post('/api/todos', json={'title': 'Unpacked'}, headers=headers).get_json()['id']
+        assert created != todo_id and created % 1024 == router.names.index(target)
+        assert restarted.post('/api/login', json={'email': 'mover@example.com', 'password': 'password123'}).status_code == 200
+        assert 'Unknown shard' in app.test_cli_runner().invoke(args=['move-user', '1', 'shard_9']).output
+
+    def test_registration_retried_after_the_shard_commit_fails(self, sharded_app):
+        app = sharded_app()
+        client = app.test_client()
+        credentials = {'email': 'retry@example.com', 'password': 'password123'}
+
+        def fail(mapper, connection, target):
+            raise RuntimeError('shard unavailable')
+
+        event.listen(User, 'before_insert', fail)
+        try:
+            with pytest.raises(RuntimeError, match='shard unavailable'):
+                client.post('/api/register', json=credentials)
+        finally:
+            event.remove(User, 'before_insert', fail)
+        # The directory kept the email, but not its user
+        assert client.post('/api/login', json=credentials).status_code == 401
+
+        assert client.post('/api/register', json=credentials).status_code == 201
+        assert client.post('/api/login', json=credentials).status_code == 200
+        with app.app_context():
+            assert db.session.scalar(select(func.count()).select_from(UserDirectory)) == 1
+
+    def test_queries_without_a_user_are_refused(self, sharded_app):
+        app = sharded_app()
+        with app.app_context():
+            with pytest.raises(NoShardSelected):
+                Todo.query.count()
+            with using_shard('shard_1'):
+                assert Todo.query.count() == 0
+        result = app.test_cli_runner().invoke(args=['reconcile-stats'])
+        assert '0 user(s) corrected' in result.output
+
+    def test_ring_moves_few_users_when_a_shard_is_added(self):
+        before = HashRing(['shard_0', 'shard_1', 'shard_2'])
+        after = HashRing(['shard_0', 'shard_1', 'shard_2', 'shard_3'])
+        moved = [user_id for user_id in range(10000) if before.lookup(user_id) != after.lookup(user_id)]
+        assert all(after.lookup(user_id) == 'shard_3' for user_id in moved)
+        assert 1500 < len(moved) < 3500
+
+    def test_unsupported_combinations(self, sharded_app):
+        with pytest.raises(ValueError, match='WRITE_QUEUE_ENABLED'):
+            sharded_app(WRITE_QUEUE_ENABLED=True)